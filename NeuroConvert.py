@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## NEUROCONVERT.py
+## ---------------------------------------------------------------- ##
+## Converts text recordings (EEG.csv and ES.csv logs, and the
+## tab-separated recordings of the GUI) to the binary format (*.eeg):
+##
+##     python NeuroConvert.py EEG.csv ES.csv session.txt
+##     python NeuroConvert.py -o converted -j 4 logs/*.csv
+##
+## Files are converted in parallel (one process per core, by default),
+## each in bounded memory.  Rows that do not match the header of their
+## file are skipped and reported.  Existing recordings are not
+## overwritten (unless --force is given), and files that would be
+## converted to the same recording are reported as errors.
+## ---------------------------------------------------------------- ##
+
+import argparse
+import glob
+import os
+import sys
+
+from core.convert import convert_files
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Converts text recordings (EEG.csv, ES.csv, GUI "
+                    "recordings) to the binary format (*.eeg)")
+    parser.add_argument("paths", nargs="+", metavar="PATH",
+                        help="Recordings to convert (wildcards are "
+                             "expanded)")
+    parser.add_argument("-o", "--output-dir", default=None, metavar="DIR",
+                        help="Directory of the converted recordings (by "
+                             "default, next to the originals)")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="Files converted in parallel (by default, "
+                             "one per core)")
+    parser.add_argument("--rate", type=float, default=128,
+                        help="Sampling rate of the recordings (Hz)")
+    parser.add_argument("--no-compression", action="store_true",
+                        help="Stores the blocks without compression")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="Overwrites the existing recordings")
+    parser.add_argument("--raw", action="store_true",
+                        help="Stores the samples as they are, neither "
+                             "encoded nor compressed (EEGArray maps raw "
+                             "recordings in memory)")
+    args = parser.parse_args(argv)
+
+    paths = []
+    for pattern in args.paths:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    if args.output_dir is not None and not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    status = 0
+    compression = None if args.no_compression or args.raw else "zlib"
+    quantization = None if args.raw else "auto"
+    for report in convert_files(paths, args.output_dir, args.processes,
+                                sampling_rate=args.rate,
+                                compression=compression,
+                                quantization=quantization,
+                                force=args.force):
+        if "error" in report:
+            print >>sys.stderr, report["error"]
+            status = 1
+            continue
+        line = "%s -> %s: %s, %d rows, %d -> %d bytes (%.1f s)" % (
+            report["path"], report["output"], report["format"],
+            report["rows"], report["bytes_read"], report["bytes_written"],
+            report["seconds"])
+        if report["skipped"]:
+            line += ", %d rows skipped" % report["skipped"]
+        print line
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## NEURORECORD.py
+## ---------------------------------------------------------------- ##
+## Headless recording of EEG, contact quality and EmoStates, for long
+## unattended sessions (no wx needed):
+##
+##     python NeuroRecord.py --duration 3600 --eeg session.eeg
+##     python NeuroRecord.py --duration 3600 --raw --eeg session.eeg
+##     python NeuroRecord.py --duration 3600 --tsv session.txt
+##     python NeuroRecord.py --eeg-csv EEG.csv --es-csv ES.csv
+##     python NeuroRecord.py --composer 127.0.0.1:1726 --tsv test.txt
+##     python NeuroRecord.py --replay EEG.csv ES.csv --tsv replay.txt
+##
+## The data of a single headset is recorded: the primary user (the
+## first one connected), or the one given with --user.
+##
+## Recording stops after the given duration, or on Ctrl-C / SIGTERM.
+## The files are synced to disk every few seconds (--sync): a recording
+## interrupted by a crash can be repaired with NeuroRecover.py.
+## ---------------------------------------------------------------- ##
+
+import argparse
+import os
+import signal
+import sys
+import threading
+import time
+
+from core.manager import EmotivManager
+from core.replay import ReplayEngine
+from core.sinks import Recorder, TSVSink, EEGCSVSink, EmoStateCSVSink, \
+     EEGFileSink
+import core.edk as edk
+
+
+def parse_address(text):
+    """Parses a HOST:PORT address"""
+    host, port = text.rsplit(":", 1)
+    return host, int(port)
+
+
+def create_sinks(args):
+    """Returns the sinks requested on the command line"""
+    sinks = []
+    options = {}
+    if args.raw:
+        options = {"compression" : None, "quantization" : None}
+    for path in args.eeg:
+        sinks.append(EEGFileSink(path, args.flush, background=True,
+                                 sync_interval=args.sync, **options))
+    for path in args.tsv:
+        sinks.append(TSVSink(path, args.flush, background=True,
+                             sync_interval=args.sync))
+    for path in args.eeg_csv:
+        sinks.append(EEGCSVSink(path, args.flush, background=True,
+                                sync_interval=args.sync))
+    for path in args.es_csv:
+        sinks.append(EmoStateCSVSink(path, args.flush, background=True,
+                                     sync_interval=args.sync))
+    if not sinks:
+        name = time.strftime("session-%Y%m%d-%H%M%S.eeg")
+        sinks.append(EEGFileSink(name, args.flush, background=True,
+                                 sync_interval=args.sync, **options))
+    return sinks
+
+
+def create_manager(args):
+    """Returns a manager for the headset, or for a recording"""
+    if args.replay:
+        es = args.replay[1] if len(args.replay) > 1 else None
+        engine = ReplayEngine.from_files(args.replay[0], es, loop=True)
+        return EmotivManager(engine)
+    if not os.path.exists(args.dll):
+        raise SystemExit("Cannot find the EDK library: %s" % args.dll)
+    return EmotivManager(edk.load_library(args.dll))
+
+
+def record(manager, sinks, duration=None, remote=None, user=None,
+           stop=None):
+    """Records with SINKS for DURATION seconds (or until STOP, an
+    Event, is set). Returns the recorder"""
+    if stop is None:
+        stop = threading.Event()
+    recorder = Recorder(manager, sinks, user=user)
+    with manager.session(remote):
+        recorder.start()
+        start = time.time()
+        while not stop.is_set():
+            if duration is None:
+                stop.wait(0.5)
+            else:
+                remaining = start + duration - time.time()
+                if remaining <= 0:
+                    break
+                stop.wait(min(remaining, 0.5))
+    recorder.stop()
+    return recorder
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Records EEG, contact quality and EmoStates")
+    parser.add_argument("-d", "--duration", type=float, default=None,
+                        help="Duration of the recording (s); by default, "
+                             "until interrupted")
+    parser.add_argument("--eeg", action="append", default=[],
+                        metavar="PATH",
+                        help="Records samples, quality and EmoStates in "
+                             "the binary format (*.eeg)")
+    parser.add_argument("--raw", action="store_true",
+                        help="Stores the samples of *.eeg recordings as "
+                             "they are, neither encoded nor compressed "
+                             "(EEGArray maps raw recordings in memory)")
+    parser.add_argument("--tsv", action="append", default=[],
+                        metavar="PATH",
+                        help="Records samples, quality and EmoStates "
+                             "(the format of the GUI recorder)")
+    parser.add_argument("--eeg-csv", action="append", default=[],
+                        metavar="PATH",
+                        help="Records the samples (EEGLoger.py format)")
+    parser.add_argument("--es-csv", action="append", default=[],
+                        metavar="PATH",
+                        help="Records the EmoStates (emoStateLoger.py "
+                             "format)")
+    parser.add_argument("--flush", type=float, default=1.0,
+                        metavar="SECONDS",
+                        help="Seconds of data buffered between writes")
+    parser.add_argument("--sync", type=float, default=5.0,
+                        metavar="SECONDS",
+                        help="Seconds between syncs of the files to disk "
+                             "(what a crash can lose at most)")
+    parser.add_argument("--user", type=int, default=None,
+                        help="Records this user (headset); by default, "
+                             "the primary user (the first one connected)")
+    parser.add_argument("--composer", type=parse_address, default=None,
+                        metavar="HOST:PORT",
+                        help="Connects to an EmoComposer (e.g., "
+                             "127.0.0.1:1726)")
+    parser.add_argument("--dll", default=".\\edk.dll",
+                        help="Path of the EDK library")
+    parser.add_argument("--replay", nargs="+", metavar="CSV",
+                        help="Replays a recording (EEG.csv [ES.csv]) "
+                             "instead of using a headset")
+    args = parser.parse_args(argv)
+
+    manager = create_manager(args)
+    sinks = create_sinks(args)
+
+    stop = threading.Event()
+    def on_signal(signum, frame):
+        stop.set()
+    signal.signal(signal.SIGINT, on_signal)
+    if hasattr(signal, "SIGTERM"):
+        signal.signal(signal.SIGTERM, on_signal)
+
+    print "Recording to %s" % ", ".join(s.path for s in sinks)
+    recorder = record(manager, sinks, args.duration, args.composer,
+                      args.user, stop)
+
+    print "%d samples recorded" % recorder.samples
+    for s in recorder.stats():
+        print "%s: %d bytes (%.1f kB/s), longest queue %d, %d syncs" % (
+            s["path"], s["bytes_written"], s["bytes_per_second"] / 1024.0,
+            s["max_pending"], s["syncs"])
+    for user_id, acq in manager.users.items():
+        if acq.gaps is not None and acq.gaps.lost_samples:
+            print "User %d: %d samples lost in %d gaps" % (
+                user_id, acq.gaps.lost_samples, acq.gaps.gap_count)
+
+
+if __name__ == "__main__":
+    main()
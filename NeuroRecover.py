@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## NEURORECOVER.py
+## ---------------------------------------------------------------- ##
+## Checks and repairs recordings (*.eeg) that were not closed properly,
+## after a crash of the recorder (or of the computer):
+##
+##     python NeuroRecover.py --check session.eeg
+##     python NeuroRecover.py session.eeg
+##     python NeuroRecover.py session.eeg -o session-fixed.eeg
+##
+## The blocks of the file are checked (CRC-32) up to the first one that
+## is incomplete or corrupted, which is discarded with everything that
+## follows it, and the index of the valid blocks is written at the end
+## of the file.  The last valid sample is reported.
+## ---------------------------------------------------------------- ##
+
+import argparse
+import sys
+
+from core.eegfile import recover_eeg_file, EEGFileError
+
+
+def describe(report):
+    """Returns a description of the REPORT of recover_eeg_file()"""
+    lines = ["%s: %s, %d blocks, %d samples" % (
+        report["path"], report["state"], report["blocks"],
+        report["samples"])]
+    if report["last_sample"] is not None:
+        line = "  Last valid sample: #%d, at %.3f s" % (
+            report["last_sample"], report["last_time"])
+        if report["last_timestamp"] is not None:
+            line += " (TIMESTAMP %.3f)" % report["last_timestamp"]
+        lines.append(line)
+    if report["discarded_bytes"]:
+        lines.append("  %d bytes after the last valid block %s" % (
+            report["discarded_bytes"],
+            "would be discarded" if report["state"] == "checked"
+            else "discarded"))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Checks recordings (*.eeg), and rebuilds the index "
+                    "of those that were not closed properly")
+    parser.add_argument("paths", nargs="+", metavar="PATH",
+                        help="Recordings to check")
+    parser.add_argument("-c", "--check", action="store_true",
+                        help="Only reports the state of the files")
+    parser.add_argument("-o", "--output", default=None, metavar="PATH",
+                        help="Writes the recovered recording to a new "
+                             "file (only with a single recording)")
+    args = parser.parse_args(argv)
+    if args.output is not None and len(args.paths) > 1:
+        parser.error("--output needs a single recording")
+
+    status = 0
+    for path in args.paths:
+        try:
+            report = recover_eeg_file(path, args.output, args.check)
+        except (EEGFileError, IOError) as e:
+            print >>sys.stderr, e
+            status = 1
+            continue
+        print describe(report)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
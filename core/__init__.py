@@ -1,3 +1,8 @@
 #!/usr/bin/env python
 
-__all__ = ["manager", "variables", "ccdl"]
\ No newline at end of file
+__all__ = ["manager", "variables", "ccdl", "buffers", "dispatch",
+           "backend", "replay", "benchmark", "acquisition",
+           "streaming", "emostate", "alignment",
+           "stats", "edk", "gaps", "shared",
+           "server", "sinks", "eegfile",
+           "writer", "eegarray", "codec", "convert"]
\ No newline at end of file
@@ -0,0 +1,353 @@
+## ---------------------------------------------------------------- ##
+## ACQUISITION.py
+## ---------------------------------------------------------------- ##
+## Per-user EEG acquisition. The EmoEngine can serve several headsets
+## (users) at once; each of them gets its own data handle, buffers and
+## (optionally) worker thread, so that the processing of one user's
+## data does not delay the others.
+## ---------------------------------------------------------------- ##
+
+from threading import Thread, RLock, current_thread
+from ctypes import *
+import collections
+import time
+import numpy as np
+import ccdl
+import variables
+from buffers import RingBuffer, RecordBuffer
+from emostate import EMOSTATE_DTYPE, empty_emostate
+from stats import clock, SIZE_EDGES
+from gaps import GapDetector
+from shared import SharedHistory
+
+__all__ = ["UserAcquisition", "new_quality_array", "QUALITY_DTYPE"]
+
+# EmoStates whose offsets are kept for the median clock offset
+OFFSET_WINDOW = 64
+
+# Latest blocks of samples mapping the host clock to the EEG clock
+PULL_WINDOW = 16
+
+# A change of contact quality, at a given EmoState time
+QUALITY_DTYPE = np.dtype([("time", np.double),
+                          ("quality", np.int8,
+                           (variables.CONTACT_QUALITY_CHANNELS,))])
+
+
+def new_quality_array():
+    """Returns an array for the contact quality of every input channel
+    (indexed by sensor ID), with all the qualities still unknown"""
+    quality = np.empty(variables.CONTACT_QUALITY_CHANNELS, dtype=np.int8)
+    quality.fill(variables.EEG_CQ_UNKNOWN)
+    return quality
+
+
+class UserAcquisition(object):
+    """Acquires the EEG data of a single user (headset)"""
+    def __init__(self, manager, user_id, sampling_rate=None):
+        self.manager = manager
+        self.user_id = user_id
+        self.edk = manager.edk
+        self.channels = manager.channels
+
+        if not sampling_rate:
+            sampling_rate = manager.sampling_rate
+        self.sampling_rate = sampling_rate
+
+        self.hData = self.edk.EE_DataCreate()
+        self.nSamples = c_uint(0)
+        self.nSamplesTaken = pointer(self.nSamples)
+
+        self.acquiring = False
+        self.tick_overruns = 0       # Ticks that exceeded the interval
+        self._worker = None
+
+        # Latest values received for this user
+        self.sensor_data = np.zeros((0, len(self.channels)),
+                                    order="C", dtype=np.double)
+        self.sensor_quality = new_quality_array()
+        self.state_data = empty_emostate()
+
+        self.shared = None           # See publish()
+
+        # Held while the histories are written, and while they are
+        # replaced (by publish(), unpublish() or a new history length),
+        # so that no block is written to a history being replaced
+        self.history_lock = RLock()
+        self.allocate_sample_buffer()
+        self.allocate_sensor_history()
+        self.state_history = RecordBuffer(manager.state_history_size,
+                                          EMOSTATE_DTYPE)
+        self.quality_history = RecordBuffer(manager.state_history_size,
+                                            QUALITY_DTYPE)
+
+        # Offset between the EEG clock (the TIMESTAMP channel) and the
+        # EmoState clock: the (host time, last TIMESTAMP) of the latest
+        # blocks, and the offsets of the latest EmoStates
+        if variables.ED_TIMESTAMP in self.channels:
+            self._timestamp_column = list(self.channels).index(
+                variables.ED_TIMESTAMP)
+        else:
+            self._timestamp_column = None
+        self._pulls = collections.deque(maxlen=PULL_WINDOW)
+        self._offsets = collections.deque(maxlen=OFFSET_WINDOW)
+
+        # Samples lost on the way, detected from the packet counter
+        if variables.ED_COUNTER in self.channels:
+            self.gaps = GapDetector(list(self.channels).index(
+                variables.ED_COUNTER))
+        else:
+            self.gaps = None
+
+    def allocate_sample_buffer(self, n_samples=None):
+        """Allocates the (samples x channels) extraction buffer.
+        By default, the buffer is large enough to hold the whole
+        EDK data buffer (buffer seconds times the sampling rate)"""
+        if n_samples is None:
+            n_samples = int(np.ceil(self.manager.buffer_seconds *
+                                    self.sampling_rate))
+
+        # The buffer is allocated in column-major order, so that every
+        # channel is a contiguous segment that the EDK can fill with a
+        # single call.
+        C = len(self.channels)
+        self._sample_buffer = np.zeros((n_samples, C), order="F",
+                                       dtype=np.double)
+
+        # Column views are contiguous and are handed directly to
+        # EE_DataGet; creating them once spares the slicing in the loop.
+        self._channel_buffers = [self._sample_buffer[:, c] for c in range(C)]
+
+    def allocate_sensor_history(self):
+        """Allocates the ring buffer holding the last history_length
+        seconds of samples"""
+        capacity = int(np.ceil(self.manager.history_length *
+                               self.sampling_rate))
+        with self.history_lock:
+            self.sensor_history = RingBuffer(capacity, len(self.channels))
+            if self.shared is not None:
+                self.publish(self.shared.path)
+
+    @property
+    def clock_offset(self):
+        """The time of the EEG clock (the TIMESTAMP channel) when the
+        EmoState clock is zero (the median over the latest EmoStates),
+        or None if it is still unknown"""
+        offsets = list(self._offsets)
+        if not offsets:
+            return None
+        return float(np.median(offsets))
+
+    def observe_samples(self, block):
+        """Records the host time at which BLOCK was pulled, with the
+        TIMESTAMP of its last sample"""
+        if self._timestamp_column is None or not len(block):
+            return
+        last = block[-1, self._timestamp_column]
+        if self._pulls and last < self._pulls[-1][1]:
+            # The EEG clock started over (new session, or a replay
+            # looping): the previous estimates no longer apply
+            self._pulls.clear()
+            self._offsets.clear()
+        self._pulls.append((time.time(), last))
+
+    def eeg_time(self, host_time):
+        """The time of the EEG clock at a given HOST_TIME, extrapolated
+        from the latest blocks, or None if no block was pulled yet"""
+        pulls = list(self._pulls)
+        if not pulls:
+            return None
+
+        # The rate of the EEG clock against the host clock (1, unless
+        # the samples are replayed faster or slower)
+        (h0, t0), (h1, t1) = pulls[0], pulls[-1]
+        if h1 > h0 and t1 > t0:
+            rate = (t1 - t0) / (h1 - h0)
+        else:
+            rate = 1.0
+
+        # A block is pulled some time after its last sample, so every
+        # block gives a lower bound: the least delayed one is kept
+        return max(t + rate * (host_time - h) for h, t in pulls)
+
+    def observe_emostate_time(self, state_time):
+        """Refines the clock offset with the time of an EmoState that
+        has just arrived, matched with the EEG time at its arrival"""
+        eeg_time = self.eeg_time(time.time())
+        if eeg_time is not None:
+            self._offsets.append(eeg_time - state_time)
+
+    # --------------------------------------------------------------- #
+    # Shared memory
+    # --------------------------------------------------------------- #
+
+    def publish(self, path):
+        """Moves the sample and EmoState histories into a shared memory
+        file at PATH (see shared.py), where other processes can read
+        them. The samples already in the histories are kept"""
+        with self.history_lock:
+            shared = SharedHistory.create(path, self.sensor_history.capacity,
+                                          self.channels, self.sampling_rate,
+                                          self.state_history.capacity)
+            shared.samples.write(self.sensor_history.latest(
+                self.sensor_history.capacity))
+            shared.states.write(self.state_history.latest(
+                self.state_history.capacity))
+            previous = self.shared
+            self.sensor_history = shared.samples
+            self.state_history = shared.states
+            self.shared = shared
+        if previous is not None:
+            previous.close(remove=previous.path != path)
+
+    def unpublish(self):
+        """Moves the histories back into private memory, and removes the
+        shared memory file"""
+        with self.history_lock:
+            shared = self.shared
+            if shared is None:
+                return
+            self.shared = None
+            history = RingBuffer(shared.samples.capacity, len(self.channels))
+            history.write(shared.samples.latest(history.capacity))
+            states = RecordBuffer(shared.states.capacity, EMOSTATE_DTYPE)
+            states.write(shared.states.latest(states.capacity))
+            self.sensor_history = history
+            self.state_history = states
+        shared.close(remove=True)
+
+    # --------------------------------------------------------------- #
+    # Acquisition
+    # --------------------------------------------------------------- #
+
+    def enable(self):
+        """Enables the acquisition of data for this user"""
+        self.edk.EE_DataAcquisitionEnable(self.user_id, True)
+        self.acquiring = True
+        if self.gaps is not None:
+            self.gaps.reset()
+
+    def store_sensor_data(self):
+        """Collects the new data and passes it to the listeners"""
+
+        instrumentation = self.manager.instrumentation
+        instrumented = instrumentation.enabled
+        if instrumented:
+            start = clock()
+
+        # Updates the data array
+        self.edk.EE_DataUpdateHandle(self.user_id, self.hData)
+        self.edk.EE_DataGetNumberOfSample(self.hData, self.nSamplesTaken)
+        N = self.nSamplesTaken[0]
+
+        if N != 0:   # Only if we have collected > 0 samples
+            if N > self._sample_buffer.shape[0]:
+                # More samples than expected (e.g., a higher sampling
+                # rate): grows the buffer.
+                self.allocate_sample_buffer(N)
+
+            # One call per channel, each writing N samples directly
+            # into the corresponding column of the buffer.
+            DataGet = self.edk.EE_DataGet
+            hData = self.hData
+            for channel, column in zip(self.channels, self._channel_buffers):
+                DataGet(hData, channel, column, N)
+
+            # Checks the counter for lost samples (filling the gaps, if
+            # the manager asks for it)
+            block = self._sample_buffer[:N]
+            if self.gaps is not None:
+                block, positions, lost = self.gaps.process(
+                    block, self.manager.gap_fill)
+            else:
+                positions = ()
+
+            # Appends the data to the history, and passes a view of the
+            # new block to the listeners.
+            with self.history_lock:
+                self.sensor_history.write(block)
+                self.sensor_data = self.sensor_history.latest(
+                    block.shape[0])
+            self.observe_samples(block)
+
+            if instrumented:
+                instrumentation.record("extraction", clock() - start)
+                instrumentation.record("block_samples", N, SIZE_EDGES)
+            self.manager.execute_event_functions(ccdl.SAMPLING_EVENT,
+                                                 self.sensor_data,
+                                                 user=self.user_id)
+            if len(positions):
+                self.report_gaps(positions, lost)
+
+    def report_gaps(self, positions, lost):
+        """Passes the gaps found in the last block to the listeners of
+        SAMPLE_GAP_EVENT (and to the instrumentation)"""
+        instrumentation = self.manager.instrumentation
+        if instrumentation.enabled:
+            instrumentation.count("sample_gaps", len(positions))
+            instrumentation.count("lost_samples", int(lost.sum()))
+            for n in lost:
+                instrumentation.record("gap_samples", n, SIZE_EDGES)
+
+        gaps = {"positions" : positions,   # In the block, before filling
+                "lost" : lost,
+                "filled" : self.manager.gap_fill,
+                "lost_samples" : self.gaps.lost_samples,
+                "received" : self.gaps.received}
+        self.manager.execute_event_functions(ccdl.SAMPLE_GAP_EVENT, gaps,
+                                             user=self.user_id)
+
+    # --------------------------------------------------------------- #
+    # Worker thread
+    # --------------------------------------------------------------- #
+
+    @property
+    def running(self):
+        """Whether the worker thread is running"""
+        return self._worker is not None
+
+    def start(self):
+        """Starts a worker thread that collects data at every
+        monitor interval"""
+        if self._worker is None:
+            self._worker = Thread(target=self.run)
+            self._worker.daemon = True
+            self._worker.start()
+
+    def stop(self):
+        """Stops the worker thread (if any), waiting for it to finish"""
+        worker = self._worker
+        self._worker = None
+        if worker is not None and worker is not current_thread():
+            worker.join()
+
+    def run(self):
+        """Collects data until stopped, sleeping only for what is left
+        of every tick"""
+        worker = self._worker
+        deadline = time.time()
+
+        while self._worker is worker and self.acquiring:
+            deadline += self.manager.monitor_interval
+            self.store_sensor_data()
+
+            remaining = deadline - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                self.tick_overruns += 1
+                if self.manager.instrumentation.enabled:
+                    self.manager.instrumentation.count("user_tick_overruns")
+                deadline = time.time()
+
+        if self._worker is worker:
+            self._worker = None
+
+    def free(self):
+        """Stops acquiring and frees the data handle"""
+        self.stop()
+        self.acquiring = False
+        if self.shared is not None:
+            self.shared.close(remove=True)
+            self.shared = None
+        self.edk.EE_DataFree(self.hData)
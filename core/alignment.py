@@ -0,0 +1,101 @@
+## ---------------------------------------------------------------- ##
+## ALIGNMENT.py
+## ---------------------------------------------------------------- ##
+## Time-based alignment of the three streams of a headset: the EEG
+## samples (time-stamped by the TIMESTAMP channel), the contact
+## quality and the EmoStates (time-stamped by ES_GetTimeFromStart).
+##
+## Every sample is matched with the last quality change and the last
+## EmoState at or before its time (an "as-of" join), one block at a
+## time.  The two clocks have different origins: EmoState times are
+## converted to the EEG clock with an offset, either given or
+## estimated by the manager (see UserAcquisition.clock_offset).
+## ---------------------------------------------------------------- ##
+
+import numpy as np
+import variables
+from acquisition import QUALITY_DTYPE, new_quality_array
+from emostate import EMOSTATE_DTYPE, empty_emostate
+
+__all__ = ["asof_indices", "asof_join", "StreamAligner"]
+
+
+def asof_indices(keys, times, tolerance=None):
+    """Returns, for every value in TIMES, the index of the last value
+    of KEYS (sorted) that is not greater than it.  The index is -1 if
+    there is no such value, or if it is older than TOLERANCE"""
+    index = np.searchsorted(keys, times, side="right") - 1
+    if tolerance is not None and len(keys) > 0:
+        stale = times - keys[np.maximum(index, 0)] > tolerance
+        index[stale] = -1
+    return index
+
+
+def asof_join(times, records, time_field="time", tolerance=None,
+              default=None):
+    """Returns an array with the record of RECORDS (a structured array
+    sorted by TIME_FIELD) in effect at every time in TIMES.  Times that
+    have no record are given the DEFAULT record (by default, zeros)"""
+    times = np.asarray(times, dtype=np.double)
+    result = np.zeros(len(times), dtype=records.dtype)
+    if len(records) > 0:
+        index = asof_indices(records[time_field], times, tolerance)
+        records.take(np.maximum(index, 0), out=result)
+        missing = index < 0
+    else:
+        missing = np.ones(len(times), dtype=bool)
+
+    if default is not None and missing.any():
+        result[missing] = default
+    return result
+
+
+class StreamAligner(object):
+    """Aligns the blocks of EEG samples of a user (by default, of the
+    primary user) with the contact quality and EmoState histories
+    kept by the manager.
+
+    TOLERANCE is the maximum age (in seconds) of the EmoState matched
+    with a sample: older EmoStates are replaced by empty ones.  Quality
+    is only recorded when it changes, so it never gets too old.
+    OFFSET is the time of the EEG clock when the EmoState clock is zero;
+    if None, the manager's estimate is used."""
+    def __init__(self, manager, user=None, tolerance=None, offset=None):
+        self.manager = manager
+        self.user = user
+        self.tolerance = tolerance
+        self.offset = offset
+        self.column = list(manager.channels).index(variables.ED_TIMESTAMP)
+
+        self._unknown_quality = np.zeros(1, dtype=QUALITY_DTYPE)[0]
+        self._unknown_quality["quality"] = new_quality_array()
+        self._empty_state = empty_emostate()
+
+    def eeg_times(self, block):
+        """Returns the times of the samples of BLOCK, on the EmoState
+        clock"""
+        acq = self.manager.get_user(self.user)
+        offset = self.offset
+        if offset is None and acq is not None:
+            offset = acq.clock_offset
+        return block[:, self.column] - (offset or 0.0)
+
+    def align(self, block):
+        """Returns a tuple (quality, states) with the contact quality
+        (a samples x channels array) and the EmoState record in effect
+        at every sample of BLOCK"""
+        acq = self.manager.get_user(self.user)
+        if acq is None:
+            times = np.zeros(block.shape[0])
+            qualities = np.zeros(0, dtype=QUALITY_DTYPE)
+            states = np.zeros(0, dtype=EMOSTATE_DTYPE)
+        else:
+            times = self.eeg_times(block)
+            qualities = acq.quality_history.latest(
+                acq.quality_history.capacity)
+            states = acq.state_history.latest(acq.state_history.capacity)
+
+        quality = asof_join(times, qualities, default=self._unknown_quality)
+        states = asof_join(times, states, tolerance=self.tolerance,
+                           default=self._empty_state)
+        return quality["quality"], states
@@ -0,0 +1,197 @@
+## ---------------------------------------------------------------- ##
+## BACKEND.py
+## ---------------------------------------------------------------- ##
+## The interface of the objects that can stand in for the EDK library
+## (edk.dll).  An EmotivManager only uses the functions listed here,
+## always with the same signatures as the C library: output values are
+## written through ctypes pointers, and sample buffers are contiguous
+## arrays of doubles.
+## ---------------------------------------------------------------- ##
+
+import variables
+
+__all__ = ["EmoEngineBackend", "EventHandle", "StateHandle", "DataHandle"]
+
+
+class EmoEngineBackend(object):
+    """Base class for pure-Python replacements of the EDK library.
+    Subclasses must implement the engine, event and data functions;
+    handle creation and destruction are provided here."""
+
+    # --------------------------------------------------------------- #
+    # Handles
+    # --------------------------------------------------------------- #
+
+    def EE_EmoEngineEventCreate(self):
+        return EventHandle()
+
+    def EE_EmoEngineEventFree(self, hEvent):
+        pass
+
+    def EE_EmoStateCreate(self):
+        return StateHandle()
+
+    def EE_EmoStateFree(self, hState):
+        pass
+
+    def EE_DataCreate(self):
+        return DataHandle()
+
+    def EE_DataFree(self, hData):
+        pass
+
+    # --------------------------------------------------------------- #
+    # Engine and events
+    # --------------------------------------------------------------- #
+
+    def EE_EngineConnect(self, device="Emotiv Systems-5"):
+        raise NotImplementedError
+
+    def EE_EngineRemoteConnect(self, host, port):
+        raise NotImplementedError
+
+    def EE_EngineDisconnect(self):
+        raise NotImplementedError
+
+    def EE_EngineGetNextEvent(self, hEvent):
+        raise NotImplementedError
+
+    def EE_EmoEngineEventGetType(self, hEvent):
+        return hEvent.type
+
+    def EE_EmoEngineEventGetUserId(self, hEvent, pUserIdOut):
+        pUserIdOut[0] = hEvent.user
+        return variables.EDK_OK
+
+    def EE_EmoEngineEventGetEmoState(self, hEvent, hEmoState):
+        hEmoState.user = hEvent.user
+        hEmoState.values = hEvent.values
+        return variables.EDK_OK
+
+    # --------------------------------------------------------------- #
+    # Data acquisition
+    # --------------------------------------------------------------- #
+
+    def EE_DataSetBufferSizeInSec(self, bufferSizeInSec):
+        raise NotImplementedError
+
+    def EE_DataAcquisitionEnable(self, userId, enable):
+        raise NotImplementedError
+
+    def EE_DataUpdateHandle(self, userId, hData):
+        raise NotImplementedError
+
+    def EE_DataGetNumberOfSample(self, hData, nSampleOut):
+        nSampleOut[0] = hData.n_samples
+        return variables.EDK_OK
+
+    def EE_DataGet(self, hData, channel, buffer, bufferSizeInSample):
+        raise NotImplementedError
+
+    def EE_DataGetSamplingRate(self, userId, samplingRateOut):
+        raise NotImplementedError
+
+    # --------------------------------------------------------------- #
+    # EmoState
+    # --------------------------------------------------------------- #
+
+    def ES_GetTimeFromStart(self, state):
+        raise NotImplementedError
+
+    def ES_GetHeadsetOn(self, state):
+        raise NotImplementedError
+
+    def ES_GetNumContactQualityChannels(self, state):
+        raise NotImplementedError
+
+    def ES_GetContactQuality(self, state, electroIdx):
+        raise NotImplementedError
+
+    def ES_GetContactQualityFromAllChannels(self, state, contactQuality,
+                                            numChannels):
+        n = min(numChannels, self.ES_GetNumContactQualityChannels(state))
+        for i in range(n):
+            contactQuality[i] = self.ES_GetContactQuality(state, i)
+        return n
+
+    def ES_GetWirelessSignalStatus(self, state):
+        raise NotImplementedError
+
+    def ES_GetBatteryChargeLevel(self, state, chargeLevel, maxChargeLevel):
+        raise NotImplementedError
+
+    def ES_ExpressivIsBlink(self, state):
+        raise NotImplementedError
+
+    def ES_ExpressivIsLeftWink(self, state):
+        raise NotImplementedError
+
+    def ES_ExpressivIsRightWink(self, state):
+        raise NotImplementedError
+
+    def ES_ExpressivIsEyesOpen(self, state):
+        raise NotImplementedError
+
+    def ES_ExpressivIsLookingLeft(self, state):
+        raise NotImplementedError
+
+    def ES_ExpressivIsLookingRight(self, state):
+        raise NotImplementedError
+
+    def ES_ExpressivGetEyelidState(self, state, leftEye, rightEye):
+        raise NotImplementedError
+
+    def ES_ExpressivGetUpperFaceAction(self, state):
+        raise NotImplementedError
+
+    def ES_ExpressivGetUpperFaceActionPower(self, state):
+        raise NotImplementedError
+
+    def ES_ExpressivGetLowerFaceAction(self, state):
+        raise NotImplementedError
+
+    def ES_ExpressivGetLowerFaceActionPower(self, state):
+        raise NotImplementedError
+
+    def ES_AffectivGetExcitementShortTermScore(self, state):
+        raise NotImplementedError
+
+    def ES_AffectivGetExcitementLongTermScore(self, state):
+        raise NotImplementedError
+
+    def ES_AffectivGetEngagementBoredomScore(self, state):
+        raise NotImplementedError
+
+    def ES_AffectivGetMeditationScore(self, state):
+        raise NotImplementedError
+
+    def ES_AffectivGetFrustrationScore(self, state):
+        raise NotImplementedError
+
+    def ES_CognitivGetCurrentAction(self, state):
+        raise NotImplementedError
+
+    def ES_CognitivGetCurrentActionPower(self, state):
+        raise NotImplementedError
+
+
+class EventHandle(object):
+    """The Python counterpart of an EmoEngineEventHandle"""
+    def __init__(self):
+        self.type = 0
+        self.user = 0
+        self.values = None
+
+
+class StateHandle(object):
+    """The Python counterpart of an EmoStateHandle"""
+    def __init__(self):
+        self.user = 0
+        self.values = None
+
+
+class DataHandle(object):
+    """The Python counterpart of a DataHandle"""
+    def __init__(self):
+        self.n_samples = 0
+        self.data = None
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## BENCHMARK.py
+## ---------------------------------------------------------------- ##
+## Measures how much data the acquisition pipeline (monitor ->
+## store_sensor_data -> SAMPLING_EVENT listeners) can sustain, running
+## headless against a simulated engine (replay.ReplayEngine).
+##
+## Usage (from the NeuroTrain folder):
+##
+##     python -m core.benchmark --rates 128 512 --listeners 1 8
+##
+## Every combination of the given parameters is run, and the results
+## are written as JSON (on stdout, or on the file given with -o).
+## ---------------------------------------------------------------- ##
+
+import argparse
+import itertools
+import json
+import platform
+import sys
+import time
+import numpy as np
+import ccdl
+from manager import EmotivManager
+from replay import ReplayEngine
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+__all__ = ["BenchmarkListener", "run_benchmark", "run_suite"]
+
+FORMAT_VERSION = 1
+PERCENTILES = (50, 90, 99, 100)
+
+
+def max_rss():
+    """The peak memory used by the process so far, in kilobytes (or
+    None if it cannot be measured on this platform)"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss /= 1024    # Bytes on OS X
+    return rss
+
+
+def synthetic_eeg(n_samples, n_channels):
+    """Generates a simulated recording. The first column holds the
+    absolute index of every sample, which is used to compute latencies;
+    the other columns contain noise around a typical EEG baseline"""
+    data = np.random.normal(4200.0, 50.0, (n_samples, n_channels))
+    data[:, 0] = np.arange(n_samples)
+    return data
+
+
+class BenchmarkListener(object):
+    """A SAMPLING_EVENT listener that measures the latency of every
+    block (the time between the acquisition of its last sample by the
+    simulated headset and the call of the listener)"""
+    def __init__(self, start, sampling_rate, speed, cost=0.0):
+        self.start = start
+        self.period = 1.0 / (sampling_rate * speed)
+        self.cost = cost
+        self.latencies = []
+        self.samples = 0
+
+    def receive(self, data):
+        """Records the latency of a block"""
+        now = time.time()
+        n = data.shape[0]
+        if n > 0:
+            produced = self.start + (data[-1, 0] + 1) * self.period
+            self.latencies.append(now - produced)
+            self.samples += n
+        if self.cost > 0:
+            time.sleep(self.cost)
+
+
+def run_benchmark(sampling_rate=128, n_channels=22, interval=0.065,
+                  n_listeners=1, duration=10.0, speed=1.0,
+                  listener_cost=0.0, policy=None, stats=False,
+                  listener_channels=None):
+    """Runs the pipeline for DURATION seconds (wall-clock), and returns
+    a dictionary with the results (including the manager's stage
+    timings, if STATS is True). If LISTENER_CHANNELS is given, the
+    listeners only receive those channels (the first one must be
+    channel 0, which numbers the samples)"""
+    n_samples = int(duration * sampling_rate * speed) + sampling_rate
+    channels = tuple(range(n_channels))
+    engine = ReplayEngine(synthetic_eeg(n_samples, n_channels),
+                          sampling_rate=sampling_rate, speed=speed,
+                          channels=channels)
+
+    manager = EmotivManager(engine, channels=channels)
+    manager.sampling_rate = sampling_rate
+    manager.monitor_interval = interval
+    manager.enable_stats(stats)
+
+    rss_before = max_rss()
+    manager.connect()
+    start = engine.start_time
+
+    listeners = [BenchmarkListener(start, sampling_rate, speed,
+                                   listener_cost)
+                 for i in range(n_listeners)]
+    for l in listeners:
+        manager.add_listener(ccdl.SAMPLING_EVENT, l.receive, policy=policy,
+                             channels=listener_channels)
+
+    blocks = []
+    manager.add_listener(ccdl.SAMPLING_EVENT,
+                         lambda data: blocks.append(data.shape[0]))
+    manager.monitoring = True
+    time.sleep(duration)
+    manager.monitoring = False
+    manager._monitor.join()
+    manager.stop_listeners()
+    elapsed = time.time() - start
+    manager.disconnect()
+    rss_after = max_rss()
+
+    latencies = np.array([x for l in listeners for x in l.latencies])
+    if latencies.size == 0:
+        latencies = np.zeros(1)
+    delivered = sum(blocks)
+    offered = int(elapsed * sampling_rate * speed)
+
+    result = {"sampling_rate" : sampling_rate,
+              "channels" : n_channels,
+              "monitor_interval" : interval,
+              "listeners" : n_listeners,
+              "listener_cost" : listener_cost,
+              "listener_channels" : listener_channels,
+              "policy" : policy,
+              "speed" : speed,
+              "duration" : elapsed,
+              "samples_offered" : offered,
+              "samples_delivered" : delivered,
+              "samples_lost" : engine.lost_samples,
+              "throughput" : delivered / elapsed,
+              "blocks" : len(blocks),
+              "mean_block_size" : float(np.mean(blocks)) if blocks else 0.0,
+              "tick_overruns" : manager.tick_overruns + sum(
+                  acq.tick_overruns for acq in manager.users.values()),
+              "max_events_drained" : manager.max_events_drained,
+              "latency" : dict(("p%d" % p, float(np.percentile(latencies, p)))
+                               for p in PERCENTILES),
+              "max_rss_kb" : rss_after,
+              "rss_growth_kb" : (rss_after - rss_before
+                                 if rss_after is not None else None)}
+    if stats:
+        result["stats"] = manager.stats()["histograms"]
+    return result
+
+
+def run_suite(rates=(128,), channels=(22,), intervals=(0.065,),
+              listeners=(1,), **kwargs):
+    """Runs a benchmark for every combination of the parameters"""
+    results = []
+    for rate, n_channels, interval, n_listeners in itertools.product(
+            rates, channels, intervals, listeners):
+        results.append(run_benchmark(rate, n_channels, interval,
+                                     n_listeners, **kwargs))
+
+    return {"version" : FORMAT_VERSION,
+            "time" : time.time(),
+            "python" : platform.python_version(),
+            "platform" : platform.platform(),
+            "numpy" : np.__version__,
+            "results" : results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the EEG acquisition pipeline")
+    parser.add_argument("--rates", type=int, nargs="+", default=[128],
+                        help="Sampling rates (Hz)")
+    parser.add_argument("--channels", type=int, nargs="+", default=[22],
+                        help="Number of channels")
+    parser.add_argument("--intervals", type=float, nargs="+",
+                        default=[0.065], help="Monitor intervals (s)")
+    parser.add_argument("--listeners", type=int, nargs="+", default=[1],
+                        help="Number of SAMPLING_EVENT listeners")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Duration of every run (s)")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Speed of the simulated headset")
+    parser.add_argument("--listener-cost", type=float, default=0.0,
+                        help="Time spent by every listener per block (s)")
+    parser.add_argument("--listener-channels", type=int, nargs="+",
+                        default=None,
+                        help="Channels received by every listener "
+                             "(default: all; the first must be 0)")
+    parser.add_argument("--policy", default=None,
+                        help="Overflow policy of the listeners "
+                             "(default: synchronous)")
+    parser.add_argument("--stats", action="store_true",
+                        help="Include the timings of the pipeline stages")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    report = run_suite(args.rates, args.channels, args.intervals,
+                       args.listeners, duration=args.duration,
+                       speed=args.speed, listener_cost=args.listener_cost,
+                       policy=args.policy, stats=args.stats,
+                       listener_channels=args.listener_channels)
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        f = open(args.output, "w")
+        try:
+            json.dump(report, f, indent=2, sort_keys=True)
+        finally:
+            f.close()
+
+
+if __name__ == "__main__":
+    main()
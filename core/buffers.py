@@ -0,0 +1,198 @@
+## ---------------------------------------------------------------- ##
+## BUFFERS.py
+## ---------------------------------------------------------------- ##
+## Fixed-capacity buffers shared between the monitor thread (which
+## writes the samples) and the consumers (panels, recorders,
+## analyzers) that read them.
+## ---------------------------------------------------------------- ##
+
+import numpy as np
+
+__all__ = ["RingBuffer", "RingReader", "RecordBuffer"]
+
+
+class RingBuffer(object):
+    """A fixed-capacity ring buffer of (samples x channels) data,
+    written by a single producer and read by any number of consumers.
+
+    Consumers keep their own read cursor (the total number of samples
+    written when they last read) and use read_since() to get all the
+    samples that arrived after it.  No locks are used: the producer
+    copies the data first and publishes the new write count afterwards.
+
+    Every sample is stored twice (at position i and i + capacity), so
+    that any window of up to 'capacity' samples is a contiguous region
+    and can be returned as a view, without copying.  Views remain valid
+    until the producer wraps around the buffer; consumers that need to
+    keep the data longer should copy it.
+    """
+    def __init__(self, capacity, channels, dtype=np.double):
+        self._capacity = int(capacity)
+        self._channels = int(channels)
+        self._data = np.zeros((2 * self._capacity, self._channels),
+                              order="C", dtype=dtype)
+        self._written = 0     # Total number of samples ever written
+        self.overruns = 0     # Samples lost by consumers that fell behind
+
+    @property
+    def capacity(self):
+        """The maximum number of samples held in the buffer"""
+        return self._capacity
+
+    @property
+    def channels(self):
+        """The number of channels (columns) of every sample"""
+        return self._channels
+
+    @property
+    def written(self):
+        """The total number of samples written so far. This is also
+        the cursor of a consumer that is up to date"""
+        return self._written
+
+    def __len__(self):
+        """The number of samples currently available"""
+        return min(self._written, self._capacity)
+
+    def clear(self):
+        """Forgets all the samples"""
+        self._written = 0
+        self.overruns = 0
+
+    def write(self, block):
+        """Appends a (samples x channels) block of data"""
+        n = block.shape[0]
+        cap = self._capacity
+        if n > cap:
+            # Only the most recent samples fit in the buffer
+            self._write_segment(block[n - cap:], (self._written + n - cap) % cap)
+        elif n > 0:
+            self._write_segment(block, self._written % cap)
+
+        # Publishes the new samples only after they have been copied
+        self._written += n
+
+    def _write_segment(self, block, start):
+        """Writes at most 'capacity' samples, starting at position START,
+        into both halves of the internal array"""
+        data = self._data
+        cap = self._capacity
+        n = block.shape[0]
+        first = min(n, cap - start)
+
+        data[start:start + first] = block[:first]
+        data[start + cap:start + cap + first] = block[:first]
+        if first < n:
+            # The block wraps around the end of the buffer
+            data[:n - first] = block[first:]
+            data[cap:cap + n - first] = block[first:]
+
+    def read_since(self, cursor):
+        """Returns a tuple (data, cursor), where DATA is a view of all
+        the samples written after CURSOR, and CURSOR is the new cursor
+        to use for the next read.  If the consumer fell behind by more
+        than the buffer capacity, the oldest samples are lost and are
+        counted in self.overruns"""
+        written = self._written
+        oldest = written - self._capacity
+        if cursor < oldest:
+            self.overruns += oldest - cursor
+            cursor = oldest
+
+        start = cursor % self._capacity
+        return self._data[start:start + written - cursor], written
+
+    def latest(self, n):
+        """Returns a view of the most recent N samples (or of all the
+        available samples, if there are fewer than N)"""
+        written = self._written
+        n = min(n, written, self._capacity)
+        start = (written - n) % self._capacity
+        return self._data[start:start + n]
+
+    def reader(self, from_start=False, columns=None):
+        """Returns a new reader, positioned at the current end of the
+        buffer (or at the oldest available sample, if FROM_START), that
+        reads the given COLUMNS (indices; by default, all of them)"""
+        if from_start:
+            cursor = max(0, self._written - self._capacity)
+        else:
+            cursor = self._written
+        return RingReader(self, cursor, columns)
+
+
+class RecordBuffer(RingBuffer):
+    """A ring buffer of records (the rows of a structured array), such
+    as EmoStates. One of the fields (TIME_FIELD) is a time stamp that
+    never decreases, and is used to query the records by time"""
+    def __init__(self, capacity, dtype, time_field="time"):
+        self._capacity = int(capacity)
+        self._data = np.zeros(2 * self._capacity, dtype=dtype)
+        self._channels = len(self._data.dtype.names)
+        self._written = 0
+        self.overruns = 0
+        self.time_field = time_field
+
+    @property
+    def dtype(self):
+        """The dtype of the records"""
+        return self._data.dtype
+
+    def append(self, record):
+        """Appends a single record (a tuple of field values, or a record
+        of the same dtype)"""
+        cap = self._capacity
+        i = self._written % cap
+        self._data[i] = record
+        self._data[i + cap] = record
+        self._written += 1
+
+    def last(self):
+        """Returns a copy of the most recent record (or None)"""
+        if self._written == 0:
+            return None
+        return self._data[(self._written - 1) % self._capacity].copy()
+
+    def between(self, start, end):
+        """Returns a view of the available records whose time is within
+        [START, END)"""
+        records = self.latest(self._capacity)
+        i, j = np.searchsorted(records[self.time_field], (start, end))
+        return records[i:j]
+
+
+class RingReader(object):
+    """A consumer of a RingBuffer, with its own read cursor. If COLUMNS
+    (a sequence of indices) is given, only those columns are returned:
+    as a view if they are consecutive, or else as a copy"""
+    def __init__(self, buffer, cursor=0, columns=None):
+        self.buffer = buffer
+        self.cursor = cursor
+        self.overruns = 0    # Samples this reader has lost
+        if columns is not None:
+            columns = list(columns)
+            if columns == range(columns[0], columns[-1] + 1):
+                columns = slice(columns[0], columns[-1] + 1)
+        self.columns = columns
+
+    def _select(self, data):
+        if self.columns is None:
+            return data
+        return data[:, self.columns]
+
+    @property
+    def pending(self):
+        """The number of samples not yet read"""
+        return self.buffer.written - self.cursor
+
+    def read(self):
+        """Returns a view of all the samples written since the last read"""
+        data, cursor = self.buffer.read_since(self.cursor)
+        self.overruns += cursor - self.cursor - data.shape[0]
+        self.cursor = cursor
+        return self._select(data)
+
+    def latest(self, n):
+        """Returns the most recent N samples (or all the available
+        samples, if there are fewer), whether read or not"""
+        return self._select(self.buffer.latest(n))
@@ -7,11 +7,17 @@ SENSOR_EVENT = 1006
 SENSOR_QUALITY_EVENT = 1007
 HEADSET_FOUND_EVENT = 1008
 EMOSTATE_EVENT = 1009
+MONITOR_TICK_EVENT = 1010  # Argument: number of engine events drained
+SAMPLE_GAP_EVENT = 1011    # Argument: dictionary describing the gaps
 
 EVENTS = (USER_EVENT, SAMPLING_EVENT, CONNECTION_EVENT,
           MONITORING_EVENT, PROPERTIES_EVENT, SENSOR_EVENT,
           SENSOR_QUALITY_EVENT, HEADSET_FOUND_EVENT,
-          EMOSTATE_EVENT)
+          EMOSTATE_EVENT, MONITOR_TICK_EVENT, SAMPLE_GAP_EVENT)
+
+# A listener's user that stands for the primary user, whichever headset
+# it is (see EmotivManager.add_listener)
+PRIMARY_USER = -1
 
 
 class EventError(Exception):
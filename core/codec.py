@@ -0,0 +1,163 @@
+## ---------------------------------------------------------------- ##
+## CODEC.py
+## ---------------------------------------------------------------- ##
+## Lossless storage of quantized samples.  The values of most channels
+## lie on a fixed grid: the EEG channels on the steps of the ADC
+## (4191.79487179 is 8174 x 20/39 uV), the counter and the gyroscopes
+## on integers, the time stamps on milliseconds.  A Quantizer describes
+## the grid of a channel:
+##
+##     value = round(offset + n * step, decimals)
+##
+## (DECIMALS, if given, reproduces values that were written as text
+## with a limited number of digits, as in EEG.csv), and a column of
+## samples is stored as the first n (int64) followed by the differences
+## between consecutive n's (int16), which also compress much better
+## than the floating-point values.
+##
+## Encoding is always checked: a column is only stored as differences
+## if every value decodes back to the very same bits (in the dtype of
+## the recording), and otherwise it is stored as it is.
+## ---------------------------------------------------------------- ##
+
+import struct
+from fractions import Fraction
+import numpy as np
+
+__all__ = ["Quantizer", "detect_quantizer", "encode_columns",
+           "decode_columns"]
+
+# Kinds of columns
+RAW_COLUMN = 0
+DELTA16_COLUMN = 1
+
+COLUMN_HEADER = struct.Struct("<Bq")      # kind, first n
+
+# Decimals tried when looking for the rounding of a channel
+MAX_DECIMALS = 15
+
+
+class Quantizer(object):
+    """The grid of a channel: value = round(OFFSET + n * STEP, DECIMALS)
+    (without rounding if DECIMALS is None)"""
+    def __init__(self, step, offset=0.0, decimals=None):
+        self.step = float(step)
+        self.offset = float(offset)
+        self.decimals = decimals
+
+    def __repr__(self):
+        return "Quantizer(%r, %r, %r)" % (self.step, self.offset,
+                                          self.decimals)
+
+    def quantize(self, values):
+        """Returns the n's closest to VALUES (an int64 array)"""
+        return np.rint((values - self.offset) / self.step).astype(np.int64)
+
+    def decode(self, n):
+        """Returns the values of the n's (float64)"""
+        values = self.offset + n * self.step
+        if self.decimals is not None:
+            values = np.round(values, self.decimals)
+        return values
+
+    def encode(self, values):
+        """Returns the n's of VALUES, or None if some of the values are
+        not exactly on the grid (in the dtype of VALUES)"""
+        if not np.isfinite(values).all():
+            return None
+        n = self.quantize(values)
+        if not (self.decode(n).astype(values.dtype) == values).all():
+            return None
+        return n
+
+    def to_list(self):
+        """Returns a list (for the header of a recording)"""
+        return [self.step, self.offset, self.decimals]
+
+    @classmethod
+    def from_list(cls, values):
+        step, offset, decimals = values
+        return cls(step, offset, decimals)
+
+
+def snap(x, max_denominator=1000):
+    """Returns the simple fraction closest to X, if it is very close"""
+    f = float(Fraction(x).limit_denominator(max_denominator))
+    if abs(f - x) <= 1e-6 * abs(x):
+        return f
+    return x
+
+
+def detect_step(values, max_divisor=10):
+    """Returns the step of the grid of VALUES (the largest value that
+    divides all the differences between them), or None"""
+    u = np.unique(values)
+    if len(u) < 2:
+        return 1.0
+    d = np.diff(u)
+    smallest = d.min()
+    for k in xrange(1, max_divisor + 1):
+        step = smallest / k
+        ratios = d / step
+        if (np.abs(ratios - np.rint(ratios)) < 1e-3).all():
+            return snap(step)
+    return None
+
+
+def detect_quantizer(values):
+    """Returns a Quantizer for VALUES (a column of samples) that
+    reproduces every value exactly, or None"""
+    if len(values) == 0 or not np.isfinite(values).all():
+        return None
+    step = detect_step(values)
+    if step is None or step <= 0:
+        return None
+    for offset in (0.0, float(values.min())):
+        for decimals in [None] + range(MAX_DECIMALS + 1):
+            quantizer = Quantizer(step, offset, decimals)
+            if quantizer.encode(values) is not None:
+                return quantizer
+    return None
+
+
+def encode_columns(data, dtype, quantizers):
+    """Returns the columns of DATA (samples x channels), encoded with
+    the QUANTIZERS (one per column, None for the columns that are
+    stored as they are, as DTYPE)"""
+    parts = []
+    for column, quantizer in enumerate(quantizers):
+        values = np.asarray(data[:, column], dtype=dtype)
+        n = quantizer.encode(values) if quantizer is not None else None
+        if n is not None:
+            deltas = np.diff(n)
+            if len(deltas) == 0 or (np.abs(deltas) <= 32767).all():
+                parts.append(COLUMN_HEADER.pack(DELTA16_COLUMN, n[0]))
+                parts.append(deltas.astype("<i2").tostring())
+                continue
+        parts.append(COLUMN_HEADER.pack(RAW_COLUMN, 0))
+        parts.append(values.tostring())
+    return "".join(parts)
+
+
+def decode_columns(payload, N, dtype, quantizers, offset=0):
+    """Decodes the columns encoded by encode_columns() from PAYLOAD
+    (starting at OFFSET). Returns a tuple (samples x channels array,
+    offset of the end of the columns)"""
+    data = np.empty((N, len(quantizers)), dtype=dtype)
+    for column, quantizer in enumerate(quantizers):
+        kind, first = COLUMN_HEADER.unpack_from(payload, offset)
+        offset += COLUMN_HEADER.size
+        if kind == DELTA16_COLUMN:
+            deltas = np.frombuffer(payload, "<i2", N - 1, offset)
+            offset += 2 * (N - 1)
+            n = np.empty(N, dtype=np.int64)
+            n[0] = first
+            np.cumsum(deltas, out=n[1:])
+            n[1:] += first
+            data[:, column] = quantizer.decode(n)
+        elif kind == RAW_COLUMN:
+            data[:, column] = np.frombuffer(payload, dtype, N, offset)
+            offset += N * dtype.itemsize
+        else:
+            raise ValueError("Unknown column kind %d" % kind)
+    return data, offset
@@ -0,0 +1,345 @@
+## ---------------------------------------------------------------- ##
+## CONVERT.py
+## ---------------------------------------------------------------- ##
+## Conversion of the text recordings to the binary format (*.eeg):
+##
+##     EEG.csv     the samples logged by EEGLoger.py (a header with a
+##                 Python list of channel names, then ' , '-separated
+##                 values with trailing separators and blank lines)
+##     ES.csv      the EmoStates logged by emoStateLoger.py (same
+##                 layout, with the columns in replay.ES_COLUMNS)
+##     *.txt       the tab-separated recordings of the GUI (and of
+##                 sinks.TSVSink): samples, contact quality and EmoState
+##
+## Files are read a chunk of text at a time, and every chunk is parsed
+## with a single numpy conversion of all its values, so that memory use
+## does not depend on the size of the file.  Rows whose width does not
+## match the header (e.g., a row cut at the end of the file) are skipped
+## and counted; the channels of the header must be EDK channels (see
+## variables.CHANNELS).  convert_files() converts several files in
+## parallel, one per process.
+## ---------------------------------------------------------------- ##
+
+import ast
+import multiprocessing
+import os
+import time
+import numpy as np
+import variables
+from eegfile import EEGFileWriter
+from emostate import EMOSTATE_DTYPE
+from replay import ES_COLUMNS, UPPER_FACE, LOWER_FACE, ES_TIME, \
+     ES_USER, ES_SIGNAL, ES_BLINK, ES_LEFT_WINK, ES_RIGHT_WINK, \
+     ES_LOOK_LEFT, ES_LOOK_RIGHT, ES_SHORT_TERM_EXCITEMENT, \
+     ES_LONG_TERM_EXCITEMENT, ES_ENGAGEMENT, ES_COGNITIV_ACTION, \
+     ES_COGNITIV_POWER
+from sinks import TSV_EMOSTATE_FIELDS, TSV_EMOSTATE_LABELS
+
+__all__ = ["ConversionError", "detect_format", "read_rows",
+           "emostates_from_log", "output_path", "convert_file",
+           "convert_files", "FORMATS"]
+
+## The formats that can be converted
+
+EEG_CSV = "eeg-csv"
+ES_CSV = "es-csv"
+TSV = "tsv"
+FORMATS = (EEG_CSV, ES_CSV, TSV)
+
+# Separators of the values of a row, and characters trailing the rows
+SEPARATORS = {EEG_CSV : ",", ES_CSV : ",", TSV : "\t"}
+TRAILING = {EEG_CSV : " ,\r", ES_CSV : " ,\r", TSV : "\r"}
+
+# Nominal rate of the EmoStates (the time of every block of EmoStates
+# is the time of its first EmoState)
+EMOSTATE_RATE = 4
+
+# EmoStates per block, for the EmoState logs
+EMOSTATE_BLOCK_SIZE = 256
+
+CHUNK_SIZE = 1 << 20      # Bytes of text parsed at a time
+
+
+class ConversionError(Exception):
+    """A specific error when a file cannot be converted"""
+    def __init__(self, path, reason):
+        self.path = path
+        self.reason = reason
+
+    def __str__(self):
+        return "Cannot convert %s: %s" % (self.path, self.reason)
+
+
+def detect_format(path, line):
+    """Returns the format of the file at PATH, and the labels of its
+    columns, from the first LINE"""
+    line = line.strip()
+    if line.startswith("["):
+        try:
+            labels = [str(x) for x in ast.literal_eval(line)]
+        except (ValueError, SyntaxError):
+            raise ConversionError(path, "invalid header")
+        if tuple(labels) == ES_COLUMNS:
+            return ES_CSV, labels
+        return EEG_CSV, labels
+    if "\t" in line:
+        return TSV, line.split("\t")
+    raise ConversionError(path, "unknown format")
+
+
+def channel_ids(path, labels):
+    """Returns the EDK IDs of the channels named in LABELS"""
+    ids = dict((variables.CHANNEL_NAMES[c].upper(), c)
+               for c in variables.CHANNELS)
+    channels = []
+    for label in labels:
+        if label.upper() not in ids:
+            raise ConversionError(path, "unknown channel %r" % label)
+        channels.append(ids[label.upper()])
+    return channels
+
+
+def sensor_ids(path, labels):
+    """Returns the EDK IDs of the sensors of the quality columns in
+    LABELS (SENSOR_Q)"""
+    ids = dict((name.upper() + "_Q", s)
+               for s, name in variables.SENSOR_NAMES.items())
+    sensors = []
+    for label in labels:
+        if label.upper() not in ids:
+            raise ConversionError(path, "unknown sensor %r" % label)
+        sensors.append(ids[label.upper()])
+    return sensors
+
+
+def parse_rows(lines, width, separator, trailing):
+    """Returns a tuple (rows x WIDTH array, rows skipped) with the values
+    of LINES. Blank lines are ignored; lines with a different number of
+    values, or that cannot be parsed, are skipped"""
+    lines = [l.rstrip(trailing) for l in lines]
+    lines = [l for l in lines if l.strip()]
+    valid = [l for l in lines if l.count(separator) == width - 1]
+    skipped = len(lines) - len(valid)
+    if not valid:
+        return np.zeros((0, width)), skipped
+    try:
+        values = np.array(separator.join(valid).split(separator),
+                          dtype=np.double)
+        return values.reshape(-1, width), skipped
+    except ValueError:
+        pass
+
+    # Some of the rows are not numbers: they are parsed one at a time
+    rows = []
+    for line in valid:
+        try:
+            rows.append([float(x) for x in line.split(separator)])
+        except ValueError:
+            skipped += 1
+    return np.array(rows, dtype=np.double).reshape(-1, width), skipped
+
+
+def read_rows(f, width, format, chunk_size=CHUNK_SIZE):
+    """Iterates over the rows of the open text file F, after its header,
+    a chunk of about CHUNK_SIZE bytes at a time. Yields tuples (rows x
+    WIDTH array, rows skipped)"""
+    separator = SEPARATORS[format]
+    trailing = TRAILING[format]
+    rest = ""
+    while True:
+        text = f.read(chunk_size)
+        if not text:
+            break
+        text = rest + text
+        end = text.rfind("\n")
+        if end < 0:
+            rest = text
+            continue
+        rest = text[end + 1:]
+        yield parse_rows(text[:end].split("\n"), width, separator, trailing)
+    if rest.strip():
+        yield parse_rows([rest], width, separator, trailing)
+
+
+def strongest_expressions(rows, expressions):
+    """Returns a tuple (actions, powers) with the strongest of the given
+    EXPRESSIONS in every row of an EmoState log (as
+    replay.strongest_expression)"""
+    columns = [c for c, e in expressions]
+    actions = np.array([e for c, e in expressions])
+    values = rows[:, columns]
+    strongest = np.argmax(values, axis=1)
+    powers = values[np.arange(len(rows)), strongest]
+    return (np.where(powers > 0, actions[strongest], variables.EXP_NEUTRAL),
+            np.maximum(powers, 0))
+
+
+def emostates_from_log(rows):
+    """Returns EmoState records (EMOSTATE_DTYPE) with the values of the
+    ROWS of an EmoState log (as replayed by replay.ReplayEngine)"""
+    states = np.zeros(len(rows), dtype=EMOSTATE_DTYPE)
+    states["time"] = rows[:, ES_TIME]
+    blink = rows[:, ES_BLINK] != 0
+    states["blink"] = blink
+    states["left_wink"] = rows[:, ES_LEFT_WINK]
+    states["right_wink"] = rows[:, ES_RIGHT_WINK]
+    states["eyes_open"] = ~blink
+    states["looking_left"] = rows[:, ES_LOOK_LEFT]
+    states["looking_right"] = rows[:, ES_LOOK_RIGHT]
+    states["left_eyelid"] = ~(blink | (rows[:, ES_LEFT_WINK] != 0))
+    states["right_eyelid"] = ~(blink | (rows[:, ES_RIGHT_WINK] != 0))
+    states["upper_face_action"], states["upper_face_power"] = \
+        strongest_expressions(rows, UPPER_FACE)
+    states["lower_face_action"], states["lower_face_power"] = \
+        strongest_expressions(rows, LOWER_FACE)
+    states["excitement_short"] = rows[:, ES_SHORT_TERM_EXCITEMENT]
+    states["excitement_long"] = rows[:, ES_LONG_TERM_EXCITEMENT]
+    states["engagement"] = rows[:, ES_ENGAGEMENT]
+    action = rows[:, ES_COGNITIV_ACTION]
+    states["cognitiv_action"] = np.where(action != 0, action,
+                                         variables.COG_NEUTRAL)
+    states["cognitiv_power"] = rows[:, ES_COGNITIV_POWER]
+    states["user_id"] = rows[:, ES_USER]
+    states["wireless_signal"] = rows[:, ES_SIGNAL]
+    return states
+
+
+def create_writer(path, output, format, labels, sampling_rate,
+                  compression, quantization):
+    """Returns a tuple (writer, function splitting rows into the
+    arguments of the writer's write())"""
+    if format == EEG_CSV:
+        writer = EEGFileWriter(output, channel_ids(path, labels),
+                               sampling_rate, np.double,
+                               compression=compression,
+                               quantization=quantization)
+        return writer, lambda rows: (rows, None, None)
+
+    if format == ES_CSV:
+        writer = EEGFileWriter(output, (), EMOSTATE_RATE,
+                               emostate_fields=EMOSTATE_DTYPE.names,
+                               block_size=EMOSTATE_BLOCK_SIZE,
+                               compression=compression)
+        return writer, lambda rows: (np.zeros((len(rows), 0)), None,
+                                     emostates_from_log(rows))
+
+    # The GUI recordings: channels, quality (SENSOR_Q) and EmoStates
+    quality = [i for i, l in enumerate(labels) if l.upper().endswith("_Q")]
+    if not quality or labels[-len(TSV_EMOSTATE_LABELS):] != \
+            list(TSV_EMOSTATE_LABELS):
+        raise ConversionError(path, "unknown columns")
+    C, Q = quality[0], len(quality)
+    writer = EEGFileWriter(output, channel_ids(path, labels[:C]),
+                           sampling_rate, np.double,
+                           sensor_ids(path, labels[C:C + Q]),
+                           TSV_EMOSTATE_FIELDS, compression=compression,
+                           quantization=quantization)
+    state_dtype = np.dtype([(f, EMOSTATE_DTYPE[f])
+                            for f in TSV_EMOSTATE_FIELDS])
+
+    def split(rows):
+        states = np.zeros(len(rows), dtype=state_dtype)
+        for i, field in enumerate(TSV_EMOSTATE_FIELDS):
+            states[field] = rows[:, C + Q + i]
+        return rows[:, :C], rows[:, C:C + Q].astype(np.int8), states
+    return writer, split
+
+
+def output_path(path, output_dir=None):
+    """The recording converted from PATH: PATH with the extension .eeg,
+    in OUTPUT_DIR if given"""
+    name = os.path.splitext(path)[0] + ".eeg"
+    if output_dir is not None:
+        name = os.path.join(output_dir, os.path.basename(name))
+    return name
+
+
+def convert_file(path, output=None, sampling_rate=128, compression="zlib",
+                 quantization="auto", force=False, chunk_size=CHUNK_SIZE):
+    """Converts the text recording at PATH (see FORMATS) to a recording
+    at OUTPUT (by default, PATH with the extension .eeg). Returns a
+    dictionary with the format, the rows converted and skipped, and the
+    sizes of the files.  With neither COMPRESSION nor QUANTIZATION, the
+    samples are stored raw, and mapped in memory by EEGArray.  An
+    existing OUTPUT is only overwritten with FORCE"""
+    if output is None:
+        output = output_path(path)
+    if os.path.abspath(output) == os.path.abspath(path):
+        raise ConversionError(path, "the output would overwrite it")
+    if not force and os.path.exists(output):
+        raise ConversionError(path, "%s already exists" % output)
+    started = time.time()
+    f = open(path, "rb")
+    try:
+        format, labels = detect_format(path, f.readline())
+        writer, split = create_writer(path, output, format, labels,
+                                      sampling_rate, compression,
+                                      quantization)
+        rows = skipped = 0
+        try:
+            for values, n in read_rows(f, len(labels), format, chunk_size):
+                skipped += n
+                if len(values):
+                    writer.write(*split(values))
+                    rows += len(values)
+        finally:
+            writer.close()
+    finally:
+        f.close()
+    return {"path" : path, "output" : output, "format" : format,
+            "rows" : rows, "skipped" : skipped,
+            "bytes_read" : os.path.getsize(path),
+            "bytes_written" : writer.bytes_written,
+            "seconds" : time.time() - started}
+
+
+def _convert(args):
+    """Converts a file in a worker process.  Any error is returned in
+    the report of the file, rather than raised: it would otherwise end
+    the whole conversion (and lose the reports of the other files)"""
+    path, output, options = args
+    try:
+        return convert_file(path, output, **options)
+    except ConversionError as e:
+        return {"path" : path, "output" : output, "error" : str(e)}
+    except Exception as e:
+        return {"path" : path, "output" : output,
+                "error" : str(ConversionError(path, e))}
+
+
+def convert_files(paths, output_dir=None, processes=None, **options):
+    """Converts the recordings at PATHS (to OUTPUT_DIR, by default next
+    to them) in parallel, with PROCESSES processes (by default, one per
+    core). Iterates over the reports of convert_file() as the files are
+    converted (reports of files that failed have an 'error').  Files
+    that would be converted to the same output are not converted, but
+    the first one"""
+    jobs = []
+    outputs = {}
+    for path in paths:
+        output = output_path(path, output_dir)
+        key = os.path.normcase(os.path.abspath(output))
+        if key in outputs:
+            yield {"path" : path, "output" : output,
+                   "error" : str(ConversionError(
+                       path, "%s is also the output of %s" % (
+                           output, outputs[key])))}
+            continue
+        outputs[key] = path
+        jobs.append((path, output, options))
+    if not jobs:
+        return
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(jobs))
+    if processes <= 1:
+        for job in jobs:
+            yield _convert(job)
+        return
+    pool = multiprocessing.Pool(processes)
+    try:
+        for report in pool.imap_unordered(_convert, jobs):
+            yield report
+    finally:
+        pool.close()
+        pool.join()
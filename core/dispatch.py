@@ -0,0 +1,162 @@
+## ---------------------------------------------------------------- ##
+## DISPATCH.py
+## ---------------------------------------------------------------- ##
+## Asynchronous delivery of manager events. Every asynchronous
+## listener gets its own bounded queue and worker thread, so that a
+## slow listener (e.g., a file write or a GUI update) does not delay
+## the monitor thread or the other listeners.
+## ---------------------------------------------------------------- ##
+
+from threading import Thread, Condition
+import collections
+import traceback
+import time
+import numpy as np
+from stats import clock
+
+__all__ = ["BLOCK", "DROP_OLDEST", "LATEST", "POLICIES",
+           "PolicyError", "ListenerWorker", "listener_name"]
+
+## Overflow policies
+
+BLOCK = "block"              # Waits until there is room (lossless)
+DROP_OLDEST = "drop-oldest"  # Discards the oldest queued event
+LATEST = "latest"            # Only the most recent event is kept
+
+POLICIES = (BLOCK, DROP_OLDEST, LATEST)
+
+
+class PolicyError(Exception):
+    """A specific error when an unknown overflow policy is requested"""
+    def __init__(self, policy):
+        self.policy = policy
+
+    def __str__(self):
+        return "Unknown overflow policy: %s" % self.policy
+
+
+def listener_name(func):
+    """A readable name for a listener function"""
+    owner = getattr(func, "im_self", None)
+    if owner is not None:
+        return "%s.%s" % (owner.__class__.__name__, func.__name__)
+    return getattr(func, "__name__", repr(func))
+
+
+class ListenerWorker(object):
+    """Wraps a listener function, calling it from a dedicated thread.
+    Calling the worker enqueues the argument and returns immediately
+    (unless the queue is full and the policy is BLOCK).
+    If INSTRUMENTATION (a stats.Stats object) is given and enabled, the
+    duration of every call is recorded."""
+    def __init__(self, func, policy=BLOCK, maxsize=64,
+                 instrumentation=None):
+        if policy not in POLICIES:
+            raise PolicyError(policy)
+
+        self.func = func
+        self.policy = policy
+        self.maxsize = maxsize
+        self.instrumentation = instrumentation
+        self._stat_name = "listener:%s" % listener_name(func)
+
+        self._queue = collections.deque()
+        self._condition = Condition()
+        self._running = True
+
+        # Counters
+        self.queued = 0         # Events accepted into the queue
+        self.dropped = 0        # Events discarded because of the policy
+        self.processed = 0      # Events passed to the listener
+        self.max_latency = 0.0  # Longest time from event to end of call
+
+        self._thread = Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def name(self):
+        """A readable name for the listener"""
+        return listener_name(self.func)
+
+    @property
+    def pending(self):
+        """The number of events waiting in the queue"""
+        return len(self._queue)
+
+    def __call__(self, arg):
+        """Enqueues ARG for the listener"""
+        self.put(arg)
+
+    def put(self, arg):
+        """Enqueues ARG according to the overflow policy"""
+        # The manager passes views of its internal buffers, which might
+        # be overwritten before the listener gets to them.
+        if isinstance(arg, np.ndarray):
+            arg = arg.copy()
+
+        item = (time.time(), arg)
+        queue = self._queue
+        with self._condition:
+            if self.policy == LATEST:
+                self.dropped += len(queue)
+                queue.clear()
+
+            elif len(queue) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    queue.popleft()
+                    self.dropped += 1
+                else:
+                    while len(queue) >= self.maxsize and self._running:
+                        self._condition.wait()
+
+            queue.append(item)
+            self.queued += 1
+            self._condition.notify_all()
+
+    def run(self):
+        """Calls the listener on every queued event, until stopped"""
+        queue = self._queue
+        while True:
+            with self._condition:
+                while not queue and self._running:
+                    self._condition.wait()
+                if not queue:
+                    # Stopped, and all the events have been delivered
+                    return
+                t, arg = queue.popleft()
+                self._condition.notify_all()
+
+            instrumentation = self.instrumentation
+            if instrumentation is not None and instrumentation.enabled:
+                start = clock()
+                try:
+                    self.func(arg)
+                except Exception:
+                    traceback.print_exc()
+                instrumentation.record(self._stat_name, clock() - start)
+            else:
+                try:
+                    self.func(arg)
+                except Exception:
+                    traceback.print_exc()
+
+            self.processed += 1
+            latency = time.time() - t
+            if latency > self.max_latency:
+                self.max_latency = latency
+
+    def stop(self, wait=True):
+        """Stops the worker after the queued events have been delivered"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if wait:
+            self._thread.join()
+
+    def stats(self):
+        """Returns a dictionary with the worker's counters"""
+        return {"listener" : self.name, "policy" : self.policy,
+                "queued" : self.queued, "dropped" : self.dropped,
+                "processed" : self.processed, "pending" : self.pending,
+                "max_latency" : self.max_latency}
@@ -0,0 +1,311 @@
+#!/usr/bin/env python
+
+## ---------------------------------------------------------------- ##
+## EDK.py
+## ---------------------------------------------------------------- ##
+## Typed bindings for the Emotiv EDK library (edk.dll).  Every function
+## declared in edk.h and EmoStateDLL.h gets its full prototype
+## (restype and argtypes) once, when the library is loaded:
+##
+##     import core.edk as edk
+##     lib = edk.load_library(".\\edk.dll")
+##     lib.EE_EngineConnect("Emotiv Systems-5")
+##
+## The loaded functions are also bound to module-level names
+## (edk.EE_EngineConnect, ...), for scripts.
+##
+## The PROTOTYPES table is generated from the headers with:
+##
+##     python -m core.edk edk.h EmoStateDLL.h
+##
+## and OVERRIDES adjusts the few prototypes that take NumPy buffers.
+## ---------------------------------------------------------------- ##
+
+from ctypes import *
+import re
+import sys
+import numpy as np
+
+__all__ = ["load_library", "EDKLibrary", "PROTOTYPES", "OVERRIDES",
+           "DOUBLE_ARRAY", "QUALITY_ARRAY", "parse_header"]
+
+## Opaque handles and enumerations
+
+EmoEngineEventHandle = c_void_p
+EmoStateHandle = c_void_p
+OptimizationParamHandle = c_void_p
+DataHandle = c_void_p
+Enum = c_int
+
+# A 1-D, contiguous array of doubles, used to let the EDK write channel
+# data straight into NumPy memory.
+DOUBLE_ARRAY = np.ctypeslib.ndpointer(dtype=np.double, ndim=1,
+                                      flags="C_CONTIGUOUS")
+
+# The same, for the EE_EEG_ContactQuality_t values (C enums are ints)
+QUALITY_ARRAY = np.ctypeslib.ndpointer(dtype=np.intc, ndim=1,
+                                       flags="C_CONTIGUOUS")
+
+
+# --------------------------------------------------------------- #
+# Generated from edk.h and EmoStateDLL.h (see main())
+# --------------------------------------------------------------- #
+
+PROTOTYPES = (
+    # edk.h
+    ("EE_EngineConnect", c_int, [c_char_p]),
+    ("EE_EngineRemoteConnect", c_int, [c_char_p, c_ushort]),
+    ("EE_EngineDisconnect", c_int, []),
+    ("EE_EnableDiagnostics", c_int, [c_char_p, c_int, c_int]),
+    ("EE_EmoEngineEventCreate", EmoEngineEventHandle, []),
+    ("EE_ProfileEventCreate", EmoEngineEventHandle, []),
+    ("EE_EmoEngineEventFree", None, [EmoEngineEventHandle]),
+    ("EE_EmoStateCreate", EmoStateHandle, []),
+    ("EE_EmoStateFree", None, [EmoStateHandle]),
+    ("EE_EmoEngineEventGetType", Enum, [EmoEngineEventHandle]),
+    ("EE_CognitivEventGetType", Enum, [EmoEngineEventHandle]),
+    ("EE_ExpressivEventGetType", Enum, [EmoEngineEventHandle]),
+    ("EE_EmoEngineEventGetUserId", c_int, [EmoEngineEventHandle, POINTER(c_uint)]),
+    ("EE_EmoEngineEventGetEmoState", c_int, [EmoEngineEventHandle, EmoStateHandle]),
+    ("EE_EngineGetNextEvent", c_int, [EmoEngineEventHandle]),
+    ("EE_EngineClearEventQueue", c_int, [c_int]),
+    ("EE_EngineGetNumUser", c_int, [POINTER(c_uint)]),
+    ("EE_SetHardwarePlayerDisplay", c_int, [c_uint, c_uint]),
+    ("EE_SetUserProfile", c_int, [c_uint, POINTER(c_ubyte), c_uint]),
+    ("EE_GetUserProfile", c_int, [c_uint, EmoEngineEventHandle]),
+    ("EE_GetBaseProfile", c_int, [EmoEngineEventHandle]),
+    ("EE_GetUserProfileSize", c_int, [EmoEngineEventHandle, POINTER(c_uint)]),
+    ("EE_GetUserProfileBytes", c_int, [EmoEngineEventHandle, POINTER(c_ubyte), c_uint]),
+    ("EE_LoadUserProfile", c_int, [c_uint, c_char_p]),
+    ("EE_SaveUserProfile", c_int, [c_uint, c_char_p]),
+    ("EE_ExpressivSetThreshold", c_int, [c_uint, Enum, Enum, c_int]),
+    ("EE_ExpressivGetThreshold", c_int, [c_uint, Enum, Enum, POINTER(c_int)]),
+    ("EE_ExpressivSetTrainingAction", c_int, [c_uint, Enum]),
+    ("EE_ExpressivSetTrainingControl", c_int, [c_uint, Enum]),
+    ("EE_ExpressivGetTrainingAction", c_int, [c_uint, POINTER(Enum)]),
+    ("EE_ExpressivGetTrainingTime", c_int, [c_uint, POINTER(c_uint)]),
+    ("EE_ExpressivGetTrainedSignatureActions", c_int, [c_uint, POINTER(c_ulong)]),
+    ("EE_ExpressivGetTrainedSignatureAvailable", c_int, [c_uint, POINTER(c_int)]),
+    ("EE_ExpressivSetSignatureType", c_int, [c_uint, Enum]),
+    ("EE_ExpressivGetSignatureType", c_int, [c_uint, POINTER(Enum)]),
+    ("EE_CognitivSetActiveActions", c_int, [c_uint, c_ulong]),
+    ("EE_CognitivGetActiveActions", c_int, [c_uint, POINTER(c_ulong)]),
+    ("EE_CognitivGetTrainingTime", c_int, [c_uint, POINTER(c_uint)]),
+    ("EE_CognitivSetTrainingControl", c_int, [c_uint, Enum]),
+    ("EE_CognitivSetTrainingAction", c_int, [c_uint, Enum]),
+    ("EE_CognitivGetTrainingAction", c_int, [c_uint, POINTER(Enum)]),
+    ("EE_CognitivGetTrainedSignatureActions", c_int, [c_uint, POINTER(c_ulong)]),
+    ("EE_CognitivGetOverallSkillRating", c_int, [c_uint, POINTER(c_float)]),
+    ("EE_CognitivGetActionSkillRating", c_int, [c_uint, Enum, POINTER(c_float)]),
+    ("EE_CognitivSetActivationLevel", c_int, [c_uint, c_int]),
+    ("EE_CognitivSetActionSensitivity", c_int, [c_uint, c_int, c_int, c_int, c_int]),
+    ("EE_CognitivGetActivationLevel", c_int, [c_uint, POINTER(c_int)]),
+    ("EE_CognitivGetActionSensitivity", c_int, [c_uint, POINTER(c_int), POINTER(c_int), POINTER(c_int), POINTER(c_int)]),
+    ("EE_CognitivStartSamplingNeutral", c_int, [c_uint]),
+    ("EE_CognitivStopSamplingNeutral", c_int, [c_uint]),
+    ("EE_CognitivSetSignatureCaching", c_int, [c_uint, c_uint]),
+    ("EE_CognitivGetSignatureCaching", c_int, [c_uint, POINTER(c_uint)]),
+    ("EE_CognitivSetSignatureCacheSize", c_int, [c_uint, c_uint]),
+    ("EE_CognitivGetSignatureCacheSize", c_int, [c_uint, POINTER(c_uint)]),
+    ("EE_HeadsetGetSensorDetails", c_int, [Enum, c_void_p]),
+    ("EE_HardwareGetVersion", c_int, [c_uint, POINTER(c_ulong)]),
+    ("EE_SoftwareGetVersion", c_int, [c_char_p, c_uint, POINTER(c_ulong)]),
+    ("EE_HeadsetGetGyroDelta", c_int, [c_uint, POINTER(c_int), POINTER(c_int)]),
+    ("EE_HeadsetGyroRezero", c_int, [c_uint]),
+    ("EE_OptimizationParamCreate", OptimizationParamHandle, []),
+    ("EE_OptimizationParamFree", None, [OptimizationParamHandle]),
+    ("EE_OptimizationEnable", c_int, [OptimizationParamHandle]),
+    ("EE_OptimizationIsEnabled", c_int, [POINTER(c_bool)]),
+    ("EE_OptimizationDisable", c_int, []),
+    ("EE_OptimizationGetParam", c_int, [OptimizationParamHandle]),
+    ("EE_OptimizationGetVitalAlgorithm", c_int, [OptimizationParamHandle, Enum, POINTER(c_uint)]),
+    ("EE_OptimizationSetVitalAlgorithm", c_int, [OptimizationParamHandle, Enum, c_uint]),
+    ("EE_ResetDetection", c_int, [c_uint, Enum, c_uint]),
+    ("EE_GetSecurityCode", c_double, []),
+    ("EE_CheckSecurityCode", c_bool, [c_double]),
+    ("EE_EngineLocalConnect", c_int, [c_char_p]),
+    ("EE_DataCreate", DataHandle, []),
+    ("EE_DataFree", None, [DataHandle]),
+    ("EE_DataUpdateHandle", c_int, [c_uint, DataHandle]),
+    ("EE_DataGet", c_int, [DataHandle, Enum, POINTER(c_double), c_uint]),
+    ("EE_DataGetMultiChannels", c_int, [DataHandle, POINTER(Enum), c_uint, POINTER(POINTER(c_double)), c_uint]),
+    ("EE_DataGetNumberOfSample", c_int, [DataHandle, POINTER(c_uint)]),
+    ("EE_DataSetBufferSizeInSec", c_int, [c_float]),
+    ("EE_DataGetBufferSizeInSec", c_int, [POINTER(c_float)]),
+    ("EE_DataAcquisitionEnable", c_int, [c_uint, c_bool]),
+    ("EE_DataAcquisitionIsEnabled", c_int, [c_uint, POINTER(c_bool)]),
+    ("EE_DataSetSychronizationSignal", c_int, [c_uint, c_int]),
+    ("EE_DataSetMarker", c_int, [c_uint, c_int]),
+    ("EE_DataGetSamplingRate", c_int, [c_uint, POINTER(c_uint)]),
+    # EmoStateDLL.h
+    ("ES_Create", EmoStateHandle, []),
+    ("ES_Free", None, [EmoStateHandle]),
+    ("ES_Init", None, [EmoStateHandle]),
+    ("ES_GetTimeFromStart", c_float, [EmoStateHandle]),
+    ("ES_GetHeadsetOn", c_int, [EmoStateHandle]),
+    ("ES_GetNumContactQualityChannels", c_int, [EmoStateHandle]),
+    ("ES_GetContactQuality", Enum, [EmoStateHandle, c_int]),
+    ("ES_GetContactQualityFromAllChannels", c_int, [EmoStateHandle, POINTER(Enum), c_size_t]),
+    ("ES_ExpressivIsBlink", c_int, [EmoStateHandle]),
+    ("ES_ExpressivIsLeftWink", c_int, [EmoStateHandle]),
+    ("ES_ExpressivIsRightWink", c_int, [EmoStateHandle]),
+    ("ES_ExpressivIsEyesOpen", c_int, [EmoStateHandle]),
+    ("ES_ExpressivIsLookingUp", c_int, [EmoStateHandle]),
+    ("ES_ExpressivIsLookingDown", c_int, [EmoStateHandle]),
+    ("ES_ExpressivIsLookingLeft", c_int, [EmoStateHandle]),
+    ("ES_ExpressivIsLookingRight", c_int, [EmoStateHandle]),
+    ("ES_ExpressivGetEyelidState", None, [EmoStateHandle, POINTER(c_float), POINTER(c_float)]),
+    ("ES_ExpressivGetEyeLocation", None, [EmoStateHandle, POINTER(c_float), POINTER(c_float)]),
+    ("ES_ExpressivGetEyebrowExtent", c_float, [EmoStateHandle]),
+    ("ES_ExpressivGetSmileExtent", c_float, [EmoStateHandle]),
+    ("ES_ExpressivGetClenchExtent", c_float, [EmoStateHandle]),
+    ("ES_ExpressivGetUpperFaceAction", Enum, [EmoStateHandle]),
+    ("ES_ExpressivGetUpperFaceActionPower", c_float, [EmoStateHandle]),
+    ("ES_ExpressivGetLowerFaceAction", Enum, [EmoStateHandle]),
+    ("ES_ExpressivGetLowerFaceActionPower", c_float, [EmoStateHandle]),
+    ("ES_ExpressivIsActive", c_int, [EmoStateHandle, Enum]),
+    ("ES_AffectivGetExcitementLongTermScore", c_float, [EmoStateHandle]),
+    ("ES_AffectivGetExcitementShortTermScore", c_float, [EmoStateHandle]),
+    ("ES_AffectivIsActive", c_int, [EmoStateHandle, Enum]),
+    ("ES_AffectivGetMeditationScore", c_float, [EmoStateHandle]),
+    ("ES_AffectivGetFrustrationScore", c_float, [EmoStateHandle]),
+    ("ES_AffectivGetEngagementBoredomScore", c_float, [EmoStateHandle]),
+    ("ES_CognitivGetCurrentAction", Enum, [EmoStateHandle]),
+    ("ES_CognitivGetCurrentActionPower", c_float, [EmoStateHandle]),
+    ("ES_CognitivIsActive", c_int, [EmoStateHandle]),
+    ("ES_GetWirelessSignalStatus", Enum, [EmoStateHandle]),
+    ("ES_Copy", None, [EmoStateHandle, EmoStateHandle]),
+    ("ES_AffectivEqual", c_int, [EmoStateHandle, EmoStateHandle]),
+    ("ES_ExpressivEqual", c_int, [EmoStateHandle, EmoStateHandle]),
+    ("ES_CognitivEqual", c_int, [EmoStateHandle, EmoStateHandle]),
+    ("ES_EmoEngineEqual", c_int, [EmoStateHandle, EmoStateHandle]),
+    ("ES_Equal", c_int, [EmoStateHandle, EmoStateHandle]),
+    ("ES_GetBatteryChargeLevel", None, [EmoStateHandle, POINTER(c_int), POINTER(c_int)]),
+    ("ES_AffectivGetExcitementShortTermModelParams", None, [EmoStateHandle, POINTER(c_double), POINTER(c_double), POINTER(c_double)]),
+    ("ES_AffectivGetMeditationModelParams", None, [EmoStateHandle, POINTER(c_double), POINTER(c_double), POINTER(c_double)]),
+    ("ES_AffectivGetEngagementBoredomModelParams", None, [EmoStateHandle, POINTER(c_double), POINTER(c_double), POINTER(c_double)]),
+    ("ES_AffectivGetFrustrationModelParams", None, [EmoStateHandle, POINTER(c_double), POINTER(c_double), POINTER(c_double)]),
+)
+
+# Sample and quality buffers are NumPy arrays, written in place
+OVERRIDES = {
+    "EE_DataGet" : (c_int, [DataHandle, Enum, DOUBLE_ARRAY, c_uint]),
+    "ES_GetContactQualityFromAllChannels" : (c_int, [EmoStateHandle,
+                                                     QUALITY_ARRAY,
+                                                     c_size_t]),
+}
+
+
+class EDKLibrary(object):
+    """The functions of a loaded EDK library, with their prototypes.
+    Functions that the library does not export (e.g., in older
+    versions) are listed in 'missing', and are not attributes"""
+    def __init__(self, dll):
+        self.dll = dll
+        self.missing = []
+        for name, restype, argtypes in PROTOTYPES:
+            try:
+                func = getattr(dll, name)
+            except AttributeError:
+                self.missing.append(name)
+                continue
+            if name in OVERRIDES:
+                restype, argtypes = OVERRIDES[name]
+            func.restype = restype
+            func.argtypes = argtypes
+            setattr(self, name, func)
+
+
+def load_library(path):
+    """Loads the EDK library at PATH and returns an EDKLibrary. Its
+    functions are also bound to the names of this module"""
+    library = EDKLibrary(cdll.LoadLibrary(path))
+    module = globals()
+    for name, restype, argtypes in PROTOTYPES:
+        if hasattr(library, name):
+            module[name] = getattr(library, name)
+    return library
+
+
+# --------------------------------------------------------------- #
+# Header parsing (generation of PROTOTYPES)
+# --------------------------------------------------------------- #
+
+DECLARATION = re.compile(r"(?:EDK_API|EMOSTATE_DLL_API)\s+"
+                         r"([\w\s\*]+?)\s*\b(\w+)\s*\(([^)]*)\)\s*;")
+
+C_TYPES = {"int" : "c_int", "unsigned int" : "c_uint",
+           "unsigned short" : "c_ushort", "unsigned long" : "c_ulong",
+           "unsigned char" : "c_ubyte", "char" : "c_char",
+           "float" : "c_float", "double" : "c_double",
+           "bool" : "c_bool", "size_t" : "c_size_t",
+           "void" : "None",
+           "EmoEngineEventHandle" : "EmoEngineEventHandle",
+           "EmoStateHandle" : "EmoStateHandle",
+           "OptimizationParamHandle" : "OptimizationParamHandle",
+           "DataHandle" : "DataHandle"}
+
+
+STRUCT = re.compile(r"typedef\s+struct\s+\w*\s*\{[^}]*\}\s*(\w+)\s*;")
+
+
+def ctype_name(declaration, structs=()):
+    """Returns the name of the ctypes type of a C declaration (a type,
+    or a parameter with its type). STRUCTS are the names of the
+    structures, which are passed by address"""
+    declaration = declaration.split("=")[0].replace("const ", "")
+    pointers = declaration.count("*") + declaration.count("[]")
+    words = re.sub(r"\[\]|\*", " ", declaration).split()
+    if len(words) > 1 and words[-1] not in ("int", "short", "long",
+                                            "char") \
+            and not words[-1].endswith("_t"):
+        words = words[:-1]     # Drops the parameter name
+    base = " ".join(words)
+
+    if base == "char" and pointers == 1:
+        return "c_char_p"
+    if base == "void" and pointers > 0:
+        pointers, name = pointers - 1, "c_void_p"
+    elif base in C_TYPES:
+        name = C_TYPES[base]
+    elif base.endswith("_t") and base not in structs:
+        name = "Enum"
+    else:
+        # Unknown structures are passed by address
+        pointers, name = max(pointers - 1, 0), "c_void_p"
+
+    for i in range(pointers):
+        name = "POINTER(%s)" % name
+    return name
+
+
+def parse_header(text):
+    """Returns a list of (name, restype, argtypes) tuples (with ctypes
+    type names) for the functions declared in a header"""
+    text = re.sub(r"/\*.*?\*/", "", text, flags=re.S)
+    text = re.sub(r"//[^\n]*", "", text)
+    structs = STRUCT.findall(text)
+    prototypes = []
+    for restype, name, params in DECLARATION.findall(text):
+        params = [p.strip() for p in params.split(",")]
+        params = [p for p in params if p and p != "void"]
+        prototypes.append((name, ctype_name(restype, structs),
+                           [ctype_name(p, structs) for p in params]))
+    return prototypes
+
+
+def main(argv=None):
+    """Prints the PROTOTYPES table for the given headers"""
+    if argv is None:
+        argv = sys.argv[1:]
+    print "PROTOTYPES = ("
+    for path in argv:
+        print "    # %s" % path
+        for name, restype, argtypes in parse_header(open(path).read()):
+            print '    ("%s", %s, [%s]),' % (name, restype,
+                                             ", ".join(argtypes))
+    print ")"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+## ---------------------------------------------------------------- ##
+## EEGARRAY.py
+## ---------------------------------------------------------------- ##
+## Out-of-core access to recordings (*.eeg).  An EEGArray presents a
+## recording as a read-only (samples x channels) array, without loading
+## it into memory:
+##
+##     eeg = EEGArray("session.eeg")
+##     eeg.shape                            # (samples, channels)
+##     af3 = eeg.time_slice(60, 120)[:, "AF3"]   # Nothing read yet
+##     x = np.asarray(af3)                  # Reads the blocks needed
+##     for chunk in eeg.chunks(4096):       # The whole recording, a
+##         ...                              # chunk at a time
+##
+## Slicing an EEGArray returns another EEGArray; data is only read when
+## it is converted to an array.  The blocks of raw recordings (written
+## without compression) are mapped in memory with np.memmap, and a
+## range of samples within a block is returned as a view of the file,
+## without copying it.  Compressed blocks are decompressed, one at a
+## time, when their samples are used.
+##
+## The recorders and the converter compress and encode the samples by
+## default (zlib, with DELTA16 where the channels allow it): only
+## recordings made with --raw (NeuroRecord.py, NeuroConvert.py), or
+## with neither compression nor quantization (EEGFileSink,
+## convert_file), are mapped.  The others are decoded into memory, a
+## block at a time.
+## ---------------------------------------------------------------- ##
+
+import numpy as np
+from eegfile import EEGFileReader
+
+__all__ = ["EEGArray"]
+
+
+class EEGArray(object):
+    """A read-only, lazily read (samples x channels) view of the
+    recording at PATH (or of an EEGFileReader).  Columns can be
+    selected by index or by channel name (see variables.CHANNEL_NAMES).
+    Only raw blocks (no compression, no quantization) are views of the
+    file mapped in memory: compressed or encoded blocks (the default of
+    the recorders) are decoded, and their samples copied"""
+    def __init__(self, path, rows=None, columns=None):
+        if isinstance(path, EEGFileReader):
+            self.reader = path
+        else:
+            self.reader = EEGFileReader(path)
+        if rows is None:
+            rows = (0, len(self.reader), 1)
+        self.rows = rows              # (start, stop, step) in the file
+        self.columns = columns        # None, a column, or a list of them
+
+    # --------------------------------------------------------------- #
+    # Array interface
+    # --------------------------------------------------------------- #
+
+    def __len__(self):
+        start, stop, step = self.rows
+        return len(xrange(start, stop, step))
+
+    @property
+    def shape(self):
+        if isinstance(self.columns, int):
+            return (len(self),)
+        return (len(self), len(self.column_indices))
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def dtype(self):
+        return self.reader.dtype
+
+    @property
+    def column_indices(self):
+        """The columns of the file in the view"""
+        if self.columns is None:
+            return range(len(self.reader.channels))
+        if isinstance(self.columns, int):
+            return [self.columns]
+        return list(self.columns)
+
+    @property
+    def channels(self):
+        """The EDK IDs of the channels in the view"""
+        return tuple(self.reader.channels[c] for c in self.column_indices)
+
+    @property
+    def channel_names(self):
+        """The names of the channels in the view"""
+        names = self.reader.channel_names
+        return tuple(names[c] for c in self.column_indices)
+
+    @property
+    def sampling_rate(self):
+        return self.reader.sampling_rate / float(self.rows[2])
+
+    def __repr__(self):
+        return "<EEGArray %s: %s>" % (self.reader.path,
+                                      " x ".join(str(n) for n in self.shape))
+
+    # --------------------------------------------------------------- #
+    # Slicing
+    # --------------------------------------------------------------- #
+
+    def _column(self, key):
+        """Returns the index in the file of column KEY of the view (an
+        index, or a channel name)"""
+        indices = self.column_indices
+        if isinstance(key, basestring):
+            names = self.channel_names
+            if key not in names:
+                raise KeyError("No channel named %r" % key)
+            return indices[names.index(key)]
+        return indices[key]
+
+    def _select_columns(self, key):
+        if isinstance(self.columns, int):
+            raise IndexError("Too many indices")
+        if isinstance(key, slice):
+            return self.column_indices[key]
+        if isinstance(key, (list, tuple, np.ndarray)):
+            return [self._column(k) for k in key]
+        return self._column(key)
+
+    def _select_rows(self, key):
+        start, stop, step = self.rows
+        a, b, c = key.indices(len(self))
+        if c <= 0:
+            raise IndexError("Only positive steps are supported")
+        n = len(xrange(a, b, c))
+        first = start + a * step
+        return (first, first + n * step * c, step * c)
+
+    def __getitem__(self, key):
+        """Returns a view (for slices of rows), or the values of a row"""
+        if not isinstance(key, tuple):
+            key = (key, slice(None))
+        if len(key) != 2:
+            raise IndexError("Too many indices")
+        rows, columns = key
+        if isinstance(columns, slice) and columns == slice(None):
+            columns = self.columns
+        else:
+            columns = self._select_columns(columns)
+
+        if isinstance(rows, slice):
+            return EEGArray(self.reader, self._select_rows(rows), columns)
+
+        # A single row
+        n = len(self)
+        if rows < 0:
+            rows += n
+        if not 0 <= rows < n:
+            raise IndexError("Row %d out of range" % rows)
+        return EEGArray(self.reader, self._select_rows(
+            slice(rows, rows + 1)), columns).read()[0]
+
+    def time_slice(self, start, stop):
+        """Returns a view of the samples between START and STOP seconds
+        from the start of the recording"""
+        first, last, step = self.rows
+        a = self.reader.time_to_sample(start)
+        b = self.reader.time_to_sample(stop)
+        a = max(int(np.ceil((a - first) / float(step))), 0)
+        b = max(int(np.ceil((b - first) / float(step))), a)
+        return self[a:b]
+
+    # --------------------------------------------------------------- #
+    # Reading
+    # --------------------------------------------------------------- #
+
+    def read(self):
+        """Returns the values of the view (an array). A range of samples
+        within a single raw block is a view of the file"""
+        start, stop, step = self.rows
+        columns = self.columns
+        if isinstance(columns, list) and columns and \
+                columns == range(columns[0], columns[-1] + 1):
+            columns = slice(columns[0], columns[-1] + 1)
+        reader = self.reader
+        index = reader.index
+
+        parts = []
+        if start < stop:
+            first = index["first"]
+            i = np.searchsorted(first, start, side="right") - 1
+            j = np.searchsorted(first, stop, side="left")
+            for b in xrange(i, j):
+                g0 = int(first[b])
+                g1 = g0 + int(index[b]["samples"])
+                lo = max(start, g0)
+                if (lo - start) % step:
+                    lo += step - (lo - start) % step
+                hi = min(stop, g1)
+                if lo >= hi:
+                    continue
+                block = reader.block_samples(b)[lo - g0:hi - g0:step]
+                if columns is not None:
+                    block = block[:, columns]
+                parts.append(block)
+
+        if not parts:
+            return np.zeros(self.shape, dtype=self.dtype)
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def __array__(self, dtype=None):
+        data = self.read()
+        if dtype is not None:
+            data = data.astype(dtype)
+        return data
+
+    def chunks(self, size=4096):
+        """Iterates over the view, yielding arrays of up to SIZE
+        samples"""
+        for k in xrange(0, len(self), size):
+            yield self[k:k + size].read()
@@ -0,0 +1,756 @@
+## ---------------------------------------------------------------- ##
+## EEGFILE.py
+## ---------------------------------------------------------------- ##
+## The binary recording format (*.eeg).  A file is a header, followed
+## by blocks of consecutive samples and by an index of the blocks:
+##
+##     MAGIC, the size of the header (uint32) and the header itself:
+##     JSON with the format version, the channels (EDK IDs), the
+##     sampling rate, the start time and the columns of every sample
+##
+##     BLOCK_HEADER (magic, codec, samples, index of the first sample,
+##     time of the first sample, payload size, CRC-32 of the payload),
+##     followed by the payload: the columns of the block, one after the
+##     other, compressed with the codec
+##
+##     the index (an INDEX_DTYPE record per block: offset, first sample,
+##     samples, time), followed by TRAILER (offset of the index, number
+##     of blocks, CRC-32 of the index, END_MAGIC)
+##
+## Columns are stored whole (the values of a column in a block are
+## contiguous, in the column's dtype), so that a block is encoded with
+## a few vectorised copies and written with a single call.  The sample
+## columns come first, and form a (channels x samples) array; the
+## contact quality and the EmoState fields in effect at every sample
+## (as in the text recordings) follow them.
+##
+## Every block is compressed on its own (and stored raw when that does
+## not make it smaller), so that any time range is read by seeking to
+## its blocks with the index and decompressing only those.  Before
+## compression, the samples can be stored losslessly as differences on
+## the grid of every channel (see core.codec); the grids are listed in
+## the header ("quantizers").
+##
+## The blocks are only ever appended, and every block can be checked on
+## its own (CRC-32), so that a file is valid up to its last complete
+## block whatever happens to the program writing it.  The index is
+## written when the file is closed; files that were never closed (after
+## a crash) are indexed by scanning the block headers, and
+## recover_eeg_file() checks their blocks and writes their index.
+## ---------------------------------------------------------------- ##
+
+import json
+import os
+import struct
+import time
+import zlib
+import numpy as np
+import variables
+from codec import Quantizer, detect_quantizer, encode_columns, \
+     decode_columns
+from emostate import EMOSTATE_DTYPE
+from gaps import first_time
+
+__all__ = ["EEGFileWriter", "EEGFileReader", "EEGFileError",
+           "read_eeg_file", "recover_eeg_file", "INDEX_DTYPE",
+           "COMPRESSIONS"]
+
+MAGIC = "NTEEG001"
+VERSION = 2
+
+FILE_HEADER = struct.Struct("<8sI")       # magic, size of the JSON
+
+BLOCK_MAGIC = "EEGB"
+BLOCK_HEADER = struct.Struct("<4sBxxxIqdII")  # magic, codec, samples,
+                                              # first sample, time,
+                                              # payload size, CRC-32
+BLOCK_HEADER_V1 = struct.Struct("<4sIqdII")   # (no codec)
+
+END_MAGIC = "NTEEGEND"
+TRAILER = struct.Struct("<qII8s")         # offset and size of the index,
+                                          # CRC-32, END_MAGIC
+
+# An entry of the index: the offset of the block (of its header), the
+# index of its first sample, its number of samples and the time of its
+# first sample
+INDEX_DTYPE = np.dtype([("offset", "<i8"), ("first", "<i8"),
+                        ("samples", "<u4"), ("time", "<f8")])
+
+## Codecs of the blocks (flags)
+
+RAW = 0
+ZLIB = 1          # The payload is compressed with zlib
+DELTA16 = 2       # The samples are encoded with codec.encode_columns
+CODEC_FLAGS = ZLIB | DELTA16
+
+# The compressions that can be requested, and their codecs
+COMPRESSIONS = {None : RAW, "zlib" : ZLIB}
+
+
+class EEGFileError(Exception):
+    """A specific error when a file is not a valid recording"""
+    def __init__(self, path, reason):
+        self.path = path
+        self.reason = reason
+
+    def __str__(self):
+        return "Cannot read %s: %s" % (self.path, self.reason)
+
+
+def little_endian(dtype):
+    """Returns the little-endian version of DTYPE"""
+    dtype = np.dtype(dtype)
+    if dtype.byteorder == ">" or \
+            (dtype.byteorder == "=" and not np.little_endian):
+        return dtype.newbyteorder("<")
+    return dtype
+
+
+def crc32(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+def encode_index(index, offset):
+    """Returns the INDEX of the blocks (a list of tuples, or an array of
+    INDEX_DTYPE records) written at OFFSET, and the trailer"""
+    data = np.asarray(index, dtype=INDEX_DTYPE).tostring()
+    return data + TRAILER.pack(offset, len(index), crc32(data), END_MAGIC)
+
+
+class EEGFileWriter(object):
+    """Writes the samples of the given CHANNELS (EDK IDs) to a new file
+    at PATH (or to an open binary file object), in blocks of BLOCK_SIZE
+    samples (by default, one second).  Samples are stored as DTYPE; the
+    contact quality of QUALITY_SENSORS and the EMOSTATE_FIELDS (of
+    EMOSTATE_DTYPE) can be stored with them.  Blocks are compressed with
+    COMPRESSION (one of COMPRESSIONS) at the given LEVEL.
+
+    QUANTIZATION stores the samples as differences on the grid of every
+    channel: it is either a dictionary of codec.Quantizer objects (by
+    channel ID), or "auto" to detect the grids from the first block (the
+    header is then written with the first block).
+
+    Samples are kept in memory until a block is complete (or until
+    flush() is called)"""
+    def __init__(self, path, channels, sampling_rate, dtype=np.float32,
+                 quality_sensors=(), emostate_fields=(), block_size=None,
+                 start_time=None, compression=None, level=6,
+                 quantization=None):
+        if compression not in COMPRESSIONS:
+            raise ValueError("Unknown compression: %r" % (compression,))
+        self.path = path
+        self.channels = tuple(channels)
+        self.sampling_rate = sampling_rate
+        self.dtype = little_endian(dtype)
+        self.quality_sensors = tuple(quality_sensors)
+        self.emostate_fields = tuple(emostate_fields)
+        self.block_size = block_size or max(int(sampling_rate), 1)
+        self.start_time = time.time() if start_time is None else start_time
+        self.compression = compression
+        self.level = level
+        self.samples = 0          # Samples written
+        self.blocks = 0           # Blocks written
+        self.bytes_written = 0
+        self.raw_bytes = 0        # Size of the samples before encoding
+
+        self._field_dtypes = [little_endian(EMOSTATE_DTYPE[f])
+                              for f in self.emostate_fields]
+        if variables.ED_TIMESTAMP in self.channels:
+            self._time_column = self.channels.index(variables.ED_TIMESTAMP)
+        else:
+            self._time_column = None
+        self._last_time = None    # (time, first sample) of a block
+        self._pending = []
+        self._pending_samples = 0
+        self._index = []
+
+        if quantization is None or quantization == "auto":
+            self.quantizers = quantization
+        else:
+            self.quantizers = [quantization.get(c) for c in self.channels]
+
+        if isinstance(path, basestring):
+            self.file = open(path, "wb")
+        else:
+            self.file = path
+            self.path = getattr(path, "name", None)
+        self._header_written = False
+        if self.quantizers != "auto":
+            self.write_header()
+
+    def write_header(self):
+        """Writes the header of the file (once)"""
+        if not self._header_written:
+            self._write(self.encode_header())
+            self._header_written = True
+
+    def encode_header(self):
+        """Returns the header of the file"""
+        columns = [[variables.CHANNEL_NAMES.get(c, str(c)), self.dtype.str]
+                   for c in self.channels]
+        columns += [["%s_Q" % variables.SENSOR_NAMES.get(s, str(s)), "|i1"]
+                    for s in self.quality_sensors]
+        columns += [[f, d.str] for f, d in zip(self.emostate_fields,
+                                               self._field_dtypes)]
+        header = json.dumps({"version" : VERSION,
+                             "channels" : list(self.channels),
+                             "sampling_rate" : self.sampling_rate,
+                             "start_time" : self.start_time,
+                             "dtype" : self.dtype.str,
+                             "quality_sensors" : list(self.quality_sensors),
+                             "emostate_fields" : list(self.emostate_fields),
+                             "compression" : self.compression,
+                             "quantizers" : [q and q.to_list() for q in
+                                             self.quantizers or ()],
+                             "columns" : columns})
+        return FILE_HEADER.pack(MAGIC, len(header)) + header
+
+    def block_time(self, data, states=None):
+        """Returns the time of the first sample of DATA (from its first
+        finite TIMESTAMP, or else the time of its EmoState, if recorded).
+        A block without any time (a gap filled with NaN) is dated from
+        the last block that had one, or else from its first sample"""
+        if self._time_column is not None:
+            t = first_time(data, self._time_column, self.sampling_rate)
+            if t is not None:
+                self._last_time = (t, self.samples)
+                return t
+            if self._last_time is not None:
+                t, first = self._last_time
+                return t + (self.samples - first) / float(self.sampling_rate)
+        elif states is not None and "time" in self.emostate_fields:
+            return float(states["time"][0])
+        return self.samples / float(self.sampling_rate)
+
+    def encode_payload(self, data, quality=None, states=None):
+        """Returns the columns of a block (uncompressed)"""
+        if self.quantizers:
+            parts = [encode_columns(data, self.dtype, self.quantizers)]
+        else:
+            parts = [np.ascontiguousarray(data.T,
+                                          dtype=self.dtype).tostring()]
+        if self.quality_sensors:
+            parts.append(np.ascontiguousarray(quality.T,
+                                              dtype=np.int8).tostring())
+        for field, dtype in zip(self.emostate_fields, self._field_dtypes):
+            parts.append(states[field].astype(dtype).tostring())
+        return "".join(parts)
+
+    def encode_block(self, data, quality=None, states=None):
+        """Returns a block with the samples of DATA (a samples x channels
+        array), with the given QUALITY (samples x quality sensors) and
+        STATES (EmoState records)"""
+        payload = self.encode_payload(data, quality, states)
+        self.raw_bytes += data.shape[0] * self.sample_size
+        codec = DELTA16 if self.quantizers else RAW
+        if self.compression == "zlib":
+            compressed = zlib.compress(payload, self.level)
+            if len(compressed) < len(payload):
+                codec, payload = codec | ZLIB, compressed
+
+        header = BLOCK_HEADER.pack(BLOCK_MAGIC, codec, data.shape[0],
+                                   self.samples,
+                                   self.block_time(data, states),
+                                   len(payload), crc32(payload))
+        return header + payload
+
+    def _write(self, data):
+        self.file.write(data)
+        self.bytes_written += len(data)
+
+    @property
+    def sample_size(self):
+        """The size of a sample (of all its columns), without encoding"""
+        return (len(self.channels) * self.dtype.itemsize +
+                len(self.quality_sensors) +
+                sum([d.itemsize for d in self._field_dtypes]))
+
+    def detect_quantizers(self, data):
+        """Detects the grid of every channel from DATA"""
+        self.quantizers = [detect_quantizer(np.asarray(data[:, c],
+                                                       dtype=self.dtype))
+                           for c in xrange(len(self.channels))]
+
+    def write_block(self, data, quality=None, states=None):
+        """Writes a block right away"""
+        N = data.shape[0]
+        if N == 0:
+            return
+        if self.quantizers == "auto":
+            self.detect_quantizers(data)
+        self.write_header()
+        self._index.append((self.bytes_written, self.samples, N,
+                            self.block_time(data, states)))
+        self._write(self.encode_block(data, quality, states))
+        self.samples += N
+        self.blocks += 1
+
+    def write(self, data, quality=None, states=None):
+        """Adds the samples of DATA (samples x channels), and their
+        QUALITY and STATES if the file stores them. Complete blocks are
+        written"""
+        if not data.flags.owndata:
+            data = data.copy()     # Blocks may be views of a ring buffer
+        self._pending.append((data, quality, states))
+        self._pending_samples += data.shape[0]
+        if self._pending_samples >= self.block_size:
+            self._write_pending(complete=True)
+
+    def _write_pending(self, complete=False):
+        if not self._pending:
+            return
+        data, quality, states = [self._concatenate(p) for p in
+                                 zip(*self._pending)]
+        del self._pending[:]
+        N = data.shape[0]
+        end = N - N % self.block_size if complete else N
+        for start in xrange(0, end, self.block_size):
+            stop = min(start + self.block_size, end)
+            self.write_block(data[start:stop],
+                             quality[start:stop] if quality is not None
+                             else None,
+                             states[start:stop] if states is not None
+                             else None)
+        if end < N:
+            self._pending.append((data[end:],
+                                  quality[end:] if quality is not None
+                                  else None,
+                                  states[end:] if states is not None
+                                  else None))
+        self._pending_samples = N - end
+
+    @staticmethod
+    def _concatenate(arrays):
+        if arrays[0] is None:
+            return None
+        if len(arrays) == 1:
+            return arrays[0]
+        return np.concatenate(arrays)
+
+    def encode_index(self):
+        """Returns the index of the blocks written, and the trailer"""
+        return encode_index(self._index, self.bytes_written)
+
+    def flush(self):
+        """Writes the pending samples (as a shorter block)"""
+        if self.file is not None:
+            self._write_pending()
+            self.file.flush()
+
+    def close(self):
+        """Writes the pending samples and the index, and closes the
+        file"""
+        if self.file is not None:
+            self._write_pending()
+            if self.quantizers == "auto":
+                self.quantizers = None
+            self.write_header()
+            self._write(self.encode_index())
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class EEGFileReader(object):
+    """Reads a recording written by EEGFileWriter.  The blocks are listed
+    in 'index' (an array of INDEX_DTYPE records); they are only read and
+    decompressed when their samples are requested"""
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        data = self.file.read(FILE_HEADER.size)
+        if len(data) < FILE_HEADER.size:
+            raise EEGFileError(path, "file too small")
+        magic, size = FILE_HEADER.unpack(data)
+        if magic != MAGIC:
+            raise EEGFileError(path, "not an EEG recording")
+        try:
+            self.header = json.loads(self.file.read(size))
+        except ValueError:
+            raise EEGFileError(path, "invalid header")
+        self.data_offset = FILE_HEADER.size + size
+
+        self.version = self.header.get("version", 1)
+        if self.version > VERSION:
+            raise EEGFileError(path, "unknown version %d" % self.version)
+        self.channels = tuple(self.header["channels"])
+        self.sampling_rate = self.header["sampling_rate"]
+        self.start_time = self.header["start_time"]
+        self.dtype = np.dtype(str(self.header["dtype"]))
+        self.quality_sensors = tuple(self.header["quality_sensors"])
+        self.emostate_fields = tuple(str(f) for f in
+                                     self.header["emostate_fields"])
+        self.columns = [str(name) for name, dtype in self.header["columns"]]
+        self.state_dtype = np.dtype([(f, EMOSTATE_DTYPE[f])
+                                     for f in self.emostate_fields])
+        first = len(self.channels) + len(self.quality_sensors)
+        self._field_dtypes = [np.dtype(str(dtype)) for name, dtype in
+                              self.header["columns"][first:]]
+        self.quantizers = [q and Quantizer.from_list(q) for q in
+                           self.header.get("quantizers", ())]
+
+        self.truncated = False    # Whether the last block was incomplete
+        self.data_end = None      # Where the blocks end (if known)
+        self._block_times = None
+        self._map = None
+        self.index = self.read_index()
+        if self.index is None:
+            self.index = self.scan()
+
+    @property
+    def channel_names(self):
+        """The names of the channels"""
+        return tuple(variables.CHANNEL_NAMES.get(c, str(c))
+                     for c in self.channels)
+
+    def __len__(self):
+        """The number of samples"""
+        if len(self.index) == 0:
+            return 0
+        last = self.index[-1]
+        return int(last["first"] + last["samples"])
+
+    @property
+    def duration(self):
+        """The duration of the recording, in seconds"""
+        return len(self) / float(self.sampling_rate)
+
+    # --------------------------------------------------------------- #
+    # Index
+    # --------------------------------------------------------------- #
+
+    def read_block_header(self, data):
+        """Returns a tuple (codec, samples, first sample, time, payload
+        size, crc) from the header of a block (None if it is not one)"""
+        if self.version == 1:
+            magic, N, first, t, size, crc = BLOCK_HEADER_V1.unpack(data)
+            codec = RAW
+        else:
+            magic, codec, N, first, t, size, crc = BLOCK_HEADER.unpack(data)
+        if magic != BLOCK_MAGIC:
+            return None
+        return codec, N, first, t, size, crc
+
+    @property
+    def block_header_size(self):
+        if self.version == 1:
+            return BLOCK_HEADER_V1.size
+        return BLOCK_HEADER.size
+
+    def read_index(self):
+        """Returns the index written at the end of the file, or None if
+        there is none (or it is invalid)"""
+        f = self.file
+        f.seek(0, 2)
+        end = f.tell()
+        if end - self.data_offset < TRAILER.size:
+            return None
+        f.seek(end - TRAILER.size)
+        offset, count, crc, magic = TRAILER.unpack(f.read(TRAILER.size))
+        size = count * INDEX_DTYPE.itemsize
+        if magic != END_MAGIC or offset + size + TRAILER.size != end:
+            return None
+        f.seek(offset)
+        data = f.read(size)
+        if crc32(data) != crc:
+            return None
+        self.data_end = offset
+        return np.frombuffer(data, INDEX_DTYPE)
+
+    def block_headers(self):
+        """Iterates over the blocks, reading their headers one after the
+        other. Yields tuples (block offset, codec, samples, first sample,
+        time, payload size, crc)"""
+        f = self.file
+        offset = self.data_offset
+        header_size = self.block_header_size
+        self.truncated = False
+        while self.data_end is None or offset < self.data_end:
+            f.seek(offset)
+            data = f.read(header_size)
+            if not data:
+                return
+            if len(data) < header_size:
+                self.truncated = True
+                return
+            header = self.read_block_header(data)
+            if header is None:
+                if self.data_end is None:
+                    # The index of a file that was not closed properly,
+                    # or garbage at the end of the file
+                    self.truncated = True
+                    return
+                raise EEGFileError(self.path, "invalid block at %d" % offset)
+            yield (offset,) + header
+            offset += header_size + header[4]
+
+    def scan(self, verify=False):
+        """Returns the index of the blocks, built from their headers. If
+        VERIFY is set, the scan stops at the first block that is not
+        valid (whose CRC does not match, or whose samples do not follow
+        those of the previous block)"""
+        f = self.file
+        f.seek(0, 2)
+        end = f.tell()
+        index = []
+        expected = 0
+        for offset, codec, N, first, t, size, crc in self.block_headers():
+            if offset + self.block_header_size + size > end:
+                self.truncated = True
+                break
+            if verify:
+                f.seek(offset + self.block_header_size)
+                if first != expected or crc32(f.read(size)) != crc:
+                    self.truncated = True
+                    break
+                expected = first + N
+            index.append((offset, first, N, t))
+        return np.array(index, dtype=INDEX_DTYPE)
+
+    def block_end(self, i):
+        """Returns the offset of the end of the Ith block of the index"""
+        f = self.file
+        offset = int(self.index[i]["offset"])
+        f.seek(offset)
+        header = self.read_block_header(f.read(self.block_header_size))
+        if header is None:
+            raise EEGFileError(self.path, "invalid block %d" % i)
+        return offset + self.block_header_size + header[4]
+
+    # --------------------------------------------------------------- #
+    # Blocks
+    # --------------------------------------------------------------- #
+
+    def decode_block(self, payload, N, codec=RAW):
+        """Returns a tuple (samples, quality, states) with the columns
+        of a block of N samples (uncompressed)"""
+        C = len(self.channels)
+        Q = len(self.quality_sensors)
+        if codec & DELTA16:
+            samples, offset = decode_columns(payload, N, self.dtype,
+                                             self.quantizers)
+        else:
+            samples = np.frombuffer(payload, self.dtype,
+                                    C * N).reshape(C, N).T
+            offset = C * N * self.dtype.itemsize
+        quality = np.frombuffer(payload, np.int8, Q * N,
+                                offset).reshape(Q, N).T
+        offset += Q * N
+        states = np.zeros(N, dtype=self.state_dtype)
+        for field, dtype in zip(self.emostate_fields, self._field_dtypes):
+            states[field] = np.frombuffer(payload, dtype, N, offset)
+            offset += N * dtype.itemsize
+        return samples, quality, states
+
+    def read_block(self, i):
+        """Returns a tuple (samples, quality, states) with the contents of
+        the Ith block of the index"""
+        f = self.file
+        f.seek(int(self.index[i]["offset"]))
+        header = self.read_block_header(f.read(self.block_header_size))
+        if header is None:
+            raise EEGFileError(self.path, "invalid block %d" % i)
+        codec, N, first, t, size, crc = header
+        payload = f.read(size)
+        if len(payload) < size or crc32(payload) != crc:
+            raise EEGFileError(self.path, "corrupted block %d" % i)
+        if codec & ~CODEC_FLAGS:
+            raise EEGFileError(self.path, "unknown codec %d" % codec)
+        if codec & ZLIB:
+            payload = zlib.decompress(payload)
+        return self.decode_block(payload, N, codec)
+
+    @property
+    def mapped(self):
+        """The file, mapped in memory (read-only)"""
+        if self._map is None:
+            self._map = np.memmap(self.path, dtype=np.uint8, mode="r")
+        return self._map
+
+    def block_samples(self, i):
+        """Returns the samples of the Ith block of the index (a samples x
+        channels array).  The samples of raw blocks are a view of the
+        file mapped in memory, which is only read when it is used (and
+        whose CRC is not checked).  Other blocks (compressed, or encoded
+        with DELTA16) are read and decoded with read_block()"""
+        m = self.mapped
+        offset = int(self.index[i]["offset"])
+        size = self.block_header_size
+        header = self.read_block_header(m[offset:offset + size].tostring())
+        if header is None:
+            raise EEGFileError(self.path, "invalid block %d" % i)
+        codec, N = header[:2]
+        if codec != RAW:
+            return self.read_block(i)[0]
+        start = offset + size
+        C = len(self.channels)
+        samples = m[start:start + C * N * self.dtype.itemsize]
+        return samples.view(self.dtype).reshape(C, N).T
+
+    def blocks(self, start=0, stop=None):
+        """Iterates over the blocks (from block START to block STOP),
+        yielding tuples (first sample, time, samples, quality, states).
+        The samples are a (samples x channels) array"""
+        for i in xrange(*slice(start, stop).indices(len(self.index))):
+            entry = self.index[i]
+            samples, quality, states = self.read_block(i)
+            yield (int(entry["first"]), float(entry["time"]),
+                   samples, quality, states)
+
+    def _join(self, blocks):
+        if not blocks:
+            C = len(self.channels)
+            Q = len(self.quality_sensors)
+            return (np.zeros((0, C), self.dtype), np.zeros((0, Q), np.int8),
+                    np.zeros(0, self.state_dtype))
+        return tuple(np.concatenate(b) for b in zip(*blocks)[2:])
+
+    def read(self):
+        """Returns a tuple (samples, quality, states) with the whole
+        recording"""
+        return self._join(list(self.blocks()))
+
+    # --------------------------------------------------------------- #
+    # Random access
+    # --------------------------------------------------------------- #
+
+    def read_samples(self, start, stop):
+        """Returns a tuple (samples, quality, states) with the samples
+        from START to STOP (indices in the recording). Only the blocks
+        that hold them are read"""
+        start, stop, step = slice(start, stop).indices(len(self))
+        if start >= stop:
+            return self._join([])
+        first = self.index["first"]
+        i = np.searchsorted(first, start, side="right") - 1
+        j = np.searchsorted(first, stop, side="left")
+        blocks = list(self.blocks(i, j))
+        offset = start - int(first[i])
+        return tuple(a[offset:offset + stop - start]
+                     for a in self._join(blocks))
+
+    @property
+    def block_times(self):
+        """The time of the first sample of every block, in seconds from
+        the start of the recording. The times recorded are used if they
+        increase (the TIMESTAMP channel can start over, e.g., after a
+        reconnection) and are all finite; otherwise, the times are
+        counted in samples"""
+        if self._block_times is None:
+            times = self.index["time"] - self.index["time"][:1]
+            if not np.all(np.isfinite(times)) or np.any(np.diff(times) < 0):
+                times = self.index["first"] / float(self.sampling_rate)
+            self._block_times = times
+        return self._block_times
+
+    def time_to_sample(self, t):
+        """Returns the index of the sample at T seconds from the start of
+        the recording (from the time of the first sample)"""
+        if len(self.index) == 0:
+            return 0
+        times = self.block_times
+        i = max(np.searchsorted(times, t, side="right") - 1, 0)
+        entry = self.index[i]
+        offset = int(round((t - times[i]) * self.sampling_rate))
+        return int(entry["first"]) + min(max(offset, 0),
+                                         int(entry["samples"]))
+
+    def read_time(self, start, stop):
+        """Returns a tuple (samples, quality, states) with the samples
+        between START and STOP seconds from the start of the recording"""
+        return self.read_samples(self.time_to_sample(start),
+                                 self.time_to_sample(stop))
+
+    def close(self):
+        """Closes the file (the memory map is released once all the views
+        of it are gone)"""
+        self.file.close()
+        self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+def recover_eeg_file(path, output=None, check=False):
+    """Checks the recording at PATH and, if it was not closed properly
+    (e.g., after a crash), rebuilds its index from the blocks that are
+    complete and valid: in place (discarding whatever follows them), or
+    in a copy at OUTPUT. Nothing is written if CHECK is set.  Returns a
+    dictionary with the state of the file ("intact", "recovered" or
+    "checked"), the number of valid blocks and samples, the index, time
+    stamp and time (in seconds from the start) of the last valid
+    sample, and the bytes discarded"""
+    with EEGFileReader(path) as reader:
+        intact = reader.data_end is not None
+        if not intact:
+            reader.index = reader.scan(verify=True)
+            reader._block_times = None
+        index = reader.index
+        f = reader.file
+        f.seek(0, 2)
+        size = f.tell()
+        if len(index):
+            end = reader.block_end(len(index) - 1)
+        else:
+            end = reader.data_offset
+
+        report = {"path" : path, "blocks" : len(index),
+                  "samples" : len(reader), "valid_bytes" : end,
+                  "discarded_bytes" : 0 if intact else size - end,
+                  "last_sample" : None, "last_timestamp" : None,
+                  "last_time" : None}
+        if len(index):
+            samples = reader.read_block(len(index) - 1)[0]
+            N = int(index[-1]["samples"])
+            report["last_sample"] = len(reader) - 1
+            report["last_time"] = (reader.block_times[-1] +
+                                   (N - 1) / float(reader.sampling_rate))
+            if variables.ED_TIMESTAMP in reader.channels:
+                column = reader.channels.index(variables.ED_TIMESTAMP)
+                report["last_timestamp"] = float(samples[-1, column])
+
+        if intact and output is None:
+            report["state"] = "intact"
+            return report
+        if check:
+            report["state"] = "checked"
+            return report
+
+        footer = encode_index(index, end)
+        if output is None:
+            f.close()
+            with open(path, "r+b") as out:
+                out.truncate(end)
+                out.seek(end)
+                out.write(footer)
+                out.flush()
+                os.fsync(out.fileno())
+        else:
+            f.seek(0)
+            with open(output, "wb") as out:
+                remaining = end
+                while remaining > 0:
+                    data = f.read(min(remaining, 1 << 20))
+                    if not data:
+                        break
+                    out.write(data)
+                    remaining -= len(data)
+                out.write(footer)
+        report["state"] = "intact" if intact else "recovered"
+        return report
+
+
+def read_eeg_file(path):
+    """Reads a whole recording. Returns a tuple (header, samples,
+    quality, states)"""
+    with EEGFileReader(path) as reader:
+        samples, quality, states = reader.read()
+    return reader.header, samples, quality, states
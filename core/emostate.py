@@ -0,0 +1,98 @@
+## ---------------------------------------------------------------- ##
+## EMOSTATE.py
+## ---------------------------------------------------------------- ##
+## EmoStates as NumPy records.  Every EmoState received from the
+## EmoEngine is read once, into a row of a structured array, and kept
+## in a per-user history (buffers.RecordBuffer) that can be queried by
+## time:
+##
+##     states = manager.state_history.between(t0, t1)
+##     blinks = states["time"][states["blink"] == 1]
+##
+## Records are plain values, so they can be passed to other threads
+## safely (unlike the c_float objects used by the EDK calls).
+## ---------------------------------------------------------------- ##
+
+from ctypes import *
+import numpy as np
+
+__all__ = ["EMOSTATE_DTYPE", "EmoStateReader", "empty_emostate"]
+
+EMOSTATE_DTYPE = np.dtype([
+    ("time", np.double),             # ES_GetTimeFromStart (s)
+    # Expressiv: eyes
+    ("blink", np.int8),
+    ("left_wink", np.int8),
+    ("right_wink", np.int8),
+    ("eyes_open", np.int8),
+    ("looking_left", np.int8),
+    ("looking_right", np.int8),
+    ("left_eyelid", np.float32),     # 0 (closed) ... 1 (open)
+    ("right_eyelid", np.float32),
+    # Expressiv: face (EXP_* actions)
+    ("upper_face_action", np.int32),
+    ("upper_face_power", np.float32),
+    ("lower_face_action", np.int32),
+    ("lower_face_power", np.float32),
+    # Affectiv scores
+    ("excitement_short", np.float32),
+    ("excitement_long", np.float32),
+    ("engagement", np.float32),
+    ("meditation", np.float32),
+    ("frustration", np.float32),
+    # Cognitiv (COG_* actions)
+    ("cognitiv_action", np.int32),
+    ("cognitiv_power", np.float32),
+    # The headset that sent it, and its wireless signal at the time
+    ("user_id", np.int32),
+    ("wireless_signal", np.int8)])
+
+
+def empty_emostate():
+    """Returns a record with all the fields set to zero (eyes open)"""
+    record = np.zeros(1, dtype=EMOSTATE_DTYPE)[0]
+    record["eyes_open"] = 1
+    record["left_eyelid"] = 1.0
+    record["right_eyelid"] = 1.0
+    return record
+
+
+class EmoStateReader(object):
+    """Reads the values of an EmoState handle, in the order of the
+    fields of EMOSTATE_DTYPE"""
+    def __init__(self, edk):
+        self.edk = edk
+        # Output arguments of ES_ExpressivGetEyelidState
+        self.left_eyelid = c_float(1)
+        self.right_eyelid = c_float(1)
+        self._left_pointer = pointer(self.left_eyelid)
+        self._right_pointer = pointer(self.right_eyelid)
+
+    def read(self, state, user_id=0):
+        """Returns a tuple with the values of the EmoState STATE (of the
+        given USER_ID)"""
+        edk = self.edk
+        edk.ES_ExpressivGetEyelidState(state, self._left_pointer,
+                                       self._right_pointer)
+        return (edk.ES_GetTimeFromStart(state),
+                edk.ES_ExpressivIsBlink(state),
+                edk.ES_ExpressivIsLeftWink(state),
+                edk.ES_ExpressivIsRightWink(state),
+                edk.ES_ExpressivIsEyesOpen(state),
+                edk.ES_ExpressivIsLookingLeft(state),
+                edk.ES_ExpressivIsLookingRight(state),
+                self.left_eyelid.value,
+                self.right_eyelid.value,
+                edk.ES_ExpressivGetUpperFaceAction(state),
+                edk.ES_ExpressivGetUpperFaceActionPower(state),
+                edk.ES_ExpressivGetLowerFaceAction(state),
+                edk.ES_ExpressivGetLowerFaceActionPower(state),
+                edk.ES_AffectivGetExcitementShortTermScore(state),
+                edk.ES_AffectivGetExcitementLongTermScore(state),
+                edk.ES_AffectivGetEngagementBoredomScore(state),
+                edk.ES_AffectivGetMeditationScore(state),
+                edk.ES_AffectivGetFrustrationScore(state),
+                edk.ES_CognitivGetCurrentAction(state),
+                edk.ES_CognitivGetCurrentActionPower(state),
+                user_id,
+                edk.ES_GetWirelessSignalStatus(state))
@@ -0,0 +1,160 @@
+## ---------------------------------------------------------------- ##
+## GAPS.py
+## ---------------------------------------------------------------- ##
+## Detection of lost samples. The headset numbers its packets with the
+## COUNTER channel, which runs from 0 to 128 and then wraps around; a
+## jump in the counter means that packets were lost on the way (e.g.,
+## because of a weak wireless signal).
+##
+## Every block is checked as a whole: the number of samples lost
+## before every sample is the difference between its counter and the
+## previous one, minus one, modulo the counter period.  The gaps can
+## optionally be filled, with NaN or with values interpolated between
+## the samples around them, so that the samples stay evenly spaced.
+## ---------------------------------------------------------------- ##
+
+import numpy as np
+import variables
+from buffers import RecordBuffer
+
+__all__ = ["GapDetector", "GAP_DTYPE", "FILL_POLICIES", "first_time"]
+
+# A gap: the index of the first sample received after it (counting all
+# the samples received since the detector was created) and the number
+# of samples lost
+GAP_DTYPE = np.dtype([("sample", np.int64), ("lost", np.int32)])
+
+# How gaps can be filled (None leaves them out)
+FILL_POLICIES = (None, "nan", "interpolate")
+
+
+def first_time(data, column, sampling_rate):
+    """Returns the time of the first sample of DATA, from the first
+    finite value of its time COLUMN (the rows of a gap filled with NaN
+    have no time), back-dated by its row.  Returns None if no row of
+    DATA has a time"""
+    finite = np.flatnonzero(np.isfinite(data[:, column]))
+    if not len(finite):
+        return None
+    i = finite[0]
+    return float(data[i, column]) - i / float(sampling_rate)
+
+
+class GapDetector(object):
+    """Detects the samples lost in a stream of blocks, from the values
+    of the counter channel (COLUMN).  The last HISTORY_SIZE gaps are
+    kept in 'gaps', a RecordBuffer of GAP_DTYPE records"""
+    def __init__(self, column=0, modulus=variables.COUNTER_MODULUS,
+                 history_size=1024):
+        self.column = column
+        self.modulus = modulus
+        self.received = 0         # Samples received
+        self.lost_samples = 0     # Samples lost
+        self.gap_count = 0        # Number of gaps
+        self.gaps = RecordBuffer(history_size, GAP_DTYPE,
+                                 time_field="sample")
+        self._last = None         # Last sample of the last block
+        self._previous = None     # Last sample of the block before it
+
+    def reset(self):
+        """Forgets the previous block (e.g., after a reconnection, when
+        the counter starts over)"""
+        self._last = self._previous = None
+
+    def lost_before(self, block):
+        """Returns an array with the number of samples lost before every
+        sample of BLOCK (without updating the detector)"""
+        counter = np.rint(block[:, self.column]).astype(np.int64)
+        previous = np.empty_like(counter)
+        previous[1:] = counter[:-1]
+        if self._last is None:
+            previous[0] = counter[0] - 1
+        else:
+            previous[0] = int(round(self._last[self.column]))
+        return (counter - previous - 1) % self.modulus
+
+    def detect(self, block):
+        """Checks a (samples x channels) block, updating the counts and
+        the gap history. Returns a tuple (positions, lost) with the
+        index in BLOCK of the first sample after every gap, and the
+        number of samples lost in it"""
+        if block.shape[0] == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty
+
+        lost = self.lost_before(block)
+        positions = np.flatnonzero(lost)
+        lost = lost[positions]
+
+        self._previous = self._last
+        self._last = block[-1].copy()
+        for position, n in zip(positions, lost):
+            self.gaps.append((self.received + position, n))
+        self.received += block.shape[0]
+        self.lost_samples += int(lost.sum())
+        self.gap_count += len(positions)
+        return positions, lost
+
+    def fill(self, block, positions, lost, policy="nan"):
+        """Returns a copy of BLOCK with a row inserted for every lost
+        sample (see detect(), which must have been given BLOCK last).
+        The counter of the inserted rows is set to the missing values;
+        the other channels are NaN, or (with the "interpolate" policy)
+        interpolated linearly between the samples around the gap"""
+        N, C = block.shape
+        if len(positions) == 0:
+            return block
+
+        # Rows of the filled block that receive the samples of BLOCK
+        shift = np.zeros(N, dtype=np.int64)
+        shift[positions] = lost
+        rows = np.arange(N) + np.cumsum(shift)
+        filled = np.empty((rows[-1] + 1, C), dtype=block.dtype)
+        filled.fill(np.nan)
+        filled[rows] = block
+
+        missing = np.ones(filled.shape[0], dtype=bool)
+        missing[rows] = False
+        missing = np.flatnonzero(missing)
+
+        if policy == "interpolate":
+            # Every missing row lies between two received samples: the
+            # last sample of the previous block (row -1) or a sample of
+            # BLOCK (the row before the gap) and the sample after it.
+            # (There is no gap before the first block.)
+            after = np.searchsorted(rows, missing)
+            right = block[after]
+            if self._previous is not None:
+                known = np.vstack((self._previous[np.newaxis], block))
+                known_rows = np.concatenate(([-1], rows))
+                left = known[after]
+                left_rows = known_rows[after]
+            else:
+                left = block[after - 1]
+                left_rows = rows[after - 1]
+            weight = ((missing - left_rows) /
+                      np.double(rows[after] - left_rows))[:, np.newaxis]
+            filled[missing] = left + (right - left) * weight
+        elif policy != "nan":
+            raise ValueError("Unknown gap fill policy: %r" % (policy,))
+
+        first = int(round(block[0, self.column])) - rows[0]
+        filled[missing, self.column] = (first + missing) % self.modulus
+        return filled
+
+    def process(self, block, policy=None):
+        """Detects the gaps of BLOCK and fills them according to POLICY
+        (one of FILL_POLICIES). Returns a tuple (block, positions, lost);
+        the returned block is BLOCK itself if nothing was filled"""
+        positions, lost = self.detect(block)
+        if policy is not None and len(positions):
+            filled = self.fill(block, positions, lost, policy)
+        else:
+            filled = block
+        return filled, positions, lost
+
+    def snapshot(self):
+        """Returns a dictionary with the counts"""
+        return {"received" : self.received,
+                "lost_samples" : self.lost_samples,
+                "gaps" : self.gap_count}
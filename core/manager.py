@@ -4,7 +4,7 @@
 ## data in real time
 ## ---------------------------------------------------------------- ##
 
-from threading import Thread
+from threading import Thread, Lock
 import ctypes
 import sys
 import os
@@ -13,7 +13,17 @@ from ctypes import *
 import numpy as np
 import variables
 import time
+from buffers import RingBuffer, RecordBuffer
+from dispatch import ListenerWorker, listener_name
+from stats import Stats, StatsDumper, clock, SIZE_EDGES
+from acquisition import UserAcquisition, new_quality_array
+from streaming import EventStream, channel_columns, select_channels
+from emostate import EMOSTATE_DTYPE, EmoStateReader, empty_emostate
+from edk import load_library
+from shared import PATH_TEMPLATE
+from server import StreamServer
 import types
+from contextlib import contextmanager
 from ctypes.util import find_library
 
 
@@ -22,6 +32,10 @@ __all__ = ["EmotivManager", "ConnectionError", "LibraryNotFoundError",
 
 EDK_DLL_PATH = ".\\edk.dll"
 
+# The contact quality channels that correspond to actual sensors
+QUALITY_SENSORS = np.zeros(variables.CONTACT_QUALITY_CHANNELS, dtype=bool)
+QUALITY_SENSORS[list(variables.COMPLETE_SENSORS)] = True
+
 
 class ConnectionError(Exception):
     """A specific error when the DLL is not found"""
@@ -56,27 +70,80 @@ class Sensor(object):
 
 
 class EmotivManager(object):
-    """A generic manager for an Emotiv 14-ch headset"""
-    def __init__(self ):
-        self.edk = None
-        self.edk_loaded = False
-        self.load_edk()
+    """A generic manager for an Emotiv 14-ch headset.
+    By default, the manager loads the EDK library; any other object
+    implementing the same functions (see backend.EmoEngineBackend, or
+    replay.ReplayEngine) can be passed as EDK instead.
+    CHANNELS are the EDK data channels acquired at every tick, in the
+    order of the columns of the sample blocks."""
+    def __init__(self, edk=None, channels=variables.CHANNELS):
+        self.edk = edk
+        self.channels = tuple(channels)
+        self.edk_loaded = edk is not None
+        if edk is None:
+            self.load_edk()
         self._connected = False # Whether connected or not
         self._has_user = False  # Whether there is a user or not
         self._monitoring = False
         self._monitor_interval = 0.065
+        
+        # Event draining and scheduling. When max_events_per_tick is
+        # None, every tick handles all the queued events.
+        self.max_events_per_tick = None
+        self.events_drained = 0       # Events handled in the last tick
+        self.max_events_drained = 0   # Largest number handled in one tick
+        self.tick_overruns = 0        # Ticks that exceeded the interval
         self._headset_connected = False
         
+        # How the samples lost on the way are filled in the blocks (see
+        # gaps.FILL_POLICIES): by default, they are only reported
+        self.gap_fill = None
+        
+        # Where the histories of the users are published for other
+        # processes (see publish()), or None
+        self.publish_path = None
+        self._servers = []            # See serve()
+        
+        # Timings of the pipeline stages (see stats.py), disabled by
+        # default
+        self.instrumentation = Stats()
+        self._stats_dumper = None
+        self._listener_names = {}
+        
+        # The lists of listeners are never changed in place: they are
+        # replaced (under _listener_lock), so that the threads that
+        # dispatch events iterate over a consistent snapshot
         self._listeners = dict(zip(ccdl.EVENTS, [[] for i in ccdl.EVENTS]))
+        self._listener_lock = Lock()
         
-        self._sensor_quality = dict(zip(variables.COMPLETE_SENSORS,
-                                    [0] * len(variables.COMPLETE_SENSORS)))
+        # Contact quality is kept as an array indexed by sensor ID, and
+        # read (whenever possible) with a single EDK call into a buffer.
+        self._sensor_quality = new_quality_array()
+        self._quality_buffer = np.zeros(variables.CONTACT_QUALITY_CHANNELS,
+                                        dtype=np.intc)
+        self._quality_from_all_channels = hasattr(
+            self.edk, "ES_GetContactQualityFromAllChannels")
         
-        self._state_data = np.zeros((0, 6), order="C", dtype=np.double)
+        self._state_data = empty_emostate()
         self._battery_level = 0
         self._wireless_signal = variables.EDK_NO_SIGNAL
         
-        self._sensor_data = np.zeros((0, len(variables.CHANNELS)),
+        # Users (headsets) currently known to the EmoEngine, each with
+        # its own data handle and buffers (see acquisition.py). The
+        # primary user is the first one added; the sensor_* properties
+        # refer to it. If acquisition_workers is True, every user's data
+        # is collected by its own thread; otherwise, by the monitor.
+        self.users = {}
+        self.primary_user = None
+        self.acquisition_workers = True
+        
+        self._sampling_rate = 128
+        self._buffer_seconds = 1.0  # Size of the EDK data buffer
+        self._history_length = 10   # Seconds of data kept for every user
+        self.state_history_size = 4096  # EmoStates kept for every user
+        self._empty_history = RingBuffer(1, len(self.channels))
+        self._empty_state_history = RecordBuffer(1, EMOSTATE_DTYPE)
+        self._sensor_data = np.zeros((0, len(self.channels)),
                                       order="C", dtype=np.double)
         #self._sensor_quality_data = np.zeros((0, len(variables.CHANNELS)),
         #                                      order="C", dtype=np.int)
@@ -109,45 +176,19 @@ class EmotivManager(object):
         self.option      = c_int(0)
         self.state     = c_int(0)
         
-        ## Additional data needed to make sense of blinks
-        self.left_eyelid = c_float(1)
-        self.right_eyelid = c_float(1)
-    
-    def load_edk(self):
-        """Loads the EDK.dll library"""
-        if os.path.exists( EDK_DLL_PATH ):
-            self.edk = cdll.LoadLibrary( EDK_DLL_PATH )
-            
-            # Sets the correct values for the EDK and EmoState functions
-            self.edk.EE_EmoEngineEventCreate.restype = c_void_p
-
-            self.edk.EE_EmoEngineEventGetEmoState.argtypes = [c_void_p,
-                                                              c_void_p]
-            self.edk.EE_EmoEngineEventGetEmoState.restype = c_int
-
-            self.edk.ES_GetTimeFromStart.argtypes = [c_void_p]
-            self.edk.ES_GetTimeFromStart.restype = c_float
-
-            self.edk.EE_EmoStateCreate.restype = c_void_p
-
-            self.edk.ES_GetWirelessSignalStatus.restype = c_int
-            self.edk.ES_GetWirelessSignalStatus.argtypes = [c_void_p]
-
-            self.edk.ES_ExpressivIsBlink.restype = c_int
-            self.edk.ES_ExpressivIsBlink.argtypes = [c_void_p]
-
-            self.edk.ES_AffectivGetEngagementBoredomScore.restype = c_float
-            self.edk.ES_AffectivGetEngagementBoredomScore.argtypes = [c_void_p]
+        ## Reads the EmoStates into records (see emostate.py)
+        self._emostate_reader = EmoStateReader(self.edk)
+    
+    def load_edk(self, path=EDK_DLL_PATH):
+        """Loads the EDK.dll library, with the prototypes of all its
+        functions (see edk.py)"""
+        if os.path.exists( path ):
+            self.edk = load_library( path )
             
-            self.edk.ES_GetBatteryChargeLevel.restype = c_void_p
-            self.edk.ES_GetBatteryChargeLevel.argtypes = [c_void_p, 
-                                                          POINTER(c_int),
-                                                          POINTER(c_int)]
-
             # Finally, flag the library as loaded.
             self.edk_loaded = True
         else:
-            raise LibraryNotFoundError(EDK_DLL_PATH)
+            raise LibraryNotFoundError(path)
     
     @property
     def connected(self):
@@ -157,15 +198,19 @@ class EmotivManager(object):
     def connected(self, val):
         self._connected = val
     
-    def connect(self):
-        """Attempts a connection to the headset"""
+    def connect(self, remote=None):
+        """Attempts a connection to the headset, or to the EmoComposer
+        (or remote EmoEngine) at REMOTE, a (host, port) tuple"""
         if self.connected:
             # If trying to connect while connected, do nothing
             pass            
         else:
             # If trying to connect while disconnected, then
             # attempt to connect to an Emotive engine
-            conn = self.edk.EE_EngineConnect("Emotiv Systems-5")
+            if remote is None:
+                conn = self.edk.EE_EngineConnect("Emotiv Systems-5")
+            else:
+                conn = self.edk.EE_EngineRemoteConnect(remote[0], remote[1])
             
             if conn == variables.EDK_OK:
                 # If the result is 0, the connection was successful.
@@ -226,14 +271,20 @@ class EmotivManager(object):
             else:
                 # This means we are stopping monitorng
                 self._monitoring = False
+                for acq in self.users.values():
+                    acq.stop()
+                    acq.acquiring = False
                 self.headset_connected = False
         else:
             if bool:
                 self._monitoring = True
+                self.events_drained = 0
+                self.max_events_drained = 0
+                self.tick_overruns = 0
                 
-                # Sets the buffer to collect data
-                self.hData = self.edk.EE_DataCreate()
-                self.edk.EE_DataSetBufferSizeInSec( c_float(1) ) # self.monitor_interval
+                # Sets the buffer to collect data (the data handles are
+                # created for every user, when it is added)
+                self.edk.EE_DataSetBufferSizeInSec(c_float(self._buffer_seconds))
                 
                 # Creates and starts the monitor
                 self._monitor = Thread(target=self.monitor)
@@ -243,102 +294,182 @@ class EmotivManager(object):
     def monitor(self):
         """The one function that continuously monitors the status of a
         headset (and whether a user is connected or not).
-        If sampling is enabled, data will be connected."""
-
+        If sampling is enabled, data will be connected.
+        
+        At every tick, the monitor first handles all the events queued
+        in the EmoEngine, then pulls the EEG data accumulated since the
+        previous tick, and finally sleeps until the next tick is due.
+        """
         counter = 0
+        deadline = time.time()
         
         while self.monitoring:
+            deadline += self.monitor_interval
+            instrumented = self.instrumentation.enabled
+            if instrumented:
+                start = clock()
+            
+            # Handles the queued events...
+            n = self.process_events(counter)
+            self.events_drained = n
+            if n > self.max_events_drained:
+                self.max_events_drained = n
             
+            # ... and then collects the sensor data (unless every user
+            # has its own worker)
+            if not self.acquisition_workers:
+                for acq in self.users.values():
+                    if acq.acquiring:
+                        acq.store_sensor_data()
+            
+            self.execute_event_functions(ccdl.MONITOR_TICK_EVENT, n)
+            
+            if instrumented:
+                self.instrumentation.record("tick", clock() - start)
+                self.instrumentation.record("events_per_tick", n, SIZE_EDGES)
+            
+            # Sleeps only for what is left of this tick. If we are
+            # already late, the tick is counted as an overrun and the
+            # schedule restarts from now (instead of trying to catch up).
+            remaining = deadline - time.time()
+            if remaining > 0:
+                time.sleep(remaining)
+            else:
+                self.tick_overruns += 1
+                if instrumented:
+                    self.instrumentation.count("tick_overruns")
+                deadline = time.time()
+            counter += 1
+    
+    def process_events(self, counter=0):
+        """Handles the events queued in the EmoEngine and returns the
+        number of events processed. All the pending events are drained,
+        unless max_events_per_tick is set to a number"""
+        n = 0
+        limit = self.max_events_per_tick
+        GetNextEvent = self.edk.EE_EngineGetNextEvent
+        instrumentation = self.instrumentation
+        
+        while limit is None or n < limit:
             # Retrieves the next event
-            state = self.edk.EE_EngineGetNextEvent(self.eEvent)
-            #print "[%d] Checked state: %s %s" % (counter, self.has_user, state)
-
+            if instrumentation.enabled:
+                start = clock()
+                state = GetNextEvent(self.eEvent)
+                instrumentation.record("get_next_event", clock() - start)
+            else:
+                state = GetNextEvent(self.eEvent)
+            
             if state == variables.EDK_OK:
-                # If we received an event, it means that we must have an user
-                # (unless the event was UserRemoved)
-                
-                if not self.has_user:
-                    self.has_user = True
-                    
-                # if the call was successful, then we do have a new
-                # event, and we now need to examine its type.
-                
-                eventType = self.edk.EE_EmoEngineEventGetType(self.eEvent)
-                
-                if eventType == variables.EE_User_Added:   # Code 16, 0x0010
-                    #print "[%d] User added" % counter
-                    #if not self.has_user:
-                    #    self.has_user = True
-                    
-                    # Sets the user ID
-                    self.edk.EE_EmoEngineEventGetUserId(self.eEvent, self.user)
-                    self.edk.EE_DataAcquisitionEnable(self.userID,True)
-                    
-                elif eventType == variables.EE_User_Removed:
-                    #print "[%d] User removed" % counter
-                    # This never happens...
-                    self.has_user = False
-                    
-                elif eventType == variables.EE_EmoState_Updated:
-                    #print "[%d] EmoState updated: (%d)"  % (counter, eventType)
-                    
-                    self.execute_event_functions(ccdl.MONITORING_EVENT, None)
-                    
-                    # This is a bunch of quick debug code.
-                    self.edk.EE_EmoEngineEventGetUserId(self.eEvent, self.user)
-                    code = self.edk.EE_EmoEngineEventGetEmoState(self.eEvent, self.eState)
-                    #head = self.edk.ES_GetHeadsetOn(self.eState)
-                    num = self.edk.ES_GetNumContactQualityChannels(self.eState)
-                    t = self.edk.ES_GetTimeFromStart(self.eState)
-                    
-                    # Monitor Battery Level
-                    level = c_int(0)
-                    max_level = c_int(10)
-                    self.edk.ES_GetBatteryChargeLevel(self.eState, pointer(level), pointer(max_level))
-                    self.battery_level = level.value
-                    
-                    # Monitor Wireless Signal
-                    # This is the key marker for connection ---
-                    # when the signal is zero, we lost connection
-                    self.wireless_signal = self.edk.ES_GetWirelessSignalStatus(self.eState)
-                    
-                    # Monitor Sampling Rate
-                    sr = c_uint(0)
-                    self.edk.EE_DataGetSamplingRate(self.userID, pointer(sr))
-                    
-                    # A simple print report for debug
-                    #print("\tSamping rate: %s" % sr)
-                    #print "\tCode: %d, %s" % (code, code is variables.EDK_OK)
-                    #print "\tHeadset on: %d" % head
-                    #print "\tNum of channels: %d" % num
-                    #print "\tTime from start: %10.3f" % (t)
-                    #print "\tBattery: %s/%s" % (level.value, max_level.value)
-                    #print "\tSignal: %s" % (self.wireless_signal)
-                
-                    # Calls all the functions responsible for collecting data.
-                    self.store_sensor_quality()  # Contact quality
-                    self.store_state_data()      # States (blinks, winks, etc.)
-                    self.store_sensor_data()     # Sensor data
-                                    
-                else:
-                    print "[%d] Other event: %d" % (counter, eventType)
+                self.handle_event(counter)
+                n += 1
             
             elif state == variables.EDK_NO_EVENT:
-                # If the state is NO-EVENT, then it likely means that
-                # there is no headset connected, and no data can be acquired.
-                
-                # *** THAT IS ACTUALLY NOT TRUE!! ***
-                #self.has_user = False
-                #print "No event"
-                pass
-
+                # If the state is NO-EVENT, then the queue is empty
+                # (it does not mean that there is no headset connected).
+                break
+            
             else:
                 # Here should raise an exception (probably).
-                print "[%d] Unknown state %d" % (counter, self.state)
-                
-            # After all of this, just sleeps for the amount necessary
-            time.sleep(self.monitor_interval)
-            counter += 1
+                print "[%d] Unknown state %d" % (counter, state)
+                break
+        
+        return n
+    
+    def handle_event(self, counter=0):
+        """Handles the event that was just retrieved into self.eEvent"""
+        # If we received an event, it means that we must have an user
+        # (unless the event was UserRemoved)
+        if not self.has_user:
+            self.has_user = True
+        
+        # Now we need to examine the event type, and the user it
+        # refers to.
+        eventType = self.edk.EE_EmoEngineEventGetType(self.eEvent)
+        self.edk.EE_EmoEngineEventGetUserId(self.eEvent, self.user)
+        user_id = self.userID.value
+        
+        if eventType == variables.EE_User_Added:   # Code 16, 0x0010
+            self.add_user(user_id)
+            
+        elif eventType == variables.EE_User_Removed:
+            self.remove_user(user_id)
+            
+        elif eventType == variables.EE_EmoState_Updated:
+            self.execute_event_functions(ccdl.MONITORING_EVENT, None,
+                                         user=user_id)
+            
+            # All the values are read first, and then stored (which
+            # calls the listeners)
+            instrumented = self.instrumentation.enabled
+            if instrumented:
+                start = clock()
+            
+            code = self.edk.EE_EmoEngineEventGetEmoState(self.eEvent, self.eState)
+            
+            # Battery Level
+            level = c_int(0)
+            max_level = c_int(10)
+            self.edk.ES_GetBatteryChargeLevel(self.eState, pointer(level), pointer(max_level))
+            
+            # Wireless Signal
+            signal = self.edk.ES_GetWirelessSignalStatus(self.eState)
+            
+            # Contact quality and states (blinks, winks, etc.). EEG
+            # data is pulled at every tick, independently of the events.
+            timestamp = self.edk.ES_GetTimeFromStart(self.eState)
+            quality = self.read_sensor_quality()
+            state = self._emostate_reader.read(self.eState, user_id)
+            
+            if instrumented:
+                self.instrumentation.record("emostate_read", clock() - start)
+            
+            self.battery_level = level.value
+            
+            # The wireless signal is the key marker for connection ---
+            # when the signal is zero, we lost connection
+            self.wireless_signal = signal
+            
+            self.set_sensor_quality(quality, user_id, timestamp)
+            self.set_state_data(state, user_id)
+                            
+        else:
+            print "[%d] Other event: %d" % (counter, eventType)
+
+    def add_user(self, user_id):
+        """Starts acquiring the data of a newly added user"""
+        if user_id not in self.users:
+            sr = c_uint(0)
+            self.edk.EE_DataGetSamplingRate(user_id, pointer(sr))
+            self.users[user_id] = UserAcquisition(self, user_id, sr.value)
+            if self.publish_path is not None:
+                self.users[user_id].publish(self.publish_path % user_id)
+            if self.primary_user is None:
+                self.primary_user = user_id
+        
+        acq = self.users[user_id]
+        acq.enable()
+        if self.acquisition_workers:
+            acq.start()
+        self.execute_event_functions(ccdl.USER_EVENT, user_id, user=user_id)
+    
+    def remove_user(self, user_id):
+        """Stops acquiring the data of a removed user"""
+        acq = self.users.pop(user_id, None)
+        if acq is not None:
+            acq.free()
+        if self.primary_user == user_id:
+            self.primary_user = min(self.users) if self.users else None
+        
+        self.execute_event_functions(ccdl.USER_EVENT, user_id, user=user_id)
+        if not self.users:
+            self.has_user = False
+    
+    def get_user(self, user_id=None):
+        """Returns the UserAcquisition object of a given user (by
+        default, of the primary user), or None"""
+        if user_id is None:
+            user_id = self.primary_user
+        return self.users.get(user_id)
 
     @property
     def headset_connected( self ):
@@ -358,60 +489,65 @@ class EmotivManager(object):
     ## and stores it in an internal table, which is dispatched to
     ## the SENSOR_DATA event listeners.
     ##
-    def store_sensor_data(self, C=len(variables.CHANNELS)):
-        """Collects the new data at every monitor interval"""
-        
-        # Updates the data array
-        self.edk.EE_DataUpdateHandle(0, self.hData)
-        self.edk.EE_DataGetNumberOfSample(self.hData, self.nSamplesTaken)
-        N = self.nSamplesTaken[0]
-        
-        if N != 0:   # Only if we have collected > 0 samples
-            # Create the C-style array for storing the data
-            arr = (ctypes.c_double * N)()
-            ctypes.cast(arr, ctypes.POINTER(ctypes.c_double))
-            
-            # Create a numpy array and copy the C-style array
-            # data into it.
-            data = np.zeros((N, C))
-            for sample in range(N):
-                for channel in range(C):
-                    self.edk.EE_DataGet(self.hData,
-                                        variables.CHANNELS[channel],
-                                        byref(arr), N)
-                    data[sample, channel] = arr[sample]
-            
-            # Save data into an internal array
-            self.sensor_data = data
-        
-    def store_sensor_quality(self):
-        """Reads the sensor quality"""
-        Q = {}
-        for sensor in variables.COMPLETE_SENSORS:
-            Q[sensor] = self.edk.ES_GetContactQuality(self.eState, sensor);
-            
-        self.sensor_quality = Q
+    @property
+    def buffer_seconds(self):
+        """The size of the EDK data buffer, in seconds"""
+        return self._buffer_seconds
+    
+    @property
+    def history_length(self):
+        """The number of seconds of data kept in sensor_history"""
+        return self._history_length
+    
+    @history_length.setter
+    def history_length(self, val):
+        """Sets the length of the history (and re-allocates the buffers)"""
+        if val != self._history_length:
+            self._history_length = val
+            for acq in self.users.values():
+                acq.allocate_sensor_history()
+    
+    @property
+    def sampling_rate(self):
+        """The default sampling rate of the headsets (in Hz)"""
+        return self._sampling_rate
+    
+    @sampling_rate.setter
+    def sampling_rate(self, val):
+        """Sets the default sampling rate"""
+        self._sampling_rate = val
+    
+    @property
+    def sensor_history(self):
+        """The ring buffer with the latest samples of the primary user"""
+        acq = self.get_user()
+        if acq is None:
+            return self._empty_history
+        return acq.sensor_history
+    
+    def store_sensor_quality(self, user_id=None, timestamp=None):
+        """Reads the sensor quality (of the EmoState at TIMESTAMP)"""
+        self.set_sensor_quality(self.read_sensor_quality(), user_id,
+                                timestamp)
+    
+    def read_sensor_quality(self):
+        """Reads the sensor quality of the current EmoState into a
+        buffer (indexed by sensor ID), and returns it"""
+        Q = self._quality_buffer
+        if self._quality_from_all_channels:
+            self.edk.ES_GetContactQualityFromAllChannels(self.eState, Q,
+                                                         len(Q))
+        else:
+            for sensor in variables.COMPLETE_SENSORS:
+                Q[sensor] = self.edk.ES_GetContactQuality(self.eState, sensor)
+        return Q
 
 
-    def store_state_data(self):
-        """Reads the EmoState data (blinks, winks, etc.)"""
-        # Gets the data 
-        blink = self.edk.ES_ExpressivIsBlink(self.eState)      # int
-        lwink = self.edk.ES_ExpressivIsLeftWink(self.eState)   # int
-        rwink = self.edk.ES_ExpressivIsRightWink(self.eState)  # int
-        eopen = self.edk.ES_ExpressivIsEyesOpen(self.eState)   # int
-        
-        # these are two floats
-        self.edk.ES_ExpressivGetEyelidState(self.eState,
-                                            pointer(self.left_eyelid),
-                                            pointer(self.right_eyelid))
-        
-        # Create the dictionary and set it.
-        S = {"Blink" : blink, "LeftWink" : lwink,
-             "RightWink" : rwink, "EyesOpen" : eopen,
-             "LeftEyeLid" : self.left_eyelid,
-             "RightEyelid" : self.right_eyelid}
-        self.state_data = S
+    def store_state_data(self, user_id=None):
+        """Reads the EmoState data (blinks, winks, scores, etc.)"""
+        self.set_state_data(self._emostate_reader.read(self.eState,
+                                                       user_id or 0),
+                            user_id)
 
 
     @property
@@ -471,47 +607,126 @@ class EmotivManager(object):
     
     @property
     def sensor_quality(self):
-        """An array containing the recording quality of each sensor"""
-        return self._sensor_quality
+        """An array containing the recording quality of each sensor
+        (of the primary user), indexed by sensor ID"""
+        return self.get_sensor_quality()
     
     @sensor_quality.setter
     def sensor_quality(self, data):
         """Changes the sensor quality values"""
-        self._sensor_quality = data
-        self.execute_event_functions( ccdl.SENSOR_QUALITY_EVENT, data )
+        self.set_sensor_quality(data, self.primary_user)
+    
+    def get_sensor_quality(self, user_id=None):
+        """Returns the sensor quality array of a given user (by default,
+        of the primary user)"""
+        acq = self.get_user(user_id)
+        if acq is None:
+            return self._sensor_quality
+        return acq.sensor_quality
+    
+    def set_sensor_quality(self, data, user_id=None, timestamp=None):
+        """Changes the sensor quality values of a given user. DATA is
+        an array indexed by sensor ID. The SENSOR_QUALITY_EVENT is fired
+        only if some sensor has changed, with a dictionary containing
+        the new quality of the changed sensors only. Changes are also
+        recorded in the user's quality history, at TIMESTAMP (by default,
+        the time of the last EmoState)"""
+        acq = self.users.get(user_id)
+        if acq is None:
+            quality = self._sensor_quality
+        else:
+            quality = acq.sensor_quality
+        
+        changed = quality != data
+        changed &= QUALITY_SENSORS
+        if changed.any():
+            quality[changed] = np.asarray(data)[changed]
+            if acq is not None:
+                if timestamp is None:
+                    timestamp = acq.state_data["time"]
+                acq.quality_history.append((timestamp, quality))
+            sensors = np.flatnonzero(changed)
+            changes = dict(zip(sensors.tolist(), quality[sensors].tolist()))
+            self.execute_event_functions( ccdl.SENSOR_QUALITY_EVENT, changes,
+                                          user=user_id )
     
     @property
     def sensor_data(self):
-        return self._sensor_data
-    
-    @sensor_data.setter
-    def sensor_data(self, data):
-        """Updates the sensor data"""
-        self._sensor_data = data
-        self.execute_event_functions( ccdl.SAMPLING_EVENT, data)
+        """The last block of samples of the primary user"""
+        acq = self.get_user()
+        if acq is None:
+            return self._sensor_data
+        return acq.sensor_data
     
     @property
     def state_data(self):
-        """Returns the EmoState data"""
+        """Returns the EmoState data (of the primary user), as a record
+        of dtype emostate.EMOSTATE_DTYPE"""
         return self._state_data
     
     @state_data.setter
     def state_data(self, data):
-        """Returns the EmoState data"""
-        self._state_data = data
-        self.execute_event_functions( ccdl.EMOSTATE_EVENT, data)
+        """Sets the EmoState data"""
+        self.set_state_data(data, self.primary_user)
+    
+    @property
+    def state_history(self):
+        """The record buffer with the latest EmoStates of the primary
+        user"""
+        acq = self.get_user()
+        if acq is None:
+            return self._empty_state_history
+        return acq.state_history
+    
+    def set_state_data(self, data, user_id=None):
+        """Sets the EmoState data of a given user. DATA is a record (or
+        a tuple of values) with the fields of emostate.EMOSTATE_DTYPE;
+        it is appended to the user's history, and a copy is passed to
+        the listeners"""
+        acq = self.users.get(user_id)
+        if acq is not None:
+            with acq.history_lock:
+                acq.state_history.append(data)
+                data = acq.state_data = acq.state_history.last()
+            acq.observe_emostate_time(data["time"])
+        else:
+            data = np.array(data, dtype=EMOSTATE_DTYPE)[()]
+        if self.primary_user in (None, user_id):
+            self._state_data = data
+        self.execute_event_functions( ccdl.EMOSTATE_EVENT, data,
+                                      user=user_id )
     
     # ------------------------------------------------------------- #
     # EVENTS MODEL
     # ------------------------------------------------------------- #
     
-    def add_listener(self, id, obj):
-        """Adds a listener"""
+    def add_listener(self, id, obj, policy=None, maxsize=64, user=None,
+                     channels=None):
+        """Adds a listener. If POLICY is None, the listener is called
+        synchronously by the thread that generates the event; otherwise,
+        it is called by its own worker thread, and events are queued
+        (up to MAXSIZE) according to the given overflow policy (one of
+        dispatch.BLOCK, dispatch.DROP_OLDEST, or dispatch.LATEST).
+        If USER is given, the listener only receives the events of that
+        user (and the events that do not refer to any user); with
+        ccdl.PRIMARY_USER, those of the primary user.  Otherwise, the
+        events of all the users are interleaved, which is only meant
+        for a single headset.
+        If CHANNELS (IDs or names) is given, the listener receives
+        blocks of samples with only those columns, in that order"""
         
         if id in ccdl.EVENTS:
             if type(obj) in (types.FunctionType, types.MethodType):
-                if obj not in self._listeners[id]:
-                    self._listeners[id].append(obj)
+                with self._listener_lock:
+                    if obj in self.listener_functions(id):
+                        return
+                    if channels is not None:
+                        channels = channel_columns(channels, self.channels)
+                    if policy is not None:
+                        obj = ListenerWorker(obj, policy, maxsize,
+                                             self.instrumentation)
+                    self._listeners[id] = self._listeners[id] + \
+                        [(user, obj, channels)]
             else:
                 
                 # Maybe throw an exception if it's not a function?
@@ -519,16 +734,189 @@ class EmotivManager(object):
         else:
             raise ccdl.EventError(id)
 
+    def remove_listener(self, id, obj, wait=False):
+        """Removes a listener (stopping its worker, if any; if WAIT is
+        True, after it has processed its queued events)"""
+        if id in ccdl.EVENTS:
+            with self._listener_lock:
+                listeners = self._listeners[id]
+                removed = [l for user, l, c in listeners
+                           if getattr(l, "func", l) == obj]
+                self._listeners[id] = [entry for entry in listeners
+                                       if entry[1] not in removed]
+            for l in removed:
+                if isinstance(l, ListenerWorker):
+                    l.stop(wait=wait)
+        else:
+            raise ccdl.EventError(id)
 
-    def execute_event_functions(self, event_id, arg):
+    def listener_functions(self, id):
+        """Returns the functions listening to a given event ID"""
+        return [getattr(l, "func", l) for user, l, c in self._listeners[id]]
+    
+    def listener_stats(self):
+        """Returns the counters (queued, dropped, processed events,
+        and maximum latency) of all the asynchronous listeners"""
+        stats = []
+        for event_id in ccdl.EVENTS:
+            for user, l, channels in self._listeners[event_id]:
+                if isinstance(l, ListenerWorker):
+                    s = l.stats()
+                    s["event"] = event_id
+                    s["user"] = user
+                    stats.append(s)
+        return stats
+
+    def event_users(self, user):
+        """The listener users that receive the events of USER: USER, and
+        ccdl.PRIMARY_USER if it is the primary user"""
+        if user is not None and user == self.primary_user:
+            return (user, ccdl.PRIMARY_USER)
+        return (user,)
+
+    def execute_event_functions(self, event_id, arg, user=None):
         """Executes all the listener functions associated with a given
-        event ID"""
+        event ID. USER is the ID of the user the event refers to (if
+        any)"""
         if event_id in ccdl.EVENTS:
-            for func in self._listeners[event_id]:
-                func(arg)
+            if self.instrumentation.enabled:
+                self._execute_timed(self._listeners[event_id], arg, user)
+                return
+            selected = {}
+            users = self.event_users(user)
+            for target, func, channels in self._listeners[event_id]:
+                if target is None or user is None or target in users:
+                    if channels is None:
+                        func(arg)
+                    else:
+                        func(select_channels(arg, channels, selected))
         else:
             raise ccdl.EventError(event_id)
+    
+    def _execute_timed(self, listeners, arg, user):
+        """Like execute_event_functions, recording the duration of
+        every synchronous call (asynchronous listeners time themselves,
+        on their own thread)"""
+        names = self._listener_names
+        selected = {}
+        users = self.event_users(user)
+        for target, func, channels in listeners:
+            if target is None or user is None or target in users:
+                if channels is None:
+                    value = arg
+                else:
+                    value = select_channels(arg, channels, selected)
+                if isinstance(func, ListenerWorker):
+                    func(value)
+                    continue
+                start = clock()
+                func(value)
+                elapsed = clock() - start
+                name = names.get(func)
+                if name is None:
+                    name = names[func] = "listener:%s" % listener_name(func)
+                self.instrumentation.record(name, elapsed)
             
+    def stop_listeners(self):
+        """Stops the worker threads of the asynchronous listeners,
+        after they have processed their queued events"""
+        for event_id in ccdl.EVENTS:
+            for user, l, channels in self._listeners[event_id]:
+                if isinstance(l, ListenerWorker):
+                    l.stop()
+
+    # ------------------------------------------------------------- #
+    # INSTRUMENTATION
+    # ------------------------------------------------------------- #
+    
+    def enable_stats(self, enabled=True, dump_path=None, dump_interval=10.0):
+        """Turns the instrumentation on (or off). If DUMP_PATH is given,
+        a snapshot of the stats is appended to that file (as a line of
+        JSON) every DUMP_INTERVAL seconds"""
+        self.instrumentation.enabled = enabled
+        if self._stats_dumper is not None:
+            self._stats_dumper.stop()
+            self._stats_dumper = None
+        if enabled and dump_path is not None:
+            self._stats_dumper = StatsDumper(self.stats, dump_path,
+                                             dump_interval)
+    
+    def stats(self):
+        """Returns a snapshot of the instrumentation: the histograms of
+        the stage timings (in seconds) and block sizes, and the
+        counters of the manager, of the users and of the listeners"""
+        s = self.instrumentation.snapshot()
+        s["tick_overruns"] = self.tick_overruns
+        s["events_drained"] = self.events_drained
+        s["max_events_drained"] = self.max_events_drained
+        s["users"] = {}
+        for user_id, acq in self.users.items():
+            user = {"tick_overruns" : acq.tick_overruns}
+            if acq.gaps is not None:
+                user.update(acq.gaps.snapshot())
+            s["users"][str(user_id)] = user
+        s["listeners"] = self.listener_stats()
+        return s
+    
+    # ------------------------------------------------------------- #
+    # STREAMS
+    # ------------------------------------------------------------- #
+    
+    def stream(self, channels=None, user=None, maxsize=32,
+               event_id=ccdl.SAMPLING_EVENT):
+        """Returns an iterator over the blocks of samples (or over the
+        arguments of any other event). CHANNELS selects the columns of
+        the blocks, by ID or name. At most MAXSIZE events are buffered;
+        if the consumer falls behind, the oldest ones are dropped"""
+        return EventStream(self, event_id, channels, user, maxsize)
+    
+    def publish(self, path=PATH_TEMPLATE):
+        """Publishes the sample and EmoState histories of every user
+        (present or future) in shared memory, so that other processes
+        can read them (see shared.py). PATH is the path of the shared
+        memory file, with %d in place of the user ID"""
+        self.publish_path = path
+        for user_id, acq in self.users.items():
+            acq.publish(path % user_id)
+    
+    def unpublish(self):
+        """Stops publishing the histories in shared memory"""
+        self.publish_path = None
+        for acq in self.users.values():
+            acq.unpublish()
+    
+    def serve(self, address=("127.0.0.1", 0), user=None, maxsize=64):
+        """Starts a server that streams the samples, contact quality and
+        EmoStates to other programs (see server.py), and returns it.
+        ADDRESS is a (host, port) tuple, or the path of a Unix socket"""
+        server = StreamServer(self, address, user, maxsize)
+        self._servers.append(server)
+        return server
+    
+    def next_emostate(self, timeout=None, user=None):
+        """Waits for the next EmoState data and returns it"""
+        stream = EventStream(self, ccdl.EMOSTATE_EVENT, user=user,
+                             maxsize=1)
+        try:
+            return stream.get(timeout)
+        finally:
+            stream.close()
+    
+    @contextmanager
+    def session(self, remote=None):
+        """A context in which the manager is connected (see connect())
+        and monitoring:
+        
+            with manager.session():
+                for block in manager.stream():
+                    ...
+        """
+        self.connect(remote)
+        self.monitoring = True
+        try:
+            yield self
+        finally:
+            self.disconnect()
 
     # ------------------------------------------------------------- #
     # CLEAN OBJECT DESTRUCTION
@@ -536,9 +924,15 @@ class EmotivManager(object):
 
     def cleanup(self):
         """Cleanly removes C++ allocated objects"""
+        while self._servers:
+            self._servers.pop().close()
+        self.stop_listeners()
+        if self._stats_dumper is not None:
+            self.enable_stats(False)
         self.edk.EE_EmoStateFree(self.eState)
         self.edk.EE_EmoEngineEventFree(self.eEvent)
-        self.edk.EE_DataFree(self.hData)
+        for user_id in self.users.keys():
+            self.users.pop(user_id).free()
         
     def __del__(self):
         """Disconnects and frees memory before destroying the object"""
@@ -0,0 +1,350 @@
+## ---------------------------------------------------------------- ##
+## REPLAY.py
+## ---------------------------------------------------------------- ##
+## A pure-Python EmoEngine that replays recorded EEG (EEG.csv) and
+## EmoState (ES.csv) files, in real time or at any speed, through the
+## same calls as edk.dll.  It lets the whole manager -> listeners ->
+## recorder pipeline run without a headset (and without Windows).
+## ---------------------------------------------------------------- ##
+
+import ast
+import collections
+import time
+import numpy as np
+import variables
+from backend import EmoEngineBackend
+
+__all__ = ["ReplayEngine", "read_csv_recording", "ES_COLUMNS"]
+
+## The columns of the EmoState logs (ES.csv)
+
+ES_COLUMNS = ("Time", "UserID", "Wireless Signal Status", "Blink",
+              "Wink Left", "Wink Right", "Look Left", "Look Right",
+              "Eyebrow", "Furrow", "Smile", "Clench", "Smirk Left",
+              "Smirk Right", "Laugh", "Short Term Excitement",
+              "Long Term Excitement", "Engagement/Boredom",
+              "Cognitiv Action", "Cognitiv Power")
+
+ES_TIME = 0
+ES_USER = 1
+ES_SIGNAL = 2
+ES_BLINK = 3
+ES_LEFT_WINK = 4
+ES_RIGHT_WINK = 5
+ES_LOOK_LEFT = 6
+ES_LOOK_RIGHT = 7
+ES_EYEBROW = 8
+ES_FURROW = 9
+ES_SMILE = 10
+ES_CLENCH = 11
+ES_SMIRK_LEFT = 12
+ES_SMIRK_RIGHT = 13
+ES_LAUGH = 14
+ES_SHORT_TERM_EXCITEMENT = 15
+ES_LONG_TERM_EXCITEMENT = 16
+ES_ENGAGEMENT = 17
+ES_COGNITIV_ACTION = 18
+ES_COGNITIV_POWER = 19
+
+## The facial expressions logged in ES.csv (as powers), by face area
+
+UPPER_FACE = ((ES_EYEBROW, variables.EXP_EYEBROW),
+              (ES_FURROW, variables.EXP_FURROW))
+
+LOWER_FACE = ((ES_SMILE, variables.EXP_SMILE),
+              (ES_CLENCH, variables.EXP_CLENCH),
+              (ES_SMIRK_LEFT, variables.EXP_SMIRK_LEFT),
+              (ES_SMIRK_RIGHT, variables.EXP_SMIRK_RIGHT),
+              (ES_LAUGH, variables.EXP_LAUGH))
+
+
+def strongest_expression(values, expressions):
+    """Returns a tuple (action, power) with the strongest of the given
+    EXPRESSIONS in a row of an EmoState log (or EXP_NEUTRAL)"""
+    action, power = variables.EXP_NEUTRAL, 0.0
+    for column, expression in expressions:
+        if values[column] > power:
+            action, power = expression, values[column]
+    return action, power
+
+
+def read_csv_recording(path):
+    """Reads a file written by the EDK example loggers (EEGLoger.py,
+    emoStateLoger.py): a header line with a Python list of column names,
+    followed by rows of ' , '-separated values (with trailing separators
+    and blank lines).  Rows whose width does not match the header (e.g.,
+    a row truncated at the end of the file) are skipped.
+    Returns a tuple (header, data)"""
+    f = open(path, "r")
+    try:
+        header = ast.literal_eval(f.readline().strip())
+        rows = []
+        width = len(header)
+        for line in f:
+            values = [x for x in line.split(",") if x.strip()]
+            if len(values) == width:
+                rows.append([float(x) for x in values])
+    finally:
+        f.close()
+
+    return list(header), np.array(rows, dtype=np.double).reshape(-1, width)
+
+
+class ReplayEngine(EmoEngineBackend):
+    """An EmoEngine that serves recorded data.
+
+    EEG is a (samples x channels) array, whose columns are the EDK
+    channels listed in CHANNELS (by default, variables.CHANNELS);
+    EMOSTATES is an array with the columns in ES_COLUMNS (if None,
+    EmoStates with a good signal are generated every EMOSTATE_INTERVAL
+    seconds).  Time runs at SPEED times the real time, as measured by
+    CLOCK (which can be replaced with a simulated clock for deterministic
+    runs).  If LOOP is True, the recording starts over when it ends."""
+    def __init__(self, eeg, emostates=None, sampling_rate=128, speed=1.0,
+                 loop=False, clock=time.time, quality=4, battery=4,
+                 emostate_interval=0.25, user_id=0,
+                 channels=variables.CHANNELS):
+        self.eeg = np.asarray(eeg, dtype=np.double)
+        self.emostates = emostates
+        self.sampling_rate = sampling_rate
+        self.speed = speed
+        self.loop = loop
+        self.clock = clock
+        self.quality = quality
+        self.battery = battery
+        self.emostate_interval = emostate_interval
+        self.user_id = user_id
+
+        # Column of every EDK channel in the EEG array
+        self._columns = dict(zip(channels, range(len(channels))))
+        self._connected = False
+        self._acquiring = False
+        self._buffer_samples = sampling_rate
+        self.lost_samples = 0   # Samples that overflowed the EDK buffer
+
+    @classmethod
+    def from_files(cls, eeg_path, es_path=None, **kwargs):
+        """Creates a replay engine from EEG.csv/ES.csv-style files"""
+        header, eeg = read_csv_recording(eeg_path)
+        emostates = None
+        if es_path is not None:
+            header, emostates = read_csv_recording(es_path)
+        return cls(eeg, emostates, **kwargs)
+
+    @property
+    def duration(self):
+        """The duration of the EEG recording, in seconds"""
+        return self.eeg.shape[0] / float(self.sampling_rate)
+
+    def elapsed(self):
+        """The (replay) time since the connection, in seconds"""
+        return (self.clock() - self.start_time) * self.speed
+
+    # --------------------------------------------------------------- #
+    # Engine and events
+    # --------------------------------------------------------------- #
+
+    def EE_EngineConnect(self, device="Emotiv Systems-5"):
+        self._connected = True
+        self.start_time = self.clock()
+        self._served = 0          # EEG samples already passed on
+        self._state_index = 0     # Next EmoState row
+        self._state_offset = 0.0  # Time offset of the EmoStates (loops)
+        self._state_time = 0.0    # Time of the next generated EmoState
+        self._events = collections.deque()
+        self._events.append((variables.EE_User_Added, None))
+        return variables.EDK_OK
+
+    def EE_EngineRemoteConnect(self, host, port):
+        # The recording is served wherever the manager connects
+        return self.EE_EngineConnect()
+
+    def EE_EngineDisconnect(self):
+        self._connected = False
+        self._acquiring = False
+        return variables.EDK_OK
+
+    def EE_EngineGetNextEvent(self, hEvent):
+        if not self._connected:
+            return variables.EDK_NO_EVENT
+
+        if self._events:
+            event, values = self._events.popleft()
+        else:
+            values = self.next_emostate(self.elapsed())
+            if values is None:
+                return variables.EDK_NO_EVENT
+            event = variables.EE_EmoState_Updated
+
+        hEvent.type = event
+        hEvent.user = self.user_id
+        hEvent.values = values
+        return variables.EDK_OK
+
+    def next_emostate(self, t):
+        """Returns the next EmoState row due by time T, or None"""
+        if self.emostates is None:
+            if self._state_time > t:
+                return None
+            values = np.zeros(len(ES_COLUMNS))
+            values[ES_TIME] = self._state_time
+            values[ES_USER] = self.user_id
+            values[ES_SIGNAL] = variables.EDK_GOOD_SIGNAL
+            self._state_time += self.emostate_interval
+            return values
+
+        if self._state_index >= len(self.emostates):
+            if not self.loop or len(self.emostates) == 0:
+                return None
+            self._state_index = 0
+            self._state_offset += self.duration
+
+        values = self.emostates[self._state_index].copy()
+        values[ES_TIME] += self._state_offset
+        if values[ES_TIME] > t:
+            return None
+        self._state_index += 1
+        return values
+
+    # --------------------------------------------------------------- #
+    # Data acquisition
+    # --------------------------------------------------------------- #
+
+    def EE_DataSetBufferSizeInSec(self, bufferSizeInSec):
+        secs = getattr(bufferSizeInSec, "value", bufferSizeInSec)
+        self._buffer_samples = int(np.ceil(secs * self.sampling_rate))
+        return variables.EDK_OK
+
+    def EE_DataAcquisitionEnable(self, userId, enable):
+        self._acquiring = bool(enable)
+        return variables.EDK_OK
+
+    def EE_DataUpdateHandle(self, userId, hData):
+        hData.n_samples = 0
+        if not (self._connected and self._acquiring):
+            return variables.EDK_OK
+
+        N = self.eeg.shape[0]
+        available = int(self.elapsed() * self.sampling_rate)
+        if not self.loop:
+            available = min(available, N)
+
+        # Like the EDK, only the last buffer's worth of samples is kept
+        start = max(self._served, available - self._buffer_samples)
+        self.lost_samples += start - self._served
+
+        if available > start:
+            if available <= N:
+                hData.data = self.eeg[start:available]
+            else:
+                hData.data = self.eeg.take(np.arange(start, available) % N,
+                                           axis=0)
+            hData.n_samples = available - start
+        self._served = max(self._served, available)
+        return variables.EDK_OK
+
+    def EE_DataGet(self, hData, channel, buffer, bufferSizeInSample):
+        n = min(bufferSizeInSample, hData.n_samples)
+        if not isinstance(buffer, np.ndarray):
+            buffer = np.ctypeslib.as_array(buffer)
+        buffer[:n] = hData.data[:n, self._columns[channel]]
+        return variables.EDK_OK
+
+    def EE_DataGetSamplingRate(self, userId, samplingRateOut):
+        samplingRateOut[0] = self.sampling_rate
+        return variables.EDK_OK
+
+    # --------------------------------------------------------------- #
+    # EmoState
+    # --------------------------------------------------------------- #
+
+    def ES_GetTimeFromStart(self, state):
+        return state.values[ES_TIME]
+
+    def ES_GetHeadsetOn(self, state):
+        return 1
+
+    def ES_GetNumContactQualityChannels(self, state):
+        return variables.CONTACT_QUALITY_CHANNELS
+
+    def ES_GetContactQuality(self, state, electroIdx):
+        if isinstance(self.quality, dict):
+            return self.quality.get(electroIdx, variables.EEG_CQ_NO_SIGNAL)
+        return self.quality
+
+    def ES_GetContactQualityFromAllChannels(self, state, contactQuality,
+                                            numChannels):
+        if isinstance(self.quality, dict):
+            return EmoEngineBackend.ES_GetContactQualityFromAllChannels(
+                self, state, contactQuality, numChannels)
+        n = min(numChannels, variables.CONTACT_QUALITY_CHANNELS)
+        if not isinstance(contactQuality, np.ndarray):
+            contactQuality = np.ctypeslib.as_array(contactQuality)
+        contactQuality[:n] = self.quality
+        return n
+
+    def ES_GetWirelessSignalStatus(self, state):
+        return int(state.values[ES_SIGNAL])
+
+    def ES_GetBatteryChargeLevel(self, state, chargeLevel, maxChargeLevel):
+        chargeLevel[0] = self.battery
+        maxChargeLevel[0] = 5
+
+    def ES_ExpressivIsBlink(self, state):
+        return int(state.values[ES_BLINK])
+
+    def ES_ExpressivIsLeftWink(self, state):
+        return int(state.values[ES_LEFT_WINK])
+
+    def ES_ExpressivIsRightWink(self, state):
+        return int(state.values[ES_RIGHT_WINK])
+
+    def ES_ExpressivIsEyesOpen(self, state):
+        return int(not state.values[ES_BLINK])
+
+    def ES_ExpressivIsLookingLeft(self, state):
+        return int(state.values[ES_LOOK_LEFT])
+
+    def ES_ExpressivIsLookingRight(self, state):
+        return int(state.values[ES_LOOK_RIGHT])
+
+    def ES_ExpressivGetEyelidState(self, state, leftEye, rightEye):
+        # Eyelids are not logged: they are derived from blinks and winks
+        blink = state.values[ES_BLINK]
+        leftEye[0] = 0.0 if blink or state.values[ES_LEFT_WINK] else 1.0
+        rightEye[0] = 0.0 if blink or state.values[ES_RIGHT_WINK] else 1.0
+
+    def ES_ExpressivGetUpperFaceAction(self, state):
+        return strongest_expression(state.values, UPPER_FACE)[0]
+
+    def ES_ExpressivGetUpperFaceActionPower(self, state):
+        return strongest_expression(state.values, UPPER_FACE)[1]
+
+    def ES_ExpressivGetLowerFaceAction(self, state):
+        return strongest_expression(state.values, LOWER_FACE)[0]
+
+    def ES_ExpressivGetLowerFaceActionPower(self, state):
+        return strongest_expression(state.values, LOWER_FACE)[1]
+
+    def ES_AffectivGetExcitementShortTermScore(self, state):
+        return state.values[ES_SHORT_TERM_EXCITEMENT]
+
+    def ES_AffectivGetExcitementLongTermScore(self, state):
+        return state.values[ES_LONG_TERM_EXCITEMENT]
+
+    def ES_AffectivGetEngagementBoredomScore(self, state):
+        return state.values[ES_ENGAGEMENT]
+
+    # Meditation and frustration are not logged
+    def ES_AffectivGetMeditationScore(self, state):
+        return 0.0
+
+    def ES_AffectivGetFrustrationScore(self, state):
+        return 0.0
+
+    def ES_CognitivGetCurrentAction(self, state):
+        action = int(state.values[ES_COGNITIV_ACTION])
+        return action or variables.COG_NEUTRAL
+
+    def ES_CognitivGetCurrentActionPower(self, state):
+        return state.values[ES_COGNITIV_POWER]
@@ -0,0 +1,373 @@
+## ---------------------------------------------------------------- ##
+## SERVER.py
+## ---------------------------------------------------------------- ##
+## A streaming server for other local programs.  The samples, the
+## contact quality and the EmoStates of a user are sent to any number
+## of clients over TCP (or a Unix socket), as binary frames:
+##
+##     server = manager.serve(("127.0.0.1", 5555))
+##
+##     client = StreamClient(("127.0.0.1", 5555))
+##     for kind, value in client:
+##         if kind == SAMPLES:
+##             ...   # value is a (samples x channels) float32 array
+##
+## Every frame is a header (FRAME_HEADER: magic, version, kind, payload
+## size) followed by the payload:
+##
+##     HELLO      JSON: channels, sampling rate, EmoState dtype
+##     SAMPLES    BLOCK_HEADER (time of the first sample, first and
+##                last counter, samples, channels), then the samples as
+##                little-endian float32, one sample after the other
+##     QUALITY    time (double), then the quality of every input
+##                channel (int8)
+##     EMOSTATE   an emostate.EMOSTATE_DTYPE record
+##
+## Frames are encoded once, in the thread that produces the data, and
+## queued for every client; each client has its own sender thread and
+## a bounded queue.  Clients that fall behind (whose queue is full) are
+## disconnected, so that they never delay the acquisition.
+## ---------------------------------------------------------------- ##
+
+from threading import Thread, Lock, current_thread
+import Queue
+import json
+import os
+import socket
+import struct
+import time
+import numpy as np
+import ccdl
+import variables
+from emostate import EMOSTATE_DTYPE
+from gaps import first_time
+
+__all__ = ["StreamServer", "StreamClient", "HELLO", "SAMPLES", "QUALITY",
+           "EMOSTATE"]
+
+MAGIC = "NT"
+VERSION = 1
+
+# Kinds of frames
+HELLO = 0
+SAMPLES = 1
+QUALITY = 2
+EMOSTATE = 3
+
+FRAME_HEADER = struct.Struct("<2sBBI")    # magic, version, kind, size
+BLOCK_HEADER = struct.Struct("<dIIII")    # time, counters, shape
+QUALITY_HEADER = struct.Struct("<d")      # time
+
+SAMPLE_DTYPE = np.dtype("<f4")
+
+# How often (in seconds) the threads of the server check whether it has
+# been closed
+POLL_INTERVAL = 0.1
+
+
+def frame(kind, payload):
+    """Returns a complete frame"""
+    return FRAME_HEADER.pack(MAGIC, VERSION, kind, len(payload)) + payload
+
+
+def new_socket(address):
+    """Returns a socket for ADDRESS: a (host, port) tuple for TCP, or a
+    path for a Unix socket"""
+    if isinstance(address, basestring):
+        return socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    return socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+
+
+class ClientConnection(object):
+    """A client of a StreamServer, with its queue and sender thread.
+    HELLO is queued first, before any frame can be broadcast to it"""
+    def __init__(self, server, sock, address, maxsize, hello):
+        self.server = server
+        self.sock = sock
+        self.address = address
+        self.queue = Queue.Queue(maxsize)
+        self.queue.put(hello)
+        self.closed = False
+        self.sent = 0          # Frames sent
+        self._thread = Thread(target=self.run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._thread.start()
+
+    def send(self, data):
+        """Queues a frame. Returns False if the queue is full"""
+        try:
+            self.queue.put_nowait(data)
+            return True
+        except Queue.Full:
+            return False
+
+    def run(self):
+        try:
+            while not self.closed:
+                try:
+                    data = self.queue.get(True, POLL_INTERVAL)
+                except Queue.Empty:
+                    continue
+                self.sock.sendall(data)
+                self.sent += 1
+        except socket.error:
+            pass
+        self.server.disconnect(self)
+
+    def close(self, wait=False):
+        """Closes the connection (the sender thread stops). If WAIT is
+        True, waits for the sender thread to finish"""
+        if not self.closed:
+            self.closed = True
+            try:
+                self.sock.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+            self.sock.close()
+        if wait and self._thread is not current_thread() and \
+                self._thread.is_alive():
+            self._thread.join()
+
+
+class StreamServer(object):
+    """Sends the data of a USER of a manager to the clients that connect
+    to ADDRESS (if USER is None, the events of all the users are sent,
+    which is meant for a single headset).  Every client can have up to
+    MAXSIZE frames waiting to be sent"""
+    def __init__(self, manager, address=("127.0.0.1", 0), user=None,
+                 maxsize=64):
+        self.manager = manager
+        self.user = user
+        self.maxsize = maxsize
+        self.clients = []
+        self.slow_clients = 0      # Clients disconnected for being slow
+        self._lock = Lock()
+        self._closed = False
+
+        if isinstance(address, basestring) and os.path.exists(address):
+            os.remove(address)
+        self.socket = new_socket(address)
+        if not isinstance(address, basestring):
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(address)
+        self.socket.listen(5)
+        self.socket.settimeout(POLL_INTERVAL)
+        self.address = self.socket.getsockname()
+
+        manager.add_listener(ccdl.SAMPLING_EVENT, self.send_samples,
+                             user=user)
+        manager.add_listener(ccdl.SENSOR_QUALITY_EVENT, self.send_quality,
+                             user=user)
+        manager.add_listener(ccdl.EMOSTATE_EVENT, self.send_emostate,
+                             user=user)
+
+        self._columns = {}
+        for name, channel in (("counter", variables.ED_COUNTER),
+                              ("time", variables.ED_TIMESTAMP)):
+            if channel in manager.channels:
+                self._columns[name] = list(manager.channels).index(channel)
+        self._next_time = None    # TIMESTAMP after the last block
+
+        self._thread = Thread(target=self.accept)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def sampling_rate(self):
+        acq = self.manager.get_user(self.user)
+        if acq is not None:
+            return acq.sampling_rate
+        return self.manager.sampling_rate
+
+    def hello(self):
+        """Returns the HELLO frame, which describes the stream"""
+        info = {"version" : VERSION,
+                "channels" : list(self.manager.channels),
+                "sampling_rate" : self.sampling_rate,
+                "emostate_dtype" : EMOSTATE_DTYPE.descr}
+        return frame(HELLO, json.dumps(info))
+
+    def accept(self):
+        """Accepts the clients, until the server is closed"""
+        while not self._closed:
+            try:
+                sock, address = self.socket.accept()
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            sock.settimeout(None)
+            client = ClientConnection(self, sock, address, self.maxsize,
+                                      self.hello())
+            with self._lock:
+                self.clients.append(client)
+            client.start()
+
+    def broadcast(self, data):
+        """Queues a frame for all the clients, disconnecting the ones
+        whose queue is full"""
+        for client in list(self.clients):
+            if not client.send(data):
+                self.slow_clients += 1
+                if self.manager.instrumentation.enabled:
+                    self.manager.instrumentation.count("server_slow_clients")
+                self.disconnect(client)
+
+    def disconnect(self, client):
+        """Closes the connection with a client"""
+        client.close()
+        with self._lock:
+            if client in self.clients:
+                self.clients.remove(client)
+
+    # --------------------------------------------------------------- #
+    # Listeners
+    # --------------------------------------------------------------- #
+
+    def block_time(self, data):
+        """Returns the time of the first sample of DATA: from its first
+        finite TIMESTAMP (the rows of a gap filled with NaN have none),
+        or else following the previous block"""
+        if "time" not in self._columns:
+            return time.time()
+        rate = float(self.sampling_rate)
+        t = first_time(data, self._columns["time"], rate)
+        if t is None:
+            t = self._next_time
+            if t is None:
+                return time.time()
+        self._next_time = t + data.shape[0] / rate
+        return t
+
+    def send_samples(self, data):
+        if data.shape[0] == 0:
+            return
+        t = self.block_time(data)
+        if not self.clients:
+            return
+        N, C = data.shape
+        columns = self._columns
+        if "counter" in columns:
+            first = int(data[0, columns["counter"]])
+            last = int(data[-1, columns["counter"]])
+        else:
+            first = last = 0
+        payload = (BLOCK_HEADER.pack(t, first, last, N, C) +
+                   data.astype(SAMPLE_DTYPE).tostring())
+        self.broadcast(frame(SAMPLES, payload))
+
+    def send_quality(self, changes):
+        if not self.clients:
+            return
+        quality = self.manager.get_sensor_quality(self.user)
+        payload = QUALITY_HEADER.pack(time.time()) + quality.tostring()
+        self.broadcast(frame(QUALITY, payload))
+
+    def send_emostate(self, record):
+        if not self.clients:
+            return
+        self.broadcast(frame(EMOSTATE,
+                             np.asarray(record, EMOSTATE_DTYPE).tostring()))
+
+    def stats(self):
+        """Returns a dictionary with the counters of the server"""
+        return {"clients" : len(self.clients),
+                "slow_clients" : self.slow_clients,
+                "queued" : [c.queue.qsize() for c in self.clients]}
+
+    def close(self):
+        """Stops listening, and disconnects all the clients"""
+        if self._closed:
+            return
+        self._closed = True
+        for event_id, func in ((ccdl.SAMPLING_EVENT, self.send_samples),
+                               (ccdl.SENSOR_QUALITY_EVENT, self.send_quality),
+                               (ccdl.EMOSTATE_EVENT, self.send_emostate)):
+            self.manager.remove_listener(event_id, func)
+        self._thread.join()
+        self.socket.close()
+        for client in list(self.clients):
+            self.disconnect(client)
+            client.close(wait=True)
+        if isinstance(self.address, basestring) and \
+                os.path.exists(self.address):
+            os.remove(self.address)
+
+
+class StreamClient(object):
+    """A client of a StreamServer at ADDRESS. Iterating over it yields
+    tuples (kind, value), where VALUE is a float32 (samples x channels)
+    array for SAMPLES (its header is in 'block_info'), a tuple (time,
+    quality array) for QUALITY, and a record for EMOSTATE"""
+    def __init__(self, address, timeout=None):
+        self.socket = new_socket(address)
+        self.socket.settimeout(timeout)
+        self.socket.connect(address)
+        self.block_info = None
+        kind, self.info = self.read()
+        if kind != HELLO:
+            raise IOError("Not a NeuroTrain stream")
+        self.channels = tuple(self.info["channels"])
+        self.sampling_rate = self.info["sampling_rate"]
+
+    def _recv(self, n):
+        """Returns exactly N bytes"""
+        chunks = []
+        while n > 0:
+            chunk = self.socket.recv(n)
+            if not chunk:
+                raise EOFError("Connection closed")
+            chunks.append(chunk)
+            n -= len(chunk)
+        return "".join(chunks)
+
+    def read(self):
+        """Reads the next frame, and returns a tuple (kind, value)"""
+        magic, version, kind, size = FRAME_HEADER.unpack(
+            self._recv(FRAME_HEADER.size))
+        if magic != MAGIC or version != VERSION:
+            raise IOError("Unknown frame (%r, version %d)" % (magic, version))
+        payload = self._recv(size)
+
+        if kind == SAMPLES:
+            t, first, last, N, C = BLOCK_HEADER.unpack_from(payload)
+            self.block_info = {"time" : t, "first_counter" : first,
+                               "last_counter" : last}
+            data = np.frombuffer(payload, SAMPLE_DTYPE, N * C,
+                                 BLOCK_HEADER.size)
+            return kind, data.reshape(N, C)
+        elif kind == QUALITY:
+            t, = QUALITY_HEADER.unpack_from(payload)
+            return kind, (t, np.frombuffer(payload, np.int8,
+                                           offset=QUALITY_HEADER.size))
+        elif kind == EMOSTATE:
+            return kind, np.frombuffer(payload, EMOSTATE_DTYPE)[0]
+        elif kind == HELLO:
+            return kind, json.loads(payload)
+        return kind, payload
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        try:
+            return self.read()
+        except EOFError:
+            raise StopIteration
+
+    def blocks(self):
+        """Iterates over the blocks of samples only"""
+        for kind, value in self:
+            if kind == SAMPLES:
+                yield value
+
+    def close(self):
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
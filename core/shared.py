@@ -0,0 +1,312 @@
+## ---------------------------------------------------------------- ##
+## SHARED.py
+## ---------------------------------------------------------------- ##
+## Publication of a user's sample history and EmoState history to other
+## processes.  The two ring buffers live in a memory-mapped file (under
+## /dev/shm, where available, so that it never touches the disk), with
+## a small header: the write counts, the sampling rate and the channel
+## map.  The manager writes into it directly:
+##
+##     manager.publish("/dev/shm/neurotrain-0")
+##
+## and any number of processes attach to it, read-only, and read the
+## samples without copying them:
+##
+##     history = shared.attach("/dev/shm/neurotrain-0")
+##     reader = history.samples.reader()
+##     while True:
+##         block = reader.read()    # A view of the shared memory
+##         ...
+##
+## The buffers follow the protocol of buffers.RingBuffer: the writer
+## copies the samples first and publishes the new write count
+## afterwards, and views are valid until the writer wraps around.
+##
+## A history is always published under a fresh name, and then swapped
+## in atomically, so that a file that is still mapped (by the manager,
+## or by the processes attached to it) is never replaced in place:
+## files are written next to PATH and renamed to it; on Windows, where
+## the histories are named mappings of the paging file (mmap's tagname,
+## never a file on disk), PATH names a small directory mapping that
+## holds the name of the current history.
+## ---------------------------------------------------------------- ##
+
+import itertools
+import mmap
+import os
+import tempfile
+import time
+import numpy as np
+from buffers import RingBuffer, RecordBuffer
+from emostate import EMOSTATE_DTYPE
+
+__all__ = ["SharedHistory", "SharedRingBuffer", "SharedRecordBuffer",
+           "attach", "default_path", "SharedMemoryError", "PATH_TEMPLATE"]
+
+MAGIC = "NTSHM001"
+MAX_CHANNELS = 32
+
+HEADER_DTYPE = np.dtype([("magic", "S8"),
+                         ("channels", np.uint32),
+                         ("state_itemsize", np.uint32),
+                         ("capacity", np.uint64),
+                         ("written", np.uint64),
+                         ("state_capacity", np.uint64),
+                         ("state_written", np.uint64),
+                         ("sampling_rate", np.double),
+                         ("channel_map", np.int32, (MAX_CHANNELS,))])
+
+# The data starts after the header, aligned
+HEADER_SIZE = 256
+
+# Windows: the directory mapping (at PATH) names the current history.
+# The generation is odd while the name is being changed
+DIRECTORY_MAGIC = "NTSHMDIR"
+DIRECTORY_DTYPE = np.dtype([("magic", "S8"),
+                            ("generation", np.uint64),
+                            ("name", "S112")])
+
+# Whether the histories are named mappings rather than files
+NAMED_MAPPINGS = os.name == "nt"
+
+_names = itertools.count()     # Fresh names of the histories
+
+
+class SharedMemoryError(Exception):
+    """A specific error when a file is not a shared history"""
+    def __init__(self, path, reason):
+        self.path = path
+        self.reason = reason
+
+    def __str__(self):
+        return "Cannot attach to %s: %s" % (self.path, self.reason)
+
+
+# Where the histories are published by default (%d is the user ID): a
+# mapping name on Windows, a file in memory (/dev/shm) where there is
+# one, and a temporary file otherwise
+if NAMED_MAPPINGS:
+    PATH_TEMPLATE = "neurotrain-%d"
+elif os.path.isdir("/dev/shm"):
+    PATH_TEMPLATE = "/dev/shm/neurotrain-%d"
+else:
+    PATH_TEMPLATE = os.path.join(tempfile.gettempdir(), "neurotrain-%d")
+
+
+def default_path(user_id=0):
+    """Returns the default path of the shared history of a user"""
+    return PATH_TEMPLATE % user_id
+
+
+def history_size(channels, capacity, state_capacity):
+    """Returns the size (in bytes) of a shared history"""
+    return (HEADER_SIZE + 2 * capacity * channels * 8 +
+            2 * state_capacity * EMOSTATE_DTYPE.itemsize)
+
+
+def named_mapping(name, size, writable=False):
+    """Returns the named mapping NAME (Windows), of SIZE bytes, as an
+    array of bytes. The mapping is created if it does not exist"""
+    access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+    try:
+        m = mmap.mmap(-1, size, tagname=name, access=access)
+    except EnvironmentError as e:
+        raise SharedMemoryError(name, e)
+    return np.frombuffer(m, dtype=np.uint8)
+
+
+def directory(path, writable=False):
+    """Returns the directory mapping at PATH (Windows)"""
+    return named_mapping(path, DIRECTORY_DTYPE.itemsize,
+                         writable).view(DIRECTORY_DTYPE)
+
+
+def current_name(path):
+    """Returns the name of the history currently published at PATH
+    (Windows), or None"""
+    d = directory(path)
+    for attempt in xrange(100):
+        generation = int(d["generation"][0])
+        name = str(d["name"][0])
+        if generation % 2 == 0 and generation == int(d["generation"][0]):
+            if d["magic"][0] != DIRECTORY_MAGIC or not name:
+                return None
+            return name
+        time.sleep(0.001)
+    return None
+
+
+def map_history(path, writable=False):
+    """Returns the shared history at PATH, as an array of bytes"""
+    if not NAMED_MAPPINGS:
+        return np.memmap(path, dtype=np.uint8,
+                         mode="r+" if writable else "r")
+    name = current_name(path)
+    if name is None:
+        raise SharedMemoryError(path, "not published")
+    header = named_mapping(name, HEADER_SIZE)[:HEADER_DTYPE.itemsize]
+    header = header.view(HEADER_DTYPE)
+    if header["magic"][0] != MAGIC:
+        raise SharedMemoryError(path, "not a shared history")
+    size = history_size(int(header["channels"][0]),
+                        int(header["capacity"][0]),
+                        int(header["state_capacity"][0]))
+    return named_mapping(name, size, writable)
+
+
+class SharedCount(object):
+    """The write count of a shared buffer, kept in a field of the header
+    (the buffer's _count_field) so that it is seen by all the processes"""
+    def __get__(self, buffer, owner):
+        if buffer is None:
+            return self
+        return int(buffer._header[buffer._count_field][0])
+
+    def __set__(self, buffer, value):
+        buffer._header[buffer._count_field] = value
+
+
+class SharedRingBuffer(RingBuffer):
+    """A RingBuffer whose data and write count are in shared memory"""
+    _written = SharedCount()
+
+    def __init__(self, header, data, field="written"):
+        self._capacity = data.shape[0] // 2
+        self._channels = data.shape[1]
+        self._data = data
+        self._header = header
+        self._count_field = field
+        self.overruns = 0
+
+
+class SharedRecordBuffer(RecordBuffer):
+    """A RecordBuffer whose records and write count are in shared
+    memory"""
+    _written = SharedCount()
+
+    def __init__(self, header, data, field="state_written",
+                 time_field="time"):
+        self._capacity = data.shape[0] // 2
+        self._data = data
+        self._channels = len(data.dtype.names)
+        self._header = header
+        self._count_field = field
+        self.overruns = 0
+        self.time_field = time_field
+
+
+class SharedHistory(object):
+    """The shared sample and EmoState histories of a user, mapped from
+    PATH (RAW, if given, is the mapping).  Use create() to publish a new
+    one, and attach() to read an existing one"""
+    def __init__(self, path, writable=False, raw=None):
+        self.path = path
+        self.writable = writable
+        self.name = None          # Name of the mapping (Windows)
+        self._directory = None
+        if raw is None:
+            raw = map_history(path, writable)
+        if raw.shape[0] < HEADER_SIZE:
+            raise SharedMemoryError(path, "file too small")
+        header = raw[:HEADER_DTYPE.itemsize].view(HEADER_DTYPE)
+        if header["magic"][0] != MAGIC:
+            raise SharedMemoryError(path, "not a shared history")
+        if header["state_itemsize"][0] != EMOSTATE_DTYPE.itemsize:
+            raise SharedMemoryError(path, "different EmoState format")
+
+        C = int(header["channels"][0])
+        capacity = int(header["capacity"][0])
+        state_capacity = int(header["state_capacity"][0])
+        start = HEADER_SIZE
+        end = start + 2 * capacity * C * 8
+        samples = raw[start:end].view(np.double).reshape(2 * capacity, C)
+        states = raw[end:end + 2 * state_capacity *
+                     EMOSTATE_DTYPE.itemsize].view(EMOSTATE_DTYPE)
+
+        self._raw = raw
+        self.header = header
+        self.samples = SharedRingBuffer(header, samples)
+        self.states = SharedRecordBuffer(header, states)
+
+    @classmethod
+    def create(cls, path, capacity, channels, sampling_rate,
+               state_capacity=4096):
+        """Creates (or replaces) the file at PATH, for CAPACITY samples
+        of the given CHANNELS (EDK channel IDs) and STATE_CAPACITY
+        EmoStates, and returns it mapped for writing"""
+        channels = tuple(channels)
+        if len(channels) > MAX_CHANNELS:
+            raise ValueError("At most %d channels can be shared" %
+                             MAX_CHANNELS)
+        size = history_size(len(channels), capacity, state_capacity)
+
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header["channels"] = len(channels)
+        header["state_itemsize"] = EMOSTATE_DTYPE.itemsize
+        header["capacity"] = capacity
+        header["state_capacity"] = state_capacity
+        header["sampling_rate"] = sampling_rate
+        header["channel_map"][0, :len(channels)] = channels
+
+        # The history is written under a fresh name, and then swapped
+        # in: the processes still attached to an old one keep it until
+        # they detach. The magic string is written last, once the
+        # history is complete
+        name = "%s.%d.%d" % (path, os.getpid(), next(_names))
+        if NAMED_MAPPINGS:
+            raw = named_mapping(name, size, writable=True)
+            raw[:HEADER_DTYPE.itemsize] = header.view(np.uint8)
+            raw[:len(MAGIC)] = np.frombuffer(MAGIC, np.uint8)
+            history = cls(path, writable=True, raw=raw)
+            history.name = name
+            history._directory = d = directory(path, writable=True)
+            d["generation"] += 1
+            d["name"] = name
+            d["magic"] = DIRECTORY_MAGIC
+            d["generation"] += 1
+            return history
+
+        f = open(name, "wb")
+        try:
+            f.write(header.tostring())
+            f.truncate(size)
+            f.seek(0)
+            f.write(MAGIC)
+        finally:
+            f.close()
+        os.rename(name, path)
+        return cls(path, writable=True)
+
+    @property
+    def sampling_rate(self):
+        """The sampling rate of the samples (Hz)"""
+        return float(self.header["sampling_rate"][0])
+
+    @property
+    def channels(self):
+        """The EDK channel IDs of the columns of the samples"""
+        C = int(self.header["channels"][0])
+        return tuple(int(c) for c in self.header["channel_map"][0, :C])
+
+    def close(self, remove=False):
+        """Releases the mapping (it is unmapped once all the views of it
+        are gone), and stops publishing it at PATH if REMOVE is True"""
+        self.samples = self.states = self.header = self._raw = None
+        d, self._directory = self._directory, None
+        if not remove:
+            return
+        if NAMED_MAPPINGS:
+            if d is not None and str(d["name"][0]) == self.name:
+                d["generation"] += 1
+                d["name"] = ""
+                d["generation"] += 1
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def attach(path=None):
+    """Attaches, read-only, to the shared history at PATH (by default,
+    that of user 0)"""
+    if path is None:
+        path = default_path()
+    return SharedHistory(path)
@@ -0,0 +1,384 @@
+## ---------------------------------------------------------------- ##
+## SINKS.py
+## ---------------------------------------------------------------- ##
+## Headless recording. A Recorder passes the data of a user to a set of
+## sinks, each writing one file:
+##
+##     recorder = Recorder(manager, [TSVSink("session.txt"),
+##                                   EmoStateCSVSink("ES.csv")])
+##     with manager.session():
+##         recorder.start()
+##         time.sleep(60)
+##     recorder.stop()
+##
+## Every sink runs in the recorder's worker threads, never in the
+## monitor thread, and nothing is dropped: if a sink falls behind, the
+## queue of events grows (up to a limit) and then the acquisition
+## waits.  Text is formatted a block at a time, and written to the file
+## once every FLUSH_INTERVAL seconds of samples (or of wall-clock time,
+## for the sinks that do not record samples).  EEGFileSink writes the
+## binary format of core.eegfile instead, one block every FLUSH_INTERVAL
+## seconds of samples.
+##
+## With BACKGROUND set, the files are written by a BackgroundWriter, so
+## that a slow disk stalls its thread rather than the sinks.  With
+## SYNC_INTERVAL set, what was written is synced to disk (os.fsync) at
+## most once every SYNC_INTERVAL seconds, so that a crash loses at most
+## that much of the recording (see eegfile.recover_eeg_file).
+## ---------------------------------------------------------------- ##
+
+from threading import Lock
+import time
+import numpy as np
+import ccdl
+import dispatch
+import variables
+from alignment import StreamAligner
+from eegfile import EEGFileWriter
+from writer import BackgroundWriter, sync_file
+from replay import ES_COLUMNS
+
+__all__ = ["Recorder", "Sink", "TSVSink", "EEGCSVSink", "EmoStateCSVSink",
+           "EEGFileSink"]
+
+# The EmoState fields written by TSVSink, and their column labels (the
+# format of gui.recording.TimedSessionRecorder)
+TSV_EMOSTATE_FIELDS = ("blink", "left_wink", "right_wink",
+                       "eyes_open", "left_eyelid", "right_eyelid")
+TSV_EMOSTATE_LABELS = ("Blink", "LeftWink", "RightWink",
+                       "EyesOpen", "LeftEyeLid", "RightEyelid")
+
+# The expressions of the Expressiv columns of the EmoState logs
+ES_CSV_EXPRESSIONS = (variables.EXP_EYEBROW, variables.EXP_FURROW,
+                      variables.EXP_SMILE, variables.EXP_CLENCH,
+                      variables.EXP_SMIRK_LEFT, variables.EXP_SMIRK_RIGHT,
+                      variables.EXP_LAUGH)
+
+
+class Sink(object):
+    """Base class of the sinks. Subclasses list the events they handle
+    in EVENTS, and implement the corresponding methods (write_samples,
+    write_quality, write_emostate), which format text and pass it to
+    write(). If BACKGROUND is True, the file is written from its own
+    thread, with up to MAXSIZE writes waiting. If SYNC_INTERVAL is
+    given, the file is synced to disk at most once every SYNC_INTERVAL
+    seconds"""
+    events = ()
+    mode = "w"
+
+    def __init__(self, path, flush_interval=1.0, background=False,
+                 maxsize=256, sync_interval=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.background = background
+        self.maxsize = maxsize
+        self.sync_interval = sync_interval
+        self.file = None
+        self.background_writer = None
+        self.samples = 0             # Samples written
+        self.syncs = 0               # Durability points
+        self._lock = Lock()
+        self._pending = []
+        self._pending_samples = 0
+        self._flushed = self._synced = time.time()
+
+    def open(self, manager, user=None):
+        """Opens the file, for the data of USER (by default, of the
+        primary user) of MANAGER"""
+        self.manager = manager
+        self.user = user
+        acq = manager.get_user(user)
+        if acq is not None:
+            self.sampling_rate = acq.sampling_rate
+        else:
+            self.sampling_rate = manager.sampling_rate
+        self.flush_size = int(self.flush_interval * self.sampling_rate)
+        self.file = self.open_file()
+        self.write_header()
+
+    def open_file(self):
+        """Returns the file (or the BackgroundWriter) to write to"""
+        f = open(self.path, self.mode)
+        if self.background:
+            f = BackgroundWriter(f, self.maxsize, self.flush_interval,
+                                 self.sync_interval)
+            self.background_writer = f
+        return f
+
+    def write_header(self):
+        """Writes the first lines of the file"""
+        pass
+
+    def write(self, text, samples=0):
+        """Queues TEXT (which holds SAMPLES samples) for writing. The
+        file is written when FLUSH_INTERVAL seconds of samples are
+        pending, or FLUSH_INTERVAL seconds after the last write"""
+        with self._lock:
+            if self.file is None:
+                return
+            self._pending.append(text)
+            self._pending_samples += samples
+            self.samples += samples
+            if self._pending_samples >= self.flush_size or \
+                    time.time() - self._flushed >= self.flush_interval:
+                self._flush()
+
+    def _flush(self):
+        self.file.write("".join(self._pending))
+        del self._pending[:]
+        self._pending_samples = 0
+        self._flushed = time.time()
+        self._sync()
+
+    def _sync(self, force=False):
+        """Syncs the file to disk, if SYNC_INTERVAL seconds have passed
+        since the last time (or if FORCE is set). A BackgroundWriter
+        syncs on its own"""
+        if self.sync_interval is None or self.background_writer is not None:
+            return
+        now = time.time()
+        if force or now - self._synced >= self.sync_interval:
+            sync_file(self.file)
+            self._synced = now
+            self.syncs += 1
+
+    def flush(self):
+        """Writes all the pending text"""
+        with self._lock:
+            if self.file is not None:
+                self._flush()
+                self.file.flush()
+
+    def close(self):
+        """Writes the pending text and closes the file"""
+        with self._lock:
+            if self.file is not None:
+                self._flush()
+                self._sync(force=True)
+                self.file.close()
+                self.file = None
+
+    def stats(self):
+        """Returns a dictionary with the counters of the sink (and of its
+        writer, when writing in the background)"""
+        s = {"path" : self.path, "samples" : self.samples,
+             "syncs" : self.syncs}
+        if self.background_writer is not None:
+            s.update(self.background_writer.stats())
+        return s
+
+
+class TSVSink(Sink):
+    """Writes a tab-separated row for every sample: the channels, the
+    contact quality of every sensor and the EmoState in effect (the
+    format of the GUI recorder).  The quality of a sensor is -1
+    (variables.EEG_CQ_UNKNOWN) until the first EmoState reports it,
+    where older recordings wrote 0"""
+    events = (ccdl.SAMPLING_EVENT,)
+
+    def open(self, manager, user=None):
+        self.aligner = StreamAligner(manager, user)
+        self.channels = manager.channels
+        self.row = "\t".join(["%f"] * len(self.channels) +
+                             ["%d"] * len(variables.COMPLETE_SENSORS) +
+                             ["%d"] * 4 + ["%0.3f"] * 2) + "\n"
+        Sink.open(self, manager, user)
+
+    def write_header(self):
+        labels = ([variables.CHANNEL_NAMES[c] for c in self.channels] +
+                  ["%s_Q" % variables.SENSOR_NAMES[s]
+                   for s in variables.COMPLETE_SENSORS] +
+                  list(TSV_EMOSTATE_LABELS))
+        self.file.write("\t".join(labels) + "\n")
+
+    def write_samples(self, data):
+        quality, states = self.aligner.align(data)
+        columns = [data, quality[:, list(variables.COMPLETE_SENSORS)]]
+        columns += [states[field][:, np.newaxis]
+                    for field in TSV_EMOSTATE_FIELDS]
+        rows = np.hstack(columns).tolist()
+        row = self.row
+        self.write("".join([row % tuple(r) for r in rows]), len(rows))
+
+
+class EEGCSVSink(Sink):
+    """Writes the samples in the format of the EDK example logger
+    (EEGLoger.py): a header with the list of channel names, and the
+    values of every sample separated by ' , '"""
+    events = (ccdl.SAMPLING_EVENT,)
+
+    def open(self, manager, user=None):
+        self.channels = manager.channels
+        self.row = "%s , " * len(self.channels) + "\n\n"
+        Sink.open(self, manager, user)
+
+    def write_header(self):
+        names = [variables.CHANNEL_NAMES[c].upper() for c in self.channels]
+        self.file.write("%s\n" % names)
+
+    def write_samples(self, data):
+        row = self.row
+        rows = data.tolist()
+        self.write("".join([row % tuple(r) for r in rows]), len(rows))
+
+
+class EmoStateCSVSink(Sink):
+    """Writes the EmoStates in the format of the EDK example logger
+    (emoStateLoger.py)"""
+    events = (ccdl.EMOSTATE_EVENT,)
+
+    def write_header(self):
+        self.file.write("%s\n" % list(ES_COLUMNS))
+
+    def write_emostate(self, state):
+        expressions = dict.fromkeys(ES_CSV_EXPRESSIONS, 0)
+        expressions[int(state["upper_face_action"])] = \
+            float(state["upper_face_power"])
+        expressions[int(state["lower_face_action"])] = \
+            float(state["lower_face_power"])
+
+        values = [float(state["time"]), int(state["user_id"]),
+                  int(state["wireless_signal"])]
+        values += [int(state[f]) for f in ("blink", "left_wink", "right_wink",
+                                           "looking_left", "looking_right")]
+        values += [expressions[e] for e in ES_CSV_EXPRESSIONS]
+        values += [float(state[f]) for f in ("excitement_short",
+                                             "excitement_long",
+                                             "engagement")]
+        values += [int(state["cognitiv_action"]),
+                   float(state["cognitiv_power"])]
+        self.write(" , ".join([str(v) for v in values]) + "\n\n\n")
+
+
+class EEGFileSink(Sink):
+    """Writes the samples, with the contact quality and the EmoState in
+    effect at every sample (the columns of TSVSink), in the binary
+    format of core.eegfile. Samples are stored as DTYPE, losslessly
+    encoded on the grid of every channel (QUANTIZATION, see
+    eegfile.EEGFileWriter), and every block is compressed with
+    COMPRESSION (see eegfile.COMPRESSIONS)"""
+    events = (ccdl.SAMPLING_EVENT,)
+    mode = "wb"
+
+    def __init__(self, path, flush_interval=1.0, dtype=np.double,
+                 compression="zlib", quantization="auto", background=False,
+                 maxsize=256, sync_interval=None):
+        Sink.__init__(self, path, flush_interval, background, maxsize,
+                      sync_interval)
+        self.dtype = dtype
+        self.compression = compression
+        self.quantization = quantization
+        self.writer = None
+
+    def open(self, manager, user=None):
+        self.manager = manager
+        self.user = user
+        self.aligner = StreamAligner(manager, user)
+        acq = manager.get_user(user)
+        if acq is not None:
+            self.sampling_rate = acq.sampling_rate
+        else:
+            self.sampling_rate = manager.sampling_rate
+        self.flush_size = max(int(self.flush_interval * self.sampling_rate),
+                              1)
+        self.file = self.open_file()
+        self.writer = EEGFileWriter(self.file, manager.channels,
+                                    self.sampling_rate, self.dtype,
+                                    variables.COMPLETE_SENSORS,
+                                    TSV_EMOSTATE_FIELDS, self.flush_size,
+                                    compression=self.compression,
+                                    quantization=self.quantization)
+
+    def write_samples(self, data):
+        quality, states = self.aligner.align(data)
+        quality = quality[:, list(variables.COMPLETE_SENSORS)]
+        with self._lock:
+            if self.writer is None:
+                return
+            blocks = self.writer.blocks
+            self.writer.write(data, quality, states)
+            self.samples += data.shape[0]
+            if self.writer.blocks != blocks:
+                self._sync()
+
+    def flush(self):
+        with self._lock:
+            if self.writer is not None:
+                self.writer.flush()
+                self._sync(force=True)
+
+    def close(self):
+        # The blocks are synced before the index (which can be rebuilt
+        # from them) is written
+        with self._lock:
+            if self.writer is not None:
+                self.writer.flush()
+                self._sync(force=True)
+                self.writer.close()
+                self.writer = self.file = None
+
+
+class Recorder(object):
+    """Records the data of a USER (by default, the primary user) of a
+    manager with the given sinks. Every event handled by the sinks has
+    its own worker thread, with a queue of at most MAXSIZE events.
+    With several headsets, every user needs its own recorder (and
+    files)"""
+    HANDLERS = {ccdl.SAMPLING_EVENT : "write_samples",
+                ccdl.SENSOR_QUALITY_EVENT : "write_quality",
+                ccdl.EMOSTATE_EVENT : "write_emostate"}
+
+    def __init__(self, manager, sinks, user=None, maxsize=256):
+        self.manager = manager
+        self.sinks = list(sinks)
+        self.user = user
+        self.maxsize = maxsize
+        self.recording = False
+        self._listeners = []
+
+    def start(self):
+        """Opens the sinks and starts recording"""
+        if self.recording:
+            return
+        for sink in self.sinks:
+            sink.open(self.manager, self.user)
+            for event_id in sink.events:
+                func = getattr(sink, self.HANDLERS[event_id])
+                self.manager.add_listener(event_id, func,
+                                          policy=dispatch.BLOCK,
+                                          maxsize=self.maxsize,
+                                          user=self.listener_user)
+                self._listeners.append((event_id, func))
+        self.recording = True
+
+    @property
+    def listener_user(self):
+        """The user of the recorder's listeners"""
+        if self.user is None:
+            return ccdl.PRIMARY_USER
+        return self.user
+
+    def stop(self):
+        """Stops recording, once the queued events have been written,
+        and closes the sinks"""
+        if not self.recording:
+            return
+        self.recording = False
+        while self._listeners:
+            event_id, func = self._listeners.pop()
+            self.manager.remove_listener(event_id, func, wait=True)
+        for sink in self.sinks:
+            sink.close()
+
+    @property
+    def samples(self):
+        """The number of samples recorded (by the first sink that
+        records samples)"""
+        for sink in self.sinks:
+            if ccdl.SAMPLING_EVENT in sink.events:
+                return sink.samples
+        return 0
+
+    def stats(self):
+        """Returns a list with the counters of every sink"""
+        return [sink.stats() for sink in self.sinks]
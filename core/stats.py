@@ -0,0 +1,152 @@
+## ---------------------------------------------------------------- ##
+## STATS.py
+## ---------------------------------------------------------------- ##
+## Instrumentation of the acquisition pipeline. The manager times its
+## stages (engine events, EmoState reads, data extraction, listeners)
+## and records the timings in fixed-size histograms:
+##
+##     manager.enable_stats(dump_path="stats.log", dump_interval=10)
+##     ...
+##     print manager.stats()["histograms"]["get_next_event"]["p99"]
+##
+## When the instrumentation is disabled, every stage only pays for the
+## test of a boolean attribute.
+## ---------------------------------------------------------------- ##
+
+from bisect import bisect_right
+from threading import Thread, Event
+from timeit import default_timer as clock
+import json
+import time
+
+__all__ = ["Histogram", "Stats", "StatsDumper", "clock",
+           "TIME_EDGES", "SIZE_EDGES"]
+
+## Bin edges for durations (1 us to 10 s, four bins per decade) and
+## for sizes (powers of two up to 4096)
+
+TIME_EDGES = tuple(10.0 ** (e / 4.0) for e in range(-24, 5))
+SIZE_EDGES = (0,) + tuple(2 ** i for i in range(13))
+
+PERCENTILES = (50, 90, 99)
+
+
+class Histogram(object):
+    """A histogram with fixed bins. Bin i counts the values in
+    [edges[i-1], edges[i]); the first and the last bin count the values
+    below and above all the edges"""
+    def __init__(self, edges=TIME_EDGES):
+        self.edges = tuple(edges)
+        self.reset()
+
+    def reset(self):
+        """Forgets all the values"""
+        self.counts = [0] * (len(self.edges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        """Adds a value"""
+        self.counts[bisect_right(self.edges, value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def percentile(self, p):
+        """Returns an upper bound of the P-th percentile (the upper edge
+        of the bin that contains it), or None if there are no values"""
+        if self.count == 0:
+            return None
+        target = p / 100.0 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n > 0 and seen >= target:
+                if i < len(self.edges):
+                    return min(self.edges[i], self.max)
+                return self.max
+        return self.max
+
+    def snapshot(self):
+        """Returns a dictionary with the counts and a summary"""
+        s = {"count" : self.count,
+             "mean" : self.total / self.count if self.count else None,
+             "min" : self.min, "max" : self.max,
+             "edges" : list(self.edges), "counts" : list(self.counts)}
+        for p in PERCENTILES:
+            s["p%d" % p] = self.percentile(p)
+        return s
+
+
+class Stats(object):
+    """A set of named histograms and counters. The producers are
+    expected to check 'enabled' before measuring anything"""
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def record(self, name, value, edges=TIME_EDGES):
+        """Adds VALUE to the histogram NAME (created with the given
+        EDGES the first time)"""
+        h = self.histograms.get(name)
+        if h is None:
+            h = self.histograms[name] = Histogram(edges)
+        h.add(value)
+
+    def count(self, name, n=1):
+        """Increases the counter NAME by N"""
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        """Forgets all the values"""
+        self.histograms.clear()
+        self.counters.clear()
+        self.started = time.time()
+
+    def snapshot(self):
+        """Returns a dictionary with all the histograms and counters"""
+        return {"time" : time.time(), "started" : self.started,
+                "enabled" : self.enabled,
+                "histograms" : dict((name, h.snapshot()) for name, h
+                                    in self.histograms.items()),
+                "counters" : dict(self.counters)}
+
+
+class StatsDumper(object):
+    """Appends SOURCE() (a dictionary) to a file, as a line of JSON,
+    every INTERVAL seconds"""
+    def __init__(self, source, path, interval=10.0):
+        self.source = source
+        self.path = path
+        self.interval = interval
+        self._stopped = Event()
+        self._thread = Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def dump(self):
+        """Appends a snapshot to the file"""
+        f = open(self.path, "a")
+        try:
+            f.write(json.dumps(self.source(), sort_keys=True))
+            f.write("\n")
+        finally:
+            f.close()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        """Stops dumping (after writing a last snapshot)"""
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._thread.join()
+            self.dump()
@@ -0,0 +1,129 @@
+## ---------------------------------------------------------------- ##
+## STREAMING.py
+## ---------------------------------------------------------------- ##
+## A pull-based interface to the manager's events.  Instead of
+## registering callbacks, a consumer iterates over a stream:
+##
+##     with manager.session():
+##         for block in manager.stream(channels=("O1", "O2")):
+##             ...
+##
+## The stream is fed by the monitor thread without ever blocking it:
+## events are buffered in a bounded queue, and the oldest ones are
+## dropped when the consumer falls behind.
+## ---------------------------------------------------------------- ##
+
+import Queue
+import numpy as np
+import ccdl
+import variables
+
+__all__ = ["EventStream", "channel_columns", "select_channels"]
+
+# How often (in seconds) a blocked consumer checks whether the stream
+# has been closed. Waiting in short steps also keeps the consumer
+# responsive to KeyboardInterrupt.
+POLL_INTERVAL = 0.1
+
+
+def channel_columns(channels, available=variables.CHANNELS):
+    """Returns the column indices, in a block of AVAILABLE channels, of
+    the given CHANNELS (specified by ID or by name, as in
+    variables.CHANNEL_NAMES)"""
+    ids = dict((name.upper(), id)
+               for id, name in variables.CHANNEL_NAMES.items())
+    columns = []
+    for c in channels:
+        if isinstance(c, basestring):
+            c = ids[c.upper()]
+        columns.append(list(available).index(c))
+    return tuple(columns)
+
+
+def select_channels(block, columns, selected=None):
+    """Returns the given COLUMNS (a tuple) of BLOCK: a view if they are
+    consecutive, or else a copy.  SELECTED is a dictionary that caches
+    the selections made from the same block, so that every distinct
+    selection is made only once.  Anything but arrays is returned as
+    it is"""
+    if not isinstance(block, np.ndarray):
+        return block
+    if selected is not None and columns in selected:
+        return selected[columns]
+
+    n = len(columns)
+    if n and columns == tuple(range(columns[0], columns[0] + n)):
+        selection = block[:, columns[0]:columns[0] + n]
+    else:
+        selection = block.take(columns, axis=1)
+    if selected is not None:
+        selected[columns] = selection
+    return selection
+
+
+class EventStream(object):
+    """An iterator over the events of a manager"""
+    def __init__(self, manager, event_id=ccdl.SAMPLING_EVENT,
+                 channels=None, user=None, maxsize=32):
+        self.manager = manager
+        self.event_id = event_id
+        self.user = user
+        self.columns = None
+        if channels is not None:
+            self.columns = channel_columns(channels, manager.channels)
+
+        self.dropped = 0     # Events discarded because the queue was full
+        self.closed = False
+        self._queue = Queue.Queue(maxsize)
+        manager.add_listener(event_id, self.put, user=user,
+                             channels=channels)
+
+    def put(self, arg):
+        """Enqueues an event (never blocks the caller)"""
+        if isinstance(arg, np.ndarray) and not arg.flags.owndata:
+            # Views of the manager's buffers must be copied (a selection
+            # of channels may be a copy already, shared with the other
+            # listeners that selected them, but never modified)
+            arg = arg.copy()
+
+        while True:
+            try:
+                self._queue.put_nowait(arg)
+                return
+            except Queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except Queue.Empty:
+                    pass
+
+    def get(self, timeout=None):
+        """Returns the next event. Raises StopIteration if the stream
+        is closed, and Queue.Empty if TIMEOUT seconds pass first"""
+        waited = 0.0
+        while not self.closed:
+            try:
+                return self._queue.get(True, POLL_INTERVAL)
+            except Queue.Empty:
+                waited += POLL_INTERVAL
+                if timeout is not None and waited >= timeout:
+                    raise
+        raise StopIteration
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return self.get()
+
+    def close(self):
+        """Stops receiving events"""
+        if not self.closed:
+            self.closed = True
+            self.manager.remove_listener(self.event_id, self.put)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
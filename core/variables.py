@@ -65,12 +65,50 @@ CHANNEL_NAMES = {ED_COUNTER : "Counter",
                  ED_FUNC_VALUE : "FUNC_VALUE", ED_MARKER : "MARKER",
                  ED_SYNC_SIGNAL : "SYNC_SIGNAL"}
 
+## The packet counter (ED_COUNTER) runs from 0 to 128, then wraps around
+
+COUNTER_MODULUS = 129
+
 ## Wireless signal
 
 EDK_NO_SIGNAL = 0
 EDK_BAD_SIGNAL = 1
 EDK_GOOD_SIGNAL = 2
 
+## Contact quality (EE_EEG_ContactQuality_t). The qualities are indexed
+## by logical input channel (EE_InputChannels_t): the indices of CMS,
+## DRL and AF3...AF4 are the same as their ED_* IDs; FP1 (2) and FP2
+## (17) mirror AF3 and AF4.
+
+EEG_CQ_UNKNOWN = -1     # Not part of the EDK enum: no EmoState read yet
+EEG_CQ_NO_SIGNAL = 0
+EEG_CQ_VERY_BAD = 1
+EEG_CQ_POOR = 2
+EEG_CQ_FAIR = 3
+EEG_CQ_GOOD = 4
+
+CONTACT_QUALITY_CHANNELS = 18
+
+## Expressiv facial expressions (EE_ExpressivAlgo_t)
+
+EXP_NEUTRAL = 0x0001
+EXP_BLINK = 0x0002
+EXP_WINK_LEFT = 0x0004
+EXP_WINK_RIGHT = 0x0008
+EXP_HORIEYE = 0x0010
+EXP_EYEBROW = 0x0020
+EXP_FURROW = 0x0040
+EXP_SMILE = 0x0080
+EXP_CLENCH = 0x0100
+EXP_LAUGH = 0x0200
+EXP_SMIRK_LEFT = 0x0400
+EXP_SMIRK_RIGHT = 0x0800
+
+## Cognitiv actions (EE_CognitivAction_t; only the neutral one is
+## needed here)
+
+COG_NEUTRAL = 0x0001
+
 ## Hardware events
 
 EE_User_Added = 0x0010 
@@ -0,0 +1,196 @@
+## ---------------------------------------------------------------- ##
+## WRITER.py
+## ---------------------------------------------------------------- ##
+## Background file writing.  A BackgroundWriter wraps a file: write()
+## only queues the data, and a dedicated thread writes it, so that a
+## slow disk (a network drive, an antivirus scan) stalls that thread
+## rather than the listeners and the monitor thread.
+##
+## The queue is bounded: when the writer falls that far behind, write()
+## waits (nothing is ever dropped).  Everything queued when the writer
+## wakes up is written with a single call, and the file is flushed at
+## most once every FLUSH_INTERVAL seconds.
+##
+## With SYNC_INTERVAL set, the writer also makes what it wrote durable
+## (os.fsync, so that it survives a crash of the computer, and not only
+## of the program) at most once every SYNC_INTERVAL seconds, and when it
+## is flushed or closed.  Durability points are taken by the writer's
+## thread, after a batch, so they never delay write().
+## ---------------------------------------------------------------- ##
+
+from threading import Thread, Condition
+import collections
+import os
+import time
+
+__all__ = ["BackgroundWriter", "sync_file"]
+
+
+def sync_file(f):
+    """Flushes F, and asks the system to write it to disk (if it is a
+    real file)"""
+    f.flush()
+    try:
+        fileno = f.fileno()
+    except (AttributeError, IOError, ValueError):
+        return
+    os.fsync(fileno)
+
+
+class BackgroundWriter(object):
+    """Writes to FILE (an open file, or any object with write(), flush()
+    and close()) from a dedicated thread. At most MAXSIZE writes can be
+    waiting. If SYNC_INTERVAL is given, the file is synced to disk at
+    most once every SYNC_INTERVAL seconds"""
+    def __init__(self, file, maxsize=256, flush_interval=1.0,
+                 sync_interval=None):
+        self.file = file
+        self.maxsize = maxsize
+        self.flush_interval = flush_interval
+        self.sync_interval = sync_interval
+        self.error = None          # The exception that stopped the thread
+
+        self._queue = collections.deque()
+        self._condition = Condition()
+        self._running = True
+        self._flush_requests = 0
+        self._flushes = 0
+
+        # Counters
+        self.bytes_queued = 0
+        self.bytes_written = 0
+        self.writes = 0            # Calls to the file's write()
+        self.waits = 0             # Calls to write() that had to wait
+        self.max_pending = 0       # Longest queue seen
+        self.syncs = 0             # Durability points
+        self.synced = None         # Time of the last one
+        self.started = None        # Time of the first write
+
+        self._thread = Thread(target=self.run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def name(self):
+        return getattr(self.file, "name", repr(self.file))
+
+    @property
+    def pending(self):
+        """The number of writes waiting in the queue"""
+        return len(self._queue)
+
+    @property
+    def closed(self):
+        return not self._running
+
+    def write(self, data):
+        """Queues DATA (a string) for writing. Waits if the queue is
+        full"""
+        with self._condition:
+            self._check()
+            if not self._running:
+                raise ValueError("I/O operation on closed file")
+            if len(self._queue) >= self.maxsize:
+                self.waits += 1
+                while len(self._queue) >= self.maxsize and \
+                        self.error is None:
+                    self._condition.wait()
+                self._check()
+            if self.started is None:
+                self.started = time.time()
+            self._queue.append(data)
+            self.bytes_queued += len(data)
+            if len(self._queue) > self.max_pending:
+                self.max_pending = len(self._queue)
+            self._condition.notify_all()
+
+    def _check(self):
+        if self.error is not None:
+            raise IOError("Cannot write to %s: %s" % (self.name, self.error))
+
+    def run(self):
+        """Writes the queued data, until closed"""
+        queue = self._queue
+        flushed = synced = time.time()
+        dirty = False              # Written since the last flush
+        unsynced = False           # Written since the last sync
+        while True:
+            with self._condition:
+                while not queue and self._running and \
+                        self._flushes == self._flush_requests:
+                    self._condition.wait(self.flush_interval)
+                    if time.time() - flushed >= self.flush_interval:
+                        break
+                batch = list(queue)
+                queue.clear()
+                flush = self._flush_requests
+                running = self._running
+                self._condition.notify_all()
+
+            try:
+                if batch:
+                    self.file.write("".join(batch))
+                    self.writes += 1
+                    self.bytes_written += sum([len(b) for b in batch])
+                    dirty = unsynced = True
+                now = time.time()
+                requested = flush != self._flushes or not running
+                if requested or \
+                        (dirty and now - flushed >= self.flush_interval):
+                    self.file.flush()
+                    flushed = now
+                    dirty = False
+                if self.sync_interval is not None and unsynced and \
+                        (requested or now - synced >= self.sync_interval):
+                    sync_file(self.file)
+                    synced = self.synced = now
+                    self.syncs += 1
+                    unsynced = False
+            except Exception as e:
+                with self._condition:
+                    self.error = e
+                    queue.clear()
+                    self._flushes = flush
+                    self._condition.notify_all()
+                return
+
+            with self._condition:
+                self._flushes = flush
+                self._condition.notify_all()
+                if not running and not queue:
+                    return
+
+    def flush(self):
+        """Waits until everything queued so far has been written, and
+        flushes the file (and syncs it, if the writer syncs)"""
+        with self._condition:
+            if not self._running:
+                return
+            self._flush_requests += 1
+            request = self._flush_requests
+            self._condition.notify_all()
+            while self._flushes < request and self.error is None:
+                self._condition.wait()
+            self._check()
+
+    def close(self):
+        """Writes everything queued, and closes the file"""
+        with self._condition:
+            if not self._running:
+                return
+            self._running = False
+            self._condition.notify_all()
+        self._thread.join()
+        self.file.close()
+        self._check()
+
+    def stats(self):
+        """Returns a dictionary with the writer's counters"""
+        elapsed = time.time() - (self.started or time.time())
+        return {"file" : self.name, "pending" : self.pending,
+                "maxsize" : self.maxsize, "max_pending" : self.max_pending,
+                "waits" : self.waits, "writes" : self.writes,
+                "syncs" : self.syncs, "synced" : self.synced,
+                "bytes_written" : self.bytes_written,
+                "bytes_per_second" : self.bytes_written / elapsed
+                if elapsed > 0 else 0.0}
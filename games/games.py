@@ -3,39 +3,52 @@
 import wx
 from core.manager import ManagerWrapper
 
-class Recorder(object, ManagerWrapper):
+class Recorder(ManagerWrapper):
     """A simple object that just records the data"""
-    def __init__(self, filename):
+    def __init__(self, filename, manager=None):
+        ManagerWrapper.__init__(self, manager)
         self._filename = filename
         self._file_opened = False
+        self._reader = None
     
     @property
     def filename(self):
         return self._filename 
         
     @filename.setter
-    def filename(self, name)
+    def filename(self, name):
         self._filename = name
     
     def init_file(self):
-        """Inits the file sink"""
-        self._file = File(self.filename, "w")
+        """Inits the file sink, and starts reading the samples from the
+        manager's history"""
+        self._file = open(self.filename, "w")
+        self._reader = self.manager.sensor_history.reader()
         self._file_opened = True
     
-    def receive_sensor_data(self, data):
-        """Saves sensory data on a file"""
-        for i in data:
-            self.file.write("%03f" % i)
+    def receive_sensor_data(self):
+        """Saves the samples that arrived since the last call on a file
+        (read from the manager's history), one tab-separated row per
+        sample.  Does nothing until init_file() is called"""
+        if self._reader is None:
+            return
+        if self._reader.buffer is not self.manager.sensor_history:
+            self._reader = self.manager.sensor_history.reader()
+        data = self._reader.read()
+        if len(data):
+            row = "\t".join(["%f"] * data.shape[1]) + "\n"
+            self._file.write("".join([row % tuple(r)
+                                      for r in data.tolist()]))
         
 
-class Game(object, ManagerWrapper):
+class Game(ManagerWrapper):
     """A Game is an object that contains and uses analyzers to
     update a simulated world that is visualized on a panel
     """
-    def __init__(self, manager=manager, analyzers=[]):
+    def __init__(self, manager=None, analyzers=()):
         """Initializes a game"""
         ManagerWrapper.__init__(self, manager)
-        self._analyzers = analyzers
+        self._analyzers = list(analyzers)
 
 
 class ThetaAlphaVisualizer(wx.Panel):
@@ -4,6 +4,7 @@
 
 import wx
 import core.ccdl as ccdl
+import core.dispatch as dispatch
 import copy
 import traceback
 import core.variables as variables
@@ -187,14 +188,17 @@ class ConnectPanel(ManagerPanel):
 class UserPanel(ManagerPanel):
     """A Class that visualizes the user and its sensors"""
     
-    def __init__(self, parent, manager):
+    def __init__(self, parent, manager, user=None):
+        """Inits the panel. If USER is given, the panel shows the sensors
+        of that user (headset)"""
+        self.user = user
         ManagerPanel.__init__(self, parent, manager,
                               manager_state=True,
                               monitored_events=(ccdl.HEADSET_FOUND_EVENT,))
-        self.manager.add_listener(ccdl.SENSOR_QUALITY_EVENT, self.update_quality)
+        # Only the latest quality values matter for the display
+        self.manager.add_listener(ccdl.SENSOR_QUALITY_EVENT, self.update_quality,
+                                  policy=dispatch.LATEST, user=user)
         #self.Bind(wx.EVT_ERASE_BACKGROUND, self.on_erase_background)
-        self._sensor_quality = dict(zip(variables.COMPLETE_SENSORS,
-                                    [0] * len(variables.COMPLETE_SENSORS)))
 
         
     def create_objects(self):
@@ -258,29 +262,16 @@ class UserPanel(ManagerPanel):
     @property
     def sensor_quality(self):
         """An array containing the recording quality of each sensor"""
-        return self._sensor_quality
-    
-    @sensor_quality.setter
-    def sensor_quality(self, data):
-        """Changes the sensor quality array values"""
-        if data != self._sensor_quality:
-            self._sensor_quality = data
-            
-            for sensor in self.sensors:
-                sensor.quality = data[sensor[sensor.sensor_id]]
-            
+        return self.manager.get_sensor_quality(self.user)
               
-    def update_quality(self, data):
-        if data != self._sensor_quality:
-            self._sensor_quality = data
-            
-            for sensor in self.sensors:
-                sensor.quality = data[sensor.sensor_id]
-            
-            for sensor in variables.COMPLETE_SENSORS:
-                name = variables.SENSOR_NAMES[sensor]
-
-        self.sensory_quality = data
+    def update_quality(self, changes):
+        """Updates the sensors whose quality has changed. Since older
+        events can be dropped in favour of the latest one, the current
+        values are read from the manager (only the sensors whose value
+        differs from the displayed one are repainted)"""
+        quality = self.sensor_quality
+        for sensor in self.sensors:
+            sensor.quality = int(quality[sensor.sensor_id])
 
     
     def do_layout(self):
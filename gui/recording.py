@@ -11,7 +11,8 @@
 
 from .gui import ManagerPanel
 import core.ccdl as ccdl
-import core.variables as var
+import core.dispatch as dispatch
+from core.sinks import TSVSink, EEGFileSink
 import os
 import time
 import threading 
@@ -29,20 +30,31 @@ class TimedSessionRecorder(ManagerPanel):
     SET_FILENAME = 2001      # ID of the Filename button
     START_RECORDING = 2002   # ID of the Recording button
     ABORT_RECORDING = 2003   # ID of the abort recording button
-    EMOSTATE_FIELDS = ("Blink", "LeftWink", "RightWink",
-                       "EyesOpen", "LeftEyeLid","RightEyelid")
     
-    def __init__(self, parent, manager):
-        """Inits a new Timed Session Recoding Panel"""
+    def __init__(self, parent, manager, user=None, flush_interval=1.0,
+                 sync_interval=5.0):
+        """Inits a new Timed Session Recoding Panel. The data of USER
+        (by default, the primary user) is recorded. The file is
+        written by a background thread, flushed every FLUSH_INTERVAL
+        seconds and synced to disk every SYNC_INTERVAL seconds (a crash
+        loses at most that much; see NeuroRecover.py)"""
+        self.user = user
+        self.flush_interval = flush_interval
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
         ManagerPanel.__init__(self, parent, manager,
                               manager_state=True,
                               monitored_events=(ccdl.HEADSET_FOUND_EVENT,))
+        # Recording must be lossless: the listeners run on their own
+        # threads, and the file is written by yet another one (so disk
+        # writes do not delay the monitor), but they block rather than
+        # dropping data when they fall behind.
         self.manager.add_listener(ccdl.SAMPLING_EVENT,
-                                  self.save_sensor_data)
-        self.manager.add_listener(ccdl.SENSOR_QUALITY_EVENT,
-                                  self.save_sensor_quality_data)
-        self.manager.add_listener(ccdl.EMOSTATE_EVENT,
-                                  self.save_emostate_data)
+                                  self.save_sensor_data,
+                                  policy=dispatch.BLOCK,
+                                  user=ccdl.PRIMARY_USER if user is None
+                                  else user)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
         
     def refresh(self, param):
         """Updates the interface when the user is updated"""
@@ -53,14 +65,11 @@ class TimedSessionRecorder(ManagerPanel):
         """Creates the objects"""
         self.file_open = False
         self._filename = None
-        self.file = None
+        self.sink = None
         self.session_duration = 300
         self._time_left = self.session_duration
         self.samples_collected = 0
         self.recording = False
-        self.sensor_quality = dict(zip(var.COMPLETE_SENSORS,
-                                   [0] * len(var.COMPLETE_SENSORS)))
-        self.emostate_data = np.array((0, 6))    
         
         self._filename_lbl = wx.StaticText(self, wx.ID_ANY, "Data file:")
         
@@ -87,6 +96,9 @@ class TimedSessionRecorder(ManagerPanel):
         
         self._timeleft_lbl.SetFont( wx.Font(40, family=wx.FONTFAMILY_DEFAULT,
                                             style=wx.FONTSTYLE_NORMAL, weight=wx.BOLD))
+        
+        self._status_lbl = wx.StaticText(self, wx.ID_ANY, "", size=(200, 25),
+                                         style=wx.ALIGN_LEFT)
         self._timer_spn.SetRange(1, 100)
         self._timer_spn.SetValue(5)
         
@@ -124,6 +136,7 @@ class TimedSessionRecorder(ManagerPanel):
         box2 = wx.BoxSizer(wx.VERTICAL)
         box2.Add(parambox, 1, wx.ALL | wx.EXPAND, 10)
         box2.Add(row3, 1, wx.ALL|wx.EXPAND, 10)
+        box2.Add(self._status_lbl, 0, wx.ALL|wx.EXPAND, 10)
     
         self.SetSizerAndFit(box2)
         self.update_interface()
@@ -196,9 +209,14 @@ class TimedSessionRecorder(ManagerPanel):
         while self.recording and self.time_left > 0:
             time.sleep(1)   # Sleeps one second
             self.time_left -= 1
+            self.update_status()
 
-        # Stops recording
-        self.recording = False
+        # Stops recording, and waits until everything that was queued
+        # has been written (the sink is closed)
+        with self._lock:
+            self.recording = False
+        self.sink.close()
+        self.update_status()
 
         # When the loop ends, warn the user
         # that session has terminated
@@ -215,7 +233,6 @@ class TimedSessionRecorder(ManagerPanel):
         # blocks recording, and resets the samples
         
         self.time_left = self.session_duration
-        self.file.close()
         self.file_open = False
         self.filename = None
         self.samples_collected = 0
@@ -270,6 +287,17 @@ class TimedSessionRecorder(ManagerPanel):
         """Aborts a recording session by setting the recording flag to false"""
         if self.recording:
             self.recording = False
+
+    def on_destroy(self, event):
+        """Closes the file when the panel is destroyed (e.g., when the
+        application is closed while recording)"""
+        if event.GetEventObject() is self:
+            with self._lock:
+                self.recording = False
+                self.file_open = False
+            if self.sink is not None:
+                self.sink.close()
+        event.Skip()
             
     
     @property
@@ -320,16 +348,20 @@ class TimedSessionRecorder(ManagerPanel):
         self._timeleft_lbl.SetLabel( self.sec2str(self._time_left) )
         
     def init_file(self, name):
-        """Inits the file sink"""
-        self.file = file(name, "w")
+        """Inits the file sink: the binary format for *.eeg files, and
+        tab-separated text otherwise. Every sample is written with the
+        contact quality and the EmoState in effect at its time stamp"""
+        if self.sink is not None:
+            self.sink.close()
+        if name.lower().endswith(".eeg"):
+            sink = EEGFileSink(name, self.flush_interval, background=True,
+                               sync_interval=self.sync_interval)
+        else:
+            sink = TSVSink(name, self.flush_interval, background=True,
+                           sync_interval=self.sync_interval)
+        sink.open(self.manager, self.user)
+        self.sink = sink
         self.file_open = True
-        for channel in var.CHANNELS:
-            self.file.write( "%s\t" % var.CHANNEL_NAMES[channel] )
-        for sensor in var.COMPLETE_SENSORS:
-            self.file.write( "%s_Q\t" % var.SENSOR_NAMES[sensor] )
-        for field in self.EMOSTATE_FIELDS[:-1]:
-            self.file.write( "%s\t" % field)
-        self.file.write( "%s\n" % self.EMOSTATE_FIELDS[-1] )
         
     
     def save_sensor_data(self, data):
@@ -337,30 +369,16 @@ class TimedSessionRecorder(ManagerPanel):
         Saves sensory data on a file
         @param data A NumPy SxC array of S samples and C channels
         """
-        if self.file_open and self.recording:
-            n_samples, n_channels = data.shape
-            for s in xrange(n_samples):
-                for c in xrange(n_channels):
-                    self.file.write("%f\t" % data[s, c])
-                for sensor in var.COMPLETE_SENSORS:
-                    self.file.write("%d\t" % self.sensor_quality[sensor])
-                for field in self.EMOSTATE_FIELDS[0:4]:
-                    self.file.write("%d\t" % self.emostate_data[field])
-                for field in self.EMOSTATE_FIELDS[4:-1]:
-                    self.file.write("%0.3f\t" % self.emostate_data[field].value)
-                self.file.write("%0.3f\n" % self.emostate_data[self.EMOSTATE_FIELDS[-1]].value)
-            self.samples_collected += n_samples
-        
-    def save_sensor_quality_data(self, qdata):
-        """
-        Saves sensor quality data on an inner dictionary
-        (the data will be saved by the 'save_sensor_data' loop)
-        @param  qdata  the sensor quality data dictionary
-        """
-        if self.recording:
-            self.sensor_quality = qdata
+        with self._lock:
+            if self.file_open and self.recording:
+                self.sink.write_samples(data)
+                self.samples_collected += data.shape[0]
     
-    def save_emostate_data(self, edata):
-        """Saves emostate data"""
-        if self.recording:
-            self.emostate_data = edata
\ No newline at end of file
+    def update_status(self):
+        """Shows how much is waiting to be written, and how fast the
+        file is being written"""
+        if self.sink is not None:
+            s = self.sink.stats()
+            self._status_lbl.SetLabel("Queued: %d/%d   Writing: %.1f kB/s" %
+                                      (s.get("pending", 0), s.get("maxsize", 0),
+                                       s.get("bytes_per_second", 0) / 1024.0))
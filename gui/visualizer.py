@@ -7,6 +7,7 @@ import scipy as sp
 import scipy.signal as sig
 import core.ccdl as ccdl
 import core.variables 
+from core.streaming import channel_columns
 import gui
 import threading
 import time
@@ -19,9 +20,6 @@ class SingleChannelVisualizer( gui.ManagerPanel ):
         self.overlap = 0.5    # Overlap between moving windows in periodogram
         self.sampling = 128   # Internal sampling rate (fixed, for now)
         
-        self.sensor_data =  np.zeros((0, len(core.variables.CHANNELS)),
-                                      order="C", dtype=np.double)
-        
         self._visualizing = False    # Whether the peakmeter is being updated
         #self.connected = False      # Whether the headset is connected
         self.update = 0.5           # Interval at which the PeakMeter is updated
@@ -29,9 +27,13 @@ class SingleChannelVisualizer( gui.ManagerPanel ):
         gui.ManagerPanel.__init__(self, parent, manager,
                                   manager_state=True,
                                   monitored_events=(ccdl.HEADSET_FOUND_EVENT,))
-        self.manager.add_listener(ccdl.SAMPLING_EVENT, self.save_sensor_data)
         
-        self.channel = 1  # Starts with first real channel
+        # The samples of the selected channel are read from the
+        # manager's history (see subscribe())
+        self.channel = core.variables.SENSORS[0]
+        self.reader = None
+        self._lock = threading.Lock()   # Guards the reader
+        self.subscribe()
         
     @property
     def visualizing(self):
@@ -134,35 +136,44 @@ class SingleChannelVisualizer( gui.ManagerPanel ):
         self.update_interface()
 
 
-    def save_sensor_data(self, data):
+    def subscribe(self):
+        """Reads the selected channel only, from the manager's sample
+        history"""
+        with self._lock:
+            self._subscribe()
+
+    def _subscribe(self):
+        columns = channel_columns((self.channel,), self.manager.channels)
+        self.reader = self.manager.sensor_history.reader(columns=columns)
+    
+    @property
+    def sensor_data(self):
         """
-        Accumulates recorded data into an array. If the array exceeds
-        the specified self.length, only the last (length * sampling)
-        samples are kept.
+        Returns the last (length * sampling) samples recorded of the
+        selected channel, as a view of the manager's history.
         """
-        self.sensor_data = np.vstack( (self.sensor_data, data) )
-        n_samples, n_channels = self.sensor_data.shape
-        max_length = self.length * self.sampling
-        
-        if n_samples > max_length:
-            self.sensor_data = self.sensor_data[n_samples - max_length:,]
+        with self._lock:
+            if self.reader.buffer is not self.manager.sensor_history:
+                # The history was re-allocated (or the user changed)
+                self._subscribe()
+            return self.reader.latest(self.length * self.sampling)[:, 0]
                 
     
     def on_select_channel(self, evt):
         """Updates the selected channel"""
         box_id = self.selector.GetSelection()
-        sensor_id = core.variables.SENSORS[box_id]
-        channel_id = core.variables.CHANNELS.index(sensor_id)
-        self.channel = channel_id
+        self.channel = core.variables.SENSORS[box_id]
+        self.subscribe()
     
     
     def analyze_data(self):
         """Creates the periodogram of a series"""
         sr = self.sampling
-        if self.sensor_data.shape[0] >= sr * self.length:
+        data = self.sensor_data
+        if data.shape[0] >= sr * self.length:
             nperseg = self.window * sr
             noverlap = int(self.overlap * float(sr))
-            freq, density = sig.welch(self.sensor_data[:, self.channel], fs=sr, nperseg = nperseg,
+            freq, density = sig.welch(data, fs=sr, nperseg = nperseg,
                                       noverlap = noverlap, scaling='density')
 
             density = sp.log(density)[1:]